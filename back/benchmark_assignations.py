@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark : assignations créées une par une (ORM) vs en masse (executemany)
+
+Usage :
+    python benchmark_assignations.py                      # SQLite en mémoire
+    python benchmark_assignations.py mysql+pymysql://...  # base de test MySQL (tables créées/vidées)
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.database import Base
+from models import (
+    Utilisateur, Formation, Promotion, Formateur, Etudiant, EspacePedagogique,
+    Travail, Assignation, RoleEnum, TypeTravailEnum, StatutAssignationEnum
+)
+from utils.generators import generer_identifiant_unique
+from utils.assignations_masse import creer_assignations_en_masse
+
+TAILLES = [50, 500, 5000]
+
+
+def preparer_base(url: str, nb_etudiants: int):
+    """Crée une base vierge avec une promotion de nb_etudiants étudiants"""
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    db.add(Formation(id_formation="F_BENCH", nom_formation="Bench", date_debut=date(2024, 9, 1)))
+    db.add(Promotion(id_promotion="P_BENCH", id_formation="F_BENCH", annee_academique="2024-2025",
+                     libelle="Promotion bench", date_debut=date(2024, 9, 1), date_fin=date(2025, 6, 30)))
+    db.add(Utilisateur(identifiant="U_FMT", email="fmt@bench.local", mot_de_passe="x",
+                       nom="Bench", prenom="Formateur", role=RoleEnum.FORMATEUR))
+    db.add(Formateur(id_formateur="FMT_BENCH", identifiant="U_FMT"))
+    db.add(EspacePedagogique(id_espace="ESP_BENCH", id_promotion="P_BENCH", nom_matiere="Bench",
+                             id_formateur="FMT_BENCH"))
+    db.bulk_insert_mappings(Utilisateur, [
+        {"identifiant": f"U_{i}", "email": f"etudiant{i}@bench.local", "mot_de_passe": "x",
+         "nom": f"Nom{i}", "prenom": f"Prenom{i}", "role": RoleEnum.ETUDIANT}
+        for i in range(nb_etudiants)
+    ])
+    db.bulk_insert_mappings(Etudiant, [
+        {"id_etudiant": f"E_{i}", "identifiant": f"U_{i}", "matricule": f"MAT{i:06d}",
+         "id_promotion": "P_BENCH", "date_inscription": date(2024, 9, 1)}
+        for i in range(nb_etudiants)
+    ])
+    db.commit()
+    return engine, db
+
+
+def nouveau_travail(db) -> str:
+    id_travail = generer_identifiant_unique("TRAVAIL") + f"_{time.perf_counter_ns()}"
+    db.add(Travail(id_travail=id_travail, id_espace="ESP_BENCH", titre="Bench", description="Bench",
+                   type_travail=TypeTravailEnum.INDIVIDUEL,
+                   date_echeance=datetime.utcnow() + timedelta(days=7)))
+    db.flush()
+    return id_travail
+
+
+def assigner_orm(db, id_travail: str, ids_etudiants):
+    """Ancienne méthode : un objet ORM et un identifiant par étudiant"""
+    for i, id_etudiant in enumerate(ids_etudiants):
+        db.add(Assignation(
+            id_assignation=f"{generer_identifiant_unique('ASSIGNATION')}_{i}",
+            id_etudiant=id_etudiant,
+            id_travail=id_travail,
+            date_assignment=datetime.utcnow(),
+            statut=StatutAssignationEnum.ASSIGNE
+        ))
+    db.commit()
+
+
+def assigner_masse(db, id_travail: str, ids_etudiants):
+    creer_assignations_en_masse(db, id_travail, ids_etudiants)
+    db.commit()
+
+
+def mesurer(db, methode, ids_etudiants, repetitions: int = 3) -> float:
+    """Meilleur temps (secondes) sur plusieurs répétitions"""
+    meilleur = None
+    for _ in range(repetitions):
+        id_travail = nouveau_travail(db)
+        debut = time.perf_counter()
+        methode(db, id_travail, ids_etudiants)
+        duree = time.perf_counter() - debut
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "sqlite://"
+    print(f"=== Benchmark assignations ({url.split('://')[0]}) ===")
+    print(f"{'étudiants':>10} {'ORM (ms)':>12} {'masse (ms)':>12} {'gain':>8}")
+
+    for taille in TAILLES:
+        engine, db = preparer_base(url, taille)
+        try:
+            ids_etudiants = [f"E_{i}" for i in range(taille)]
+            duree_orm = mesurer(db, assigner_orm, ids_etudiants)
+            duree_masse = mesurer(db, assigner_masse, ids_etudiants)
+            assert db.query(Assignation).count() == taille * 6
+            print(f"{taille:>10} {duree_orm * 1000:>12.1f} {duree_masse * 1000:>12.1f} "
+                  f"{duree_orm / duree_masse:>7.1f}x")
+        finally:
+            db.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark : statistiques du dashboard DE, six COUNT séparés vs compteurs maintenus
+(table statistiques lue par clé primaire)
+
+Usage :
+    python benchmark_dashboard.py                      # SQLite en mémoire, 10k et 100k étudiants
+    python benchmark_dashboard.py mysql+pymysql://...  # base de test MySQL (tables créées/vidées)
+"""
+
+import sys
+import os
+import time
+import asyncio
+import statistics
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, desc, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.database import Base
+from models import (
+    Utilisateur, Formation, Promotion, Formateur, Etudiant,
+    RoleEnum, StatutEtudiantEnum
+)
+from fastapi import Request, Response
+from routes.dashboard import dashboard_de
+from utils.cache_dashboard import cache_dashboard
+from utils.statistiques import reconcilier_statistiques
+
+TAILLES = [10_000, 100_000]
+NB_FORMATEURS = 200
+NB_PROMOTIONS = 20
+
+
+def preparer_base(url: str, nb_etudiants: int):
+    """Crée une base vierge avec nb_etudiants étudiants répartis sur plusieurs promotions"""
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    debut = datetime(2024, 9, 1)
+    db.add(Utilisateur(identifiant="U_DE", email="de@bench.local", mot_de_passe="x",
+                       nom="Bench", prenom="DE", role=RoleEnum.DE))
+    db.add(Formation(id_formation="F_BENCH", nom_formation="Bench", date_debut=date(2020, 9, 1)))
+    db.bulk_insert_mappings(Promotion, [
+        {"id_promotion": f"P_{p}", "id_formation": "F_BENCH", "annee_academique": f"{2020 + p}-{2021 + p}",
+         "libelle": f"Promotion {p}", "date_debut": date(2020 + p, 9, 1), "date_fin": date(2021 + p, 6, 30)}
+        for p in range(NB_PROMOTIONS)
+    ])
+    db.bulk_insert_mappings(Utilisateur, [
+        {"identifiant": f"U_F{i}", "email": f"formateur{i}@bench.local", "mot_de_passe": "x",
+         "nom": f"Nom{i}", "prenom": f"Prenom{i}", "role": RoleEnum.FORMATEUR,
+         "date_creation": debut + timedelta(minutes=i)}
+        for i in range(NB_FORMATEURS)
+    ])
+    db.bulk_insert_mappings(Formateur, [
+        {"id_formateur": f"F_{i}", "identifiant": f"U_F{i}"} for i in range(NB_FORMATEURS)
+    ])
+    statuts = [StatutEtudiantEnum.ACTIF] * 8 + [StatutEtudiantEnum.SUSPENDU, StatutEtudiantEnum.EXCLU]
+    for lot in range(0, nb_etudiants, 10_000):
+        indices = range(lot, min(lot + 10_000, nb_etudiants))
+        db.bulk_insert_mappings(Utilisateur, [
+            {"identifiant": f"U_{i}", "email": f"etudiant{i}@bench.local", "mot_de_passe": "x",
+             "nom": f"Nom{i}", "prenom": f"Prenom{i}", "role": RoleEnum.ETUDIANT,
+             "date_creation": debut + timedelta(seconds=i)}
+            for i in indices
+        ])
+        db.bulk_insert_mappings(Etudiant, [
+            {"id_etudiant": f"E_{i}", "identifiant": f"U_{i}", "matricule": f"MAT{i:07d}",
+             "id_promotion": f"P_{i % NB_PROMOTIONS}", "date_inscription": date(2024, 9, 1),
+             "statut": statuts[i % len(statuts)]}
+            for i in indices
+        ])
+    db.commit()
+    return engine, db
+
+
+def statistiques_ancien(db) -> dict:
+    """Ancienne méthode : un COUNT par compteur et des objets ORM complets"""
+    statistiques = {
+        "total_formateurs": db.query(Formateur).count(),
+        "total_etudiants": db.query(Etudiant).count(),
+        "total_promotions": db.query(Promotion).count(),
+        "total_formations": db.query(Formation).count(),
+        "etudiants_actifs": db.query(Etudiant).filter(Etudiant.statut == StatutEtudiantEnum.ACTIF).count(),
+        "etudiants_suspendus": db.query(Etudiant).filter(Etudiant.statut == StatutEtudiantEnum.SUSPENDU).count()
+    }
+    db.query(Promotion).order_by(desc(Promotion.date_debut)).limit(5).all()
+    db.query(Utilisateur).filter(
+        Utilisateur.role.in_([RoleEnum.FORMATEUR, RoleEnum.ETUDIANT])
+    ).order_by(desc(Utilisateur.date_creation)).limit(10).all()
+    return statistiques
+
+
+async def appeler_sans_cache(db, de) -> dict:
+    """Dashboard DE calculé (cache mémoire vidé, sans en-tête If-None-Match)"""
+    cache_dashboard.vider()
+    return await dashboard_de(Request({"type": "http", "headers": []}), Response(), db, de)
+
+
+def mesurer(engine, fonction, repetitions: int = 7):
+    """Temps médian (secondes) et nombre de requêtes d'un appel"""
+    requetes = []
+    compteur = lambda *args: requetes.append(1)
+    durees = []
+    for _ in range(repetitions):
+        requetes.clear()
+        event.listen(engine, "before_cursor_execute", compteur)
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+        event.remove(engine, "before_cursor_execute", compteur)
+    return statistics.median(durees), len(requetes), resultat
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "sqlite://"
+    print(f"=== Benchmark dashboard DE ({url.split('://')[0]}) ===")
+    print(f"{'étudiants':>10} {'ancien (ms)':>12} {'requêtes':>9} {'nouveau (ms)':>13} {'requêtes':>9}")
+
+    for taille in TAILLES:
+        engine, db = preparer_base(url, taille)
+        try:
+            de = db.get(Utilisateur, "U_DE")
+            # Les données sont insérées sans passer par les événements de session
+            reconcilier_statistiques(db)
+            duree_ancien, requetes_ancien, attendu = mesurer(engine, lambda: statistiques_ancien(db))
+            duree_nouveau, requetes_nouveau, reponse = mesurer(engine, lambda: asyncio.run(appeler_sans_cache(db, de)))
+            assert {cle: reponse["statistiques"][cle] for cle in attendu} == attendu, (reponse["statistiques"], attendu)
+            print(f"{taille:>10} {duree_ancien * 1000:>12.1f} {requetes_ancien:>9} "
+                  f"{duree_nouveau * 1000:>13.1f} {requetes_nouveau:>9}")
+        finally:
+            db.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Benchmark : débit de la chaîne d'envoi d'emails contre un serveur SMTP local
+
+Pilote les vraies routes (création de comptes formateurs, création d'un travail
+suivie du vidage de l'outbox) avec N destinataires, en remplaçant Gmail par
+utils/smtp_local.py. Rapporte messages/s, latences d'envoi p50/p99 et reprises.
+
+Usage :
+    python benchmark_emails.py                                  # 200 destinataires
+    python benchmark_emails.py -n 1000 --latence 0.02 --taux-echec 0.05 --taux-deconnexion 0.01
+    python benchmark_emails.py --url mysql+pymysql://...        # base de test MySQL (tables recréées)
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from database.database import Base, get_db
+from models import (
+    Utilisateur, Formation, Promotion, Formateur, Etudiant, EspacePedagogique,
+    EmailOutbox, RoleEnum, StatutEmailEnum
+)
+from core.auth import get_current_user
+from routes import gestion_comptes, espaces_pedagogiques
+from utils import email_outbox
+from utils.email_service import email_service
+from utils.smtp_local import ServeurSMTPLocal
+
+
+def centile(valeurs: List[float], p: float) -> float:
+    if not valeurs:
+        return 0.0
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * p / 100))]
+
+
+class MesureEnvois:
+    """Chronomètre chaque envoi SMTP effectué par les threads du répartiteur"""
+
+    def __init__(self, envoyer):
+        self.envoyer = envoyer
+        self.latences: List[float] = []
+        self.echecs = 0
+        self._verrou = threading.Lock()
+
+    def __call__(self, message):
+        debut = time.perf_counter()
+        try:
+            self.envoyer(message)
+        except Exception:
+            with self._verrou:
+                self.echecs += 1
+            raise
+        with self._verrou:
+            self.latences.append(time.perf_counter() - debut)
+
+
+def preparer_base(url: str, nb_etudiants: int):
+    """Base vierge : un DE, un formateur, un espace et une promotion de nb_etudiants étudiants"""
+    engine = create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    SessionBench = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionBench()
+
+    db.add(Utilisateur(identifiant="U_DE", email="de@bench.local", mot_de_passe="x",
+                       nom="Bench", prenom="DE", role=RoleEnum.DE))
+    db.add(Formation(id_formation="F_BENCH", nom_formation="Bench", date_debut=date(2024, 9, 1)))
+    db.add(Promotion(id_promotion="P_BENCH", id_formation="F_BENCH", annee_academique="2024-2025",
+                     libelle="Promotion bench", date_debut=date(2024, 9, 1), date_fin=date(2025, 6, 30)))
+    db.add(Utilisateur(identifiant="U_FMT", email="fmt@bench.local", mot_de_passe="x",
+                       nom="Bench", prenom="Formateur", role=RoleEnum.FORMATEUR))
+    db.add(Formateur(id_formateur="FMT_BENCH", identifiant="U_FMT"))
+    db.add(EspacePedagogique(id_espace="ESP_BENCH", id_promotion="P_BENCH", nom_matiere="Bench",
+                             id_formateur="FMT_BENCH"))
+    db.bulk_insert_mappings(Utilisateur, [
+        {"identifiant": f"U_{i}", "email": f"etudiant{i}@bench.local", "mot_de_passe": "x",
+         "nom": f"Nom{i}", "prenom": f"Prenom{i}", "role": RoleEnum.ETUDIANT}
+        for i in range(nb_etudiants)
+    ])
+    db.bulk_insert_mappings(Etudiant, [
+        {"id_etudiant": f"E_{i}", "identifiant": f"U_{i}", "matricule": f"MAT{i:06d}",
+         "id_promotion": "P_BENCH", "date_inscription": date(2024, 9, 1)}
+        for i in range(nb_etudiants)
+    ])
+    db.commit()
+    db.close()
+    return engine, SessionBench
+
+
+def creer_client(SessionBench, identifiant: str) -> TestClient:
+    app = FastAPI()
+    app.include_router(gestion_comptes.router)
+    app.include_router(espaces_pedagogiques.router)
+
+    def get_db_bench():
+        db = SessionBench()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def utilisateur_bench():
+        db = SessionBench()
+        try:
+            return db.get(Utilisateur, identifiant)
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_db_bench
+    app.dependency_overrides[get_current_user] = utilisateur_bench
+    return TestClient(app)
+
+
+def brancher_service(serveur: ServeurSMTPLocal) -> MesureEnvois:
+    """Redirige email_service vers le serveur local, sans quota fournisseur"""
+    email_service.fermer()
+    email_service.smtp_server = serveur.hote
+    email_service.smtp_port = serveur.port
+    email_service.smtp_starttls = False
+    email_service.email_password = "bench"
+    email_service.configurer_debit(limite_par_minute=10 ** 9, limite_par_jour=10 ** 9)
+    mesure = MesureEnvois(email_service._obtenir_pool().envoyer)
+    email_service._envoyer_smtp = mesure
+    return mesure
+
+
+def bench_creation_comptes(SessionBench, nb: int, concurrence: int) -> Dict:
+    """N comptes formateurs créés par la route, concurrence requêtes simultanées"""
+    client = creer_client(SessionBench, "U_DE")
+
+    def creer(i: int):
+        reponse = client.post("/api/gestion-comptes/creer-formateur", json={
+            "email": f"formateur{i}@example.com", "nom": f"Nom{i}", "prenom": f"Prenom{i}", "specialite": "Bench"
+        })
+        return reponse.status_code, reponse.status_code == 201 and reponse.json()["email_envoye"]
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(concurrence) as executeur:
+        resultats = list(executeur.map(creer, range(nb)))
+    return {
+        "duree": time.perf_counter() - debut,
+        "envoyes": sum(envoye for _, envoye in resultats),
+        "reprises_outbox": 0,
+        "erreurs_http": sum(1 for statut, _ in resultats if statut != 201)
+    }
+
+
+def bench_creation_travail(SessionBench, nb: int) -> Dict:
+    """Un travail assigné à la promotion, puis vidage complet de l'outbox"""
+    client = creer_client(SessionBench, "U_FMT")
+    email_outbox.FENETRE_DIGEST = 0
+    email_outbox.DELAI_BASE_REPRISE = 0
+
+    debut = time.perf_counter()
+    reponse = client.post("/api/espaces-pedagogiques/travaux/creer", json={
+        "id_espace": "ESP_BENCH", "titre": "Bench", "description": "Travail de benchmark",
+        "type_travail": "INDIVIDUEL", "date_echeance": (datetime.utcnow() + timedelta(days=7)).isoformat()
+    })
+    assert reponse.status_code == 200, reponse.text
+    assert reponse.json()["travail"]["emails_en_file"] == nb
+
+    db = SessionBench()
+    try:
+        while True:
+            bilan = email_outbox.traiter_file_emails(db)
+            if bilan["traites"] == 0:
+                restants = db.query(EmailOutbox).filter(
+                    EmailOutbox.statut.in_([StatutEmailEnum.EN_ATTENTE, StatutEmailEnum.EN_COURS])
+                ).count()
+                if restants == 0:
+                    break
+        duree = time.perf_counter() - debut
+        envoyes, tentatives = db.query(
+            func.count(EmailOutbox.id_email), func.coalesce(func.sum(EmailOutbox.tentatives), 0)
+        ).filter(EmailOutbox.statut == StatutEmailEnum.ENVOYE).one()
+        echecs = db.query(EmailOutbox).filter(EmailOutbox.statut == StatutEmailEnum.ECHEC).count()
+    finally:
+        db.close()
+    return {"duree": duree, "envoyes": envoyes, "reprises_outbox": tentatives - envoyes, "abandonnes": echecs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--destinataires", type=int, default=200)
+    parser.add_argument("--concurrence", type=int, default=8, help="requêtes simultanées (création de comptes)")
+    parser.add_argument("--latence", type=float, default=0.005, help="latence SMTP par message (s)")
+    parser.add_argument("--latence-connexion", type=float, default=0.05, help="latence accueil/AUTH (s)")
+    parser.add_argument("--taux-echec", type=float, default=0.0)
+    parser.add_argument("--taux-deconnexion", type=float, default=0.0)
+    parser.add_argument("--url", default=None, help="URL SQLAlchemy (défaut : fichier SQLite temporaire)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_emails.db')}"
+    print(f"=== Benchmark emails ({args.destinataires} destinataires, {url.split('://')[0]}) ===")
+    print(f"SMTP local : latence {args.latence * 1000:.0f} ms/message, {args.latence_connexion * 1000:.0f} ms/connexion, "
+          f"échecs {args.taux_echec:.0%}, déconnexions {args.taux_deconnexion:.0%}")
+    print(f"{'scénario':<18} {'envoyés':>8} {'msg/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'échecs SMTP':>12} {'reconnexions':>13} {'reprises':>9}")
+
+    scenarios = [
+        ("création comptes", lambda S: bench_creation_comptes(S, args.destinataires, args.concurrence)),
+        ("création travail", lambda S: bench_creation_travail(S, args.destinataires)),
+    ]
+    for nom, scenario in scenarios:
+        engine, SessionBench = preparer_base(url, args.destinataires)
+        serveur = ServeurSMTPLocal(
+            latence=args.latence, latence_connexion=args.latence_connexion,
+            taux_echec=args.taux_echec, taux_deconnexion=args.taux_deconnexion,
+            graine=42, conserver_messages=False
+        ).demarrer()
+        try:
+            mesure = brancher_service(serveur)
+            resultat = scenario(SessionBench)
+            reconnexions = email_service.metriques()["pool_smtp"]["reconnexions"]
+            print(f"{nom:<18} {resultat['envoyes']:>8} {resultat['envoyes'] / resultat['duree']:>8.1f} "
+                  f"{centile(mesure.latences, 50) * 1000:>9.1f} {centile(mesure.latences, 99) * 1000:>9.1f} "
+                  f"{mesure.echecs:>12} {reconnexions:>13} {resultat['reprises_outbox']:>9}")
+            if resultat.get("erreurs_http"):
+                print(f"   ⚠️ {resultat['erreurs_http']} requête(s) en erreur (compte non créé, pas d'email)")
+            if resultat.get("abandonnes"):
+                print(f"   ⚠️ {resultat['abandonnes']} email(s) abandonné(s) après {email_outbox.MAX_TENTATIVES} tentatives")
+        finally:
+            email_service.fermer()
+            serveur.arreter()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ import models  # ensure all models are imported so tables are created
 from routes import auth
 from routes import gestion_comptes
 from core.auth import initialiser_compte_de
+from utils.email_outbox import email_outbox_worker
+from utils.email_service import email_service
+from utils.statistiques import reconciliation_statistiques_worker
+from utils.prechauffage import prechauffage_dashboard_worker
 
 # Créer les tables
 Base.metadata.create_all(bind=engine)
@@ -46,6 +50,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Worker d'envoi des emails en file (outbox)
+@app.on_event("startup")
+def demarrer_worker_emails():
+    # Quotas du fournisseur comptés en base : partagés par tous les workers, conservés au redémarrage
+    email_service.configurer_debit(session_factory_quota=SessionLocal)
+    email_outbox_worker.demarrer()
+
+@app.on_event("shutdown")
+def arreter_worker_emails():
+    email_outbox_worker.arreter()
+    email_service.fermer()
+
+# Réconciliation des compteurs du dashboard DE (au démarrage puis chaque nuit)
+@app.on_event("startup")
+def demarrer_reconciliation_statistiques():
+    reconciliation_statistiques_worker.demarrer()
+
+@app.on_event("shutdown")
+def arreter_reconciliation_statistiques():
+    reconciliation_statistiques_worker.arreter()
+
+# Préchauffage du cache des dashboards avant les créneaux de cours et les échéances
+@app.on_event("startup")
+def demarrer_prechauffage_dashboards():
+    prechauffage_dashboard_worker.demarrer()
+
+@app.on_event("shutdown")
+def arreter_prechauffage_dashboards():
+    prechauffage_dashboard_worker.arreter()
+
 # Inclure les routes d'authentification
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 
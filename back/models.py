@@ -13,6 +13,8 @@ from sqlalchemy import (
     ForeignKey,
     Enum as SAEnum,
     Numeric,
+    Integer,
+    Index,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
@@ -44,6 +46,13 @@ class StatutAssignationEnum(str, Enum):
     NOTE = "NOTE"
 
 
+class StatutEmailEnum(str, Enum):
+    EN_ATTENTE = "EN_ATTENTE"
+    EN_COURS = "EN_COURS"
+    ENVOYE = "ENVOYE"
+    ECHEC = "ECHEC"  # Abandonné après le nombre maximal de tentatives
+
+
 class Utilisateur(Base):
     __tablename__ = "utilisateur"
 
@@ -54,7 +63,7 @@ class Utilisateur(Base):
     prenom = Column(String(100), nullable=False)
     role = Column(SAEnum(RoleEnum), nullable=False)
     actif = Column(Boolean, nullable=False, default=True)
-    date_creation = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_creation = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)  # Comptes récents (dashboard DE)
     token_activation = Column(String(255), nullable=True)
     date_expiration_token = Column(DateTime, nullable=True)
     mot_de_passe_temporaire = Column(Boolean, nullable=False, default=False)  # ← AJOUTÉ pour gérer le DE
@@ -84,7 +93,7 @@ class Promotion(Base):
     id_formation = Column(String(100), ForeignKey("formation.id_formation"), nullable=False)
     annee_academique = Column(String(20), nullable=False)
     libelle = Column(String(255), nullable=False)
-    date_debut = Column(Date, nullable=False)
+    date_debut = Column(Date, nullable=False, index=True)  # Promotions récentes (dashboard DE)
     date_fin = Column(Date, nullable=False)
 
     __table_args__ = (
@@ -104,7 +113,7 @@ class Etudiant(Base):
     matricule = Column(String(100), unique=True, nullable=False)
     id_promotion = Column(String(100), ForeignKey("promotion.id_promotion"), nullable=False)
     date_inscription = Column(Date, nullable=False)
-    statut = Column(SAEnum(StatutEtudiantEnum), nullable=False, default=StatutEtudiantEnum.ACTIF)
+    statut = Column(SAEnum(StatutEtudiantEnum), nullable=False, default=StatutEtudiantEnum.ACTIF, index=True)
 
     utilisateur = relationship("Utilisateur", back_populates="etudiant")
     promotion = relationship("Promotion", back_populates="etudiants")
@@ -152,6 +161,11 @@ class Travail(Base):
     fichier_consigne = Column(String(255), nullable=True)
     note_max = Column(Numeric(3, 1), nullable=False, default=Decimal("20.0"))
 
+    __table_args__ = (
+        # Travaux d'un espace par échéance (travaux à venir / en retard du formateur)
+        Index("ix_travail_espace_echeance", "id_espace", "date_echeance"),
+    )
+
     espace_pedagogique = relationship("EspacePedagogique", back_populates="travaux")
     groupes = relationship("GroupeEtudiant", back_populates="travail")
     assignations = relationship("Assignation", back_populates="travail")
@@ -179,6 +193,11 @@ class Assignation(Base):
     date_assignment = Column(DateTime, nullable=False, default=datetime.utcnow)
     statut = Column(SAEnum(StatutAssignationEnum), nullable=False, default=StatutAssignationEnum.ASSIGNE)
 
+    __table_args__ = (
+        # Travaux à rendre d'un étudiant (travaux à venir / en retard)
+        Index("ix_assignation_etudiant_statut", "id_etudiant", "statut"),
+    )
+
     etudiant = relationship("Etudiant", back_populates="assignations")
     travail = relationship("Travail", back_populates="assignations")
     groupe = relationship("GroupeEtudiant", back_populates="assignations")
@@ -205,4 +224,73 @@ class TentativeConnexion(Base):
     id_tentative = Column(String(100), primary_key=True, nullable=False, default=lambda: secrets.token_urlsafe(16))
     email = Column(String(191), nullable=False)
     date_tentative = Column(DateTime, nullable=False, default=datetime.utcnow)
-    succes = Column(Boolean, nullable=False, default=False)
\ No newline at end of file
+    succes = Column(Boolean, nullable=False, default=False)
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id_email = Column(String(100), primary_key=True, nullable=False, default=lambda: secrets.token_urlsafe(16))
+    type_email = Column(String(50), nullable=False)  # Ex: "ASSIGNATION_TRAVAIL"
+    destinataire = Column(String(191), nullable=False)
+    parametres = Column(Text, nullable=False)  # Paramètres du modèle d'email, sérialisés en JSON
+    statut = Column(SAEnum(StatutEmailEnum), nullable=False, default=StatutEmailEnum.EN_ATTENTE)
+    tentatives = Column(Integer, nullable=False, default=0)
+    prochaine_tentative = Column(DateTime, nullable=False, default=datetime.utcnow)
+    derniere_erreur = Column(Text, nullable=True)
+    date_creation = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_envoi = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_statut_prochaine_tentative", "statut", "prochaine_tentative"),
+    )
+
+
+class VersionTable(Base):
+    """Version des données d'une table, incrémentée par chaque transaction qui la modifie (voir utils/cache_http.py)"""
+    __tablename__ = "version_table"
+
+    nom_table = Column(String(100), primary_key=True, nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class QuotaEnvoi(Base):
+    """Emails envoyés par fenêtre de temps, tous processus confondus (voir utils/quota_emails.py)"""
+    __tablename__ = "quota_envoi"
+
+    fenetre = Column(String(50), primary_key=True, nullable=False)  # Ex: "jour:2024-11-04", "minute:2024-11-04T09:30"
+    nb_envois = Column(Integer, nullable=False, default=0)
+
+
+class Statistiques(Base):
+    """Compteurs de l'établissement tenus à jour à chaque commit (voir utils/statistiques.py)"""
+    __tablename__ = "statistiques"
+
+    id_statistiques = Column(String(100), primary_key=True, nullable=False)  # Une seule ligne : "ETABLISSEMENT"
+    total_formateurs = Column(Integer, nullable=False, default=0)
+    total_etudiants = Column(Integer, nullable=False, default=0)
+    etudiants_actifs = Column(Integer, nullable=False, default=0)
+    etudiants_suspendus = Column(Integer, nullable=False, default=0)
+    etudiants_exclus = Column(Integer, nullable=False, default=0)
+    total_promotions = Column(Integer, nullable=False, default=0)
+    total_formations = Column(Integer, nullable=False, default=0)
+    assignations_assignees = Column(Integer, nullable=False, default=0)
+    assignations_en_cours = Column(Integer, nullable=False, default=0)
+    assignations_rendues = Column(Integer, nullable=False, default=0)
+    assignations_notees = Column(Integer, nullable=False, default=0)
+    date_mise_a_jour = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_reconciliation = Column(DateTime, nullable=True)
+
+
+class SyntheseNotes(Base):
+    """Notes d'un étudiant dans un espace, agrégées à chaque notation (voir utils/synthese_notes.py)"""
+    __tablename__ = "synthese_notes"
+
+    id_etudiant = Column(String(100), ForeignKey("etudiant.id_etudiant"), primary_key=True, nullable=False)
+    id_espace = Column(String(100), ForeignKey("espace_pedagogique.id_espace"), primary_key=True, nullable=False)
+    nombre_notes = Column(Integer, nullable=False, default=0)
+    somme_notes = Column(Numeric(10, 3), nullable=False, default=Decimal("0"))  # Notes ramenées sur 20
+    derniere_note = Column(Numeric(3, 1), nullable=True)  # Note brute, sur derniere_note_max
+    derniere_note_max = Column(Numeric(3, 1), nullable=True)
+    date_derniere_note = Column(DateTime, nullable=True)
+    date_mise_a_jour = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from typing import Dict, Any, List
+from sqlalchemy import func, desc, select, case, and_
+from typing import Dict, Any, List, Optional
 from datetime import datetime, date
 
 from database.database import get_db
@@ -12,13 +12,40 @@ from models import (
 )
 from core.auth import get_current_user
 from utils.promotion_generator import lister_annees_disponibles
+from utils.statistiques import lire_statistiques
+from utils.cache_dashboard import cache_dashboard, cle_dashboard, ETIQUETTE_DE
+from utils.cache_http import calculer_etag_contenu, non_modifie
+from utils.espaces_promotion import espaces_promotion
+from utils.single_flight import single_flight
+from utils.synthese_notes import lire_synthese_etudiant, moyenne_generale
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
+# ==================== CACHE ET ETAG ====================
+
+def _depuis_cache(request: Request, response: Response, cle_cache) -> Optional[Any]:
+    """Réponse en cache (ou 304 si le client a déjà cette version), sinon None"""
+    en_cache = cache_dashboard.obtenir(cle_cache)
+    if en_cache is None:
+        return None
+    etag, reponse = en_cache
+    return non_modifie(request, response, etag) or reponse
+
+
+def _mettre_en_cache(request: Request, response: Response, cle_cache, reponse: Dict[str, Any],
+                     etiquettes, generation: int) -> Any:
+    """Met la réponse en cache avec l'empreinte de son contenu, et la renvoie (ou 304)"""
+    etag = calculer_etag_contenu(reponse)
+    cache_dashboard.enregistrer(cle_cache, (etag, reponse), etiquettes, generation)
+    return non_modifie(request, response, etag) or reponse
+
+
 # ==================== DASHBOARD DE ====================
 
 @router.get("/de")
 async def dashboard_de(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -30,42 +57,48 @@ async def dashboard_de(
             detail="Accès réservé au Directeur d'Établissement"
         )
     
-    # Statistiques globales
-    total_formateurs = db.query(Formateur).count()
-    total_etudiants = db.query(Etudiant).count()
-    total_promotions = db.query(Promotion).count()
-    total_formations = db.query(Formation).count()
+    cle_cache = cle_dashboard(current_user.role, current_user.identifiant)
+    reponse = _depuis_cache(request, response, cle_cache)
+    if reponse is not None:
+        return reponse
+    generation = cache_dashboard.generation()
     
-    # Étudiants par statut
-    etudiants_actifs = db.query(Etudiant).filter(Etudiant.statut == StatutEtudiantEnum.ACTIF).count()
-    etudiants_suspendus = db.query(Etudiant).filter(Etudiant.statut == StatutEtudiantEnum.SUSPENDU).count()
+    # Statistiques globales, étudiants et assignations par statut (compteurs maintenus)
+    statistiques = lire_statistiques(db)
     
-    # Promotions récentes
-    promotions_recentes = db.query(Promotion).order_by(desc(Promotion.date_debut)).limit(5).all()
+    # Promotions récentes (colonnes utiles uniquement)
+    promotions_recentes = db.query(
+        Promotion.id_promotion,
+        Promotion.libelle,
+        Promotion.annee_academique,
+        Promotion.date_debut,
+        Promotion.date_fin
+    ).order_by(desc(Promotion.date_debut)).limit(5).all()
     
     # Années académiques disponibles
     annees_disponibles = lister_annees_disponibles()
     
     # Activité récente (derniers comptes créés)
-    comptes_recents = db.query(Utilisateur).filter(
+    comptes_recents = db.query(
+        Utilisateur.identifiant,
+        Utilisateur.nom,
+        Utilisateur.prenom,
+        Utilisateur.email,
+        Utilisateur.role,
+        Utilisateur.date_creation,
+        Utilisateur.actif
+    ).filter(
         Utilisateur.role.in_([RoleEnum.FORMATEUR, RoleEnum.ETUDIANT])
     ).order_by(desc(Utilisateur.date_creation)).limit(10).all()
     
-    return {
+    reponse = {
         "role": "DE",
         "utilisateur": {
             "nom": current_user.nom,
             "prenom": current_user.prenom,
             "email": current_user.email
         },
-        "statistiques": {
-            "total_formateurs": total_formateurs,
-            "total_etudiants": total_etudiants,
-            "total_promotions": total_promotions,
-            "total_formations": total_formations,
-            "etudiants_actifs": etudiants_actifs,
-            "etudiants_suspendus": etudiants_suspendus
-        },
+        "statistiques": statistiques,
         "promotions_recentes": [
             {
                 "id_promotion": p.id_promotion,
@@ -95,11 +128,17 @@ async def dashboard_de(
             "configurer_systeme"
         ]
     }
+    return _mettre_en_cache(
+        request, response, cle_cache, reponse,
+        {ETIQUETTE_DE, f"utilisateur:{current_user.identifiant}"}, generation
+    )
 
 # ==================== DASHBOARD FORMATEUR ====================
 
 @router.get("/formateur")
 async def dashboard_formateur(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -111,6 +150,12 @@ async def dashboard_formateur(
             detail="Accès réservé aux formateurs"
         )
     
+    cle_cache = cle_dashboard(current_user.role, current_user.identifiant)
+    reponse = _depuis_cache(request, response, cle_cache)
+    if reponse is not None:
+        return reponse
+    generation = cache_dashboard.generation()
+    
     # Récupérer le profil formateur
     formateur = db.query(Formateur).filter(Formateur.identifiant == current_user.identifiant).first()
     if not formateur:
@@ -119,53 +164,70 @@ async def dashboard_formateur(
             detail="Profil formateur non trouvé"
         )
     
-    # Mes espaces pédagogiques
-    espaces = db.query(EspacePedagogique).filter(
+    # Mes espaces pédagogiques, avec leurs compteurs calculés par la base
+    nombre_travaux = select(func.count(Travail.id_travail)).where(
+        Travail.id_espace == EspacePedagogique.id_espace
+    ).correlate(EspacePedagogique).scalar_subquery()
+    nombre_etudiants = select(func.count(Etudiant.id_etudiant)).where(
+        Etudiant.id_promotion == EspacePedagogique.id_promotion
+    ).correlate(EspacePedagogique).scalar_subquery()
+    nombre_a_corriger = select(func.count(Assignation.id_assignation)).join(
+        Travail, Travail.id_travail == Assignation.id_travail
+    ).where(
+        Travail.id_espace == EspacePedagogique.id_espace,
+        Assignation.statut == StatutAssignationEnum.RENDU
+    ).correlate(EspacePedagogique).scalar_subquery()
+    
+    espaces = db.query(
+        EspacePedagogique.id_espace,
+        EspacePedagogique.id_promotion,
+        EspacePedagogique.nom_matiere,
+        EspacePedagogique.description,
+        EspacePedagogique.code_acces,
+        EspacePedagogique.date_creation,
+        Promotion.libelle.label("promotion"),
+        nombre_travaux.label("nombre_travaux"),
+        nombre_etudiants.label("nombre_etudiants"),
+        nombre_a_corriger.label("nombre_a_corriger")
+    ).outerjoin(
+        Promotion, Promotion.id_promotion == EspacePedagogique.id_promotion
+    ).filter(
         EspacePedagogique.id_formateur == formateur.id_formateur
     ).all()
     
-    # Statistiques des espaces
-    total_espaces = len(espaces)
-    total_travaux = 0
-    total_etudiants = set()
+    # Étudiants distincts : plusieurs espaces peuvent partager une promotion
+    total_etudiants = 0
+    if espaces:
+        total_etudiants = db.query(func.count(Etudiant.id_etudiant)).filter(
+            Etudiant.id_promotion.in_({e.id_promotion for e in espaces})
+        ).scalar()
     
-    espaces_data = []
-    for espace in espaces:
-        # Compter les travaux de cet espace
-        travaux_espace = db.query(Travail).filter(Travail.id_espace == espace.id_espace).count()
-        total_travaux += travaux_espace
-        
-        # Compter les étudiants de la promotion
-        etudiants_promotion = db.query(Etudiant).filter(
-            Etudiant.id_promotion == espace.id_promotion
-        ).all()
-        
-        for etudiant in etudiants_promotion:
-            total_etudiants.add(etudiant.id_etudiant)
-        
-        espaces_data.append({
-            "id_espace": espace.id_espace,
-            "nom_matiere": espace.nom_matiere,
-            "description": espace.description,
-            "promotion": espace.promotion.libelle if espace.promotion else "N/A",
-            "nombre_travaux": travaux_espace,
-            "nombre_etudiants": len(etudiants_promotion),
-            "code_acces": espace.code_acces,
-            "date_creation": espace.date_creation.isoformat()
-        })
+    espaces_data = [
+        {
+            "id_espace": e.id_espace,
+            "nom_matiere": e.nom_matiere,
+            "description": e.description,
+            "promotion": e.promotion or "N/A",
+            "nombre_travaux": e.nombre_travaux,
+            "nombre_etudiants": e.nombre_etudiants,
+            "code_acces": e.code_acces,
+            "date_creation": e.date_creation.isoformat()
+        } for e in espaces
+    ]
     
     # Travaux récents
-    travaux_recents = db.query(Travail).join(EspacePedagogique).filter(
+    travaux_recents = db.query(
+        Travail.id_travail,
+        Travail.titre,
+        Travail.type_travail,
+        Travail.date_echeance,
+        Travail.date_creation,
+        EspacePedagogique.nom_matiere
+    ).join(EspacePedagogique).filter(
         EspacePedagogique.id_formateur == formateur.id_formateur
     ).order_by(desc(Travail.date_creation)).limit(5).all()
     
-    # Assignations en attente de correction
-    assignations_a_corriger = db.query(Assignation).join(Travail).join(EspacePedagogique).filter(
-        EspacePedagogique.id_formateur == formateur.id_formateur,
-        Assignation.statut == StatutAssignationEnum.RENDU
-    ).count()
-    
-    return {
+    reponse = {
         "role": "FORMATEUR",
         "utilisateur": {
             "nom": current_user.nom,
@@ -175,10 +237,10 @@ async def dashboard_formateur(
             "specialite": formateur.specialite
         },
         "statistiques": {
-            "total_espaces": total_espaces,
-            "total_travaux": total_travaux,
-            "total_etudiants": len(total_etudiants),
-            "assignations_a_corriger": assignations_a_corriger
+            "total_espaces": len(espaces),
+            "total_travaux": sum(e.nombre_travaux for e in espaces),
+            "total_etudiants": total_etudiants,
+            "assignations_a_corriger": sum(e.nombre_a_corriger for e in espaces)
         },
         "espaces_pedagogiques": espaces_data,
         "travaux_recents": [
@@ -187,7 +249,7 @@ async def dashboard_formateur(
                 "titre": t.titre,
                 "type_travail": t.type_travail,
                 "date_echeance": t.date_echeance.isoformat(),
-                "espace": t.espace_pedagogique.nom_matiere,
+                "espace": t.nom_matiere,
                 "date_creation": t.date_creation.isoformat()
             } for t in travaux_recents
         ],
@@ -199,11 +261,34 @@ async def dashboard_formateur(
             "voir_statistiques"
         ]
     }
+    # Invalidé par : nouveau travail ou rendu dans un de ses espaces, effectif d'une promotion
+    etiquettes = {f"formateur:{formateur.id_formateur}", f"utilisateur:{current_user.identifiant}"}
+    for e in espaces:
+        etiquettes |= {f"espace:{e.id_espace}", f"correction:{e.id_espace}", f"effectif:{e.id_promotion}"}
+    return _mettre_en_cache(request, response, cle_cache, reponse, etiquettes, generation)
 
 # ==================== DASHBOARD ETUDIANT ====================
 
+def _dernieres_livraisons(id_etudiant: str):
+    """Dernière livraison de chaque assignation de l'étudiant (fonction de fenêtrage)"""
+    return select(
+        Livraison.id_assignation,
+        Livraison.note_attribuee,
+        func.row_number().over(
+            partition_by=Livraison.id_assignation,
+            order_by=(desc(Livraison.date_livraison), desc(Livraison.id_livraison))
+        ).label("rang")
+    ).join(
+        Assignation, Assignation.id_assignation == Livraison.id_assignation
+    ).where(
+        Assignation.id_etudiant == id_etudiant
+    ).subquery("derniere_livraison")
+
+
 @router.get("/etudiant")
 async def dashboard_etudiant(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -215,68 +300,84 @@ async def dashboard_etudiant(
             detail="Accès réservé aux étudiants"
         )
     
-    # Récupérer le profil étudiant
-    etudiant = db.query(Etudiant).filter(Etudiant.identifiant == current_user.identifiant).first()
+    cle_cache = cle_dashboard(current_user.role, current_user.identifiant)
+    reponse = _depuis_cache(request, response, cle_cache)
+    if reponse is not None:
+        return reponse
+    generation = cache_dashboard.generation()
+    
+    # Récupérer le profil étudiant avec sa promotion et sa formation
+    etudiant = db.query(
+        Etudiant.id_etudiant,
+        Etudiant.id_promotion,
+        Etudiant.matricule,
+        Etudiant.statut,
+        Etudiant.date_inscription,
+        Promotion.libelle,
+        Promotion.annee_academique,
+        Formation.nom_formation
+    ).join(
+        Promotion, Promotion.id_promotion == Etudiant.id_promotion
+    ).join(
+        Formation, Formation.id_formation == Promotion.id_formation
+    ).filter(Etudiant.identifiant == current_user.identifiant).first()
     if not etudiant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Profil étudiant non trouvé"
         )
     
-    # Mes assignations (travaux)
-    assignations = db.query(Assignation).filter(
-        Assignation.id_etudiant == etudiant.id_etudiant
-    ).all()
+    maintenant = datetime.now()
+    en_retard = and_(Travail.date_echeance < maintenant, Assignation.statut != StatutAssignationEnum.RENDU)
+    derniere = _dernieres_livraisons(etudiant.id_etudiant)
     
-    # Statistiques des travaux
-    total_travaux = len(assignations)
-    travaux_termines = len([a for a in assignations if a.statut == StatutAssignationEnum.RENDU])
-    travaux_notes = len([a for a in assignations if a.statut == StatutAssignationEnum.NOTE])
-    travaux_en_cours = len([a for a in assignations if a.statut == StatutAssignationEnum.EN_COURS])
-    travaux_en_retard = 0
+    def _avec_derniere_livraison(requete):
+        return requete.select_from(Assignation).join(
+            Travail, Travail.id_travail == Assignation.id_travail
+        ).outerjoin(
+            derniere, and_(derniere.c.id_assignation == Assignation.id_assignation, derniere.c.rang == 1)
+        ).filter(Assignation.id_etudiant == etudiant.id_etudiant)
     
-    # Mes espaces pédagogiques (cours)
-    espaces = db.query(EspacePedagogique).filter(
-        EspacePedagogique.id_promotion == etudiant.id_promotion
-    ).all()
+    # Statistiques des travaux
+    statistiques = db.query(
+        func.count(Assignation.id_assignation).label("total_travaux"),
+        func.coalesce(func.sum(case((Assignation.statut == StatutAssignationEnum.RENDU, 1), else_=0)), 0).label("travaux_termines"),
+        func.coalesce(func.sum(case((Assignation.statut == StatutAssignationEnum.NOTE, 1), else_=0)), 0).label("travaux_notes"),
+        func.coalesce(func.sum(case((Assignation.statut == StatutAssignationEnum.EN_COURS, 1), else_=0)), 0).label("travaux_en_cours"),
+        func.coalesce(func.sum(case((en_retard, 1), else_=0)), 0).label("travaux_en_retard")
+    ).join(
+        Travail, Travail.id_travail == Assignation.id_travail
+    ).filter(Assignation.id_etudiant == etudiant.id_etudiant).one()
     
-    # Travaux récents et à venir
-    travaux_data = []
-    for assignation in assignations:
-        travail = assignation.travail
-        
-        # Vérifier si en retard
-        if travail.date_echeance < datetime.now() and assignation.statut != StatutAssignationEnum.RENDU:
-            travaux_en_retard += 1
-        
-        # Récupérer la note si disponible
-        note = None
-        if assignation.livraisons:
-            derniere_livraison = max(assignation.livraisons, key=lambda l: l.date_livraison)
-            note = derniere_livraison.note_attribuee
-        
-        travaux_data.append({
-            "id_assignation": assignation.id_assignation,
-            "titre": travail.titre,
-            "description": travail.description,
-            "type_travail": travail.type_travail,
-            "date_echeance": travail.date_echeance.isoformat(),
-            "statut": assignation.statut,
-            "espace": travail.espace_pedagogique.nom_matiere,
-            "formateur": f"{travail.espace_pedagogique.formateur.utilisateur.prenom} {travail.espace_pedagogique.formateur.utilisateur.nom}",
-            "note": float(note) if note else None,
-            "note_max": float(travail.note_max),
-            "en_retard": travail.date_echeance < datetime.now() and assignation.statut != StatutAssignationEnum.RENDU
-        })
+    # Moyennes sur 20, lues dans la synthèse des notes tenue à jour à chaque notation
+    synthese = lire_synthese_etudiant(db, etudiant.id_etudiant)
     
-    # Trier par date d'échéance
-    travaux_data.sort(key=lambda x: x["date_echeance"])
+    # Les 10 premiers travaux par échéance, échus compris (sélection d'origine), triés par la base
+    travaux = _avec_derniere_livraison(db.query(
+        Assignation.id_assignation,
+        Assignation.statut,
+        Travail.titre,
+        Travail.description,
+        Travail.type_travail,
+        Travail.date_echeance,
+        Travail.note_max,
+        EspacePedagogique.nom_matiere,
+        Utilisateur.prenom,
+        Utilisateur.nom,
+        derniere.c.note_attribuee,
+        en_retard.label("en_retard")
+    )).join(
+        EspacePedagogique, EspacePedagogique.id_espace == Travail.id_espace
+    ).join(
+        Formateur, Formateur.id_formateur == EspacePedagogique.id_formateur
+    ).join(
+        Utilisateur, Utilisateur.identifiant == Formateur.identifiant
+    ).order_by(Travail.date_echeance, Assignation.id_assignation).limit(10).all()
     
-    # Mes notes (moyenne)
-    notes = [t["note"] for t in travaux_data if t["note"] is not None]
-    moyenne = sum(notes) / len(notes) if notes else None
+    # Mes espaces pédagogiques (cours), calcul partagé entre les étudiants de la promotion
+    espaces = await espaces_promotion(db, etudiant.id_promotion)
     
-    return {
+    reponse = {
         "role": "ETUDIANT",
         "utilisateur": {
             "nom": current_user.nom,
@@ -287,28 +388,44 @@ async def dashboard_etudiant(
             "date_inscription": etudiant.date_inscription.isoformat()
         },
         "promotion": {
-            "libelle": etudiant.promotion.libelle,
-            "annee_academique": etudiant.promotion.annee_academique,
-            "formation": etudiant.promotion.formation.nom_formation
+            "libelle": etudiant.libelle,
+            "annee_academique": etudiant.annee_academique,
+            "formation": etudiant.nom_formation
         },
         "statistiques": {
-            "total_travaux": total_travaux,
-            "travaux_termines": travaux_termines,
-            "travaux_notes": travaux_notes,
-            "travaux_en_cours": travaux_en_cours,
-            "travaux_en_retard": travaux_en_retard,
-            "moyenne_generale": round(moyenne, 2) if moyenne else None
+            "total_travaux": statistiques.total_travaux,
+            "travaux_termines": statistiques.travaux_termines,
+            "travaux_notes": statistiques.travaux_notes,
+            "travaux_en_cours": statistiques.travaux_en_cours,
+            "travaux_en_retard": statistiques.travaux_en_retard,
+            "moyenne_generale": moyenne_generale(synthese)
         },
         "espaces_pedagogiques": [
             {
-                "id_espace": e.id_espace,
-                "nom_matiere": e.nom_matiere,
-                "description": e.description,
-                "formateur": f"{e.formateur.utilisateur.prenom} {e.formateur.utilisateur.nom}" if e.formateur and e.formateur.utilisateur else "Non assigné",
-                "code_acces": e.code_acces
+                "id_espace": e["id_espace"],
+                "nom_matiere": e["nom_matiere"],
+                "description": e["description"],
+                "formateur": f"{e['formateur_prenom']} {e['formateur_nom']}" if e["formateur_nom"] is not None else "Non assigné",
+                "code_acces": e["code_acces"],
+                "moyenne": synthese.get(e["id_espace"], {}).get("moyenne"),
+                "nombre_notes": synthese.get(e["id_espace"], {}).get("nombre_notes", 0)
             } for e in espaces
         ],
-        "travaux": travaux_data[:10],  # Les 10 plus récents
+        "travaux": [
+            {
+                "id_assignation": t.id_assignation,
+                "titre": t.titre,
+                "description": t.description,
+                "type_travail": t.type_travail,
+                "date_echeance": t.date_echeance.isoformat(),
+                "statut": t.statut,
+                "espace": t.nom_matiere,
+                "formateur": f"{t.prenom} {t.nom}",
+                "note": float(t.note_attribuee) if t.note_attribuee is not None else None,
+                "note_max": float(t.note_max),
+                "en_retard": bool(t.en_retard)
+            } for t in travaux
+        ],
         "actions_disponibles": [
             "voir_travaux",
             "rendre_travail",
@@ -316,22 +433,51 @@ async def dashboard_etudiant(
             "modifier_profil"
         ]
     }
+    # Invalidé par : ses assignations / notes, un nouveau travail ou espace pour sa promotion
+    etiquettes = {
+        f"etudiant:{etudiant.id_etudiant}",
+        f"utilisateur:{current_user.identifiant}",
+        f"promotion:{etudiant.id_promotion}",
+        *(f"espace:{e['id_espace']}" for e in espaces)
+    }
+    return _mettre_en_cache(request, response, cle_cache, reponse, etiquettes, generation)
+
+# ==================== MÉTRIQUES ====================
+
+@router.get("/metriques")
+async def metriques_dashboard(
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """Efficacité du cache des dashboards et des calculs regroupés (réservé au DE)"""
+    
+    if current_user.role != RoleEnum.DE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès réservé au Directeur d'Établissement"
+        )
+    
+    return {
+        "cache": cache_dashboard.metriques(),
+        "single_flight": single_flight.metriques()
+    }
 
 # ==================== ROUTE GÉNÉRIQUE ====================
 
 @router.get("/")
 async def get_dashboard(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
     """Route générique qui redirige vers le bon dashboard selon le rôle"""
     
     if current_user.role == RoleEnum.DE:
-        return await dashboard_de(db, current_user)
+        return await dashboard_de(request, response, db, current_user)
     elif current_user.role == RoleEnum.FORMATEUR:
-        return await dashboard_formateur(db, current_user)
+        return await dashboard_formateur(request, response, db, current_user)
     elif current_user.role == RoleEnum.ETUDIANT:
-        return await dashboard_etudiant(db, current_user)
+        return await dashboard_etudiant(request, response, db, current_user)
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, or_, func, case
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from database.database import get_db
@@ -13,7 +13,15 @@ from models import (
 )
 from core.auth import get_current_user
 from utils.generators import generer_identifiant_unique
-from utils.email_service import email_service
+from utils.email_outbox import mettre_en_file_emails_en_masse, email_outbox_worker, TYPE_ASSIGNATION_TRAVAIL
+from utils.assignations_masse import creer_assignations_en_masse
+from utils.pagination import encoder_curseur, decoder_curseur, condition_apres, paginer
+from utils.cache_http import (
+    calculer_etag, calculer_etag_contenu, non_modifie,
+    version_assignations_etudiant, version_assignations_espace
+)
+from utils.espaces_promotion import espaces_promotion
+from utils.cache_dashboard import cache_dashboard, cle_mes_cours
 import secrets
 
 router = APIRouter(prefix="/api/espaces-pedagogiques", tags=["Espaces Pédagogiques"])
@@ -114,6 +122,8 @@ async def creer_espace_pedagogique(
 
 @router.get("/liste")
 async def lister_espaces_pedagogiques(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -125,6 +135,15 @@ async def lister_espaces_pedagogiques(
             detail="Accès réservé au DE"
         )
     
+    etag = calculer_etag(
+        db,
+        ["espace_pedagogique", "promotion", "formation", "formateur", "utilisateur", "etudiant", "travail"],
+        "liste"
+    )
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
     espaces = db.query(EspacePedagogique).all()
     
     result = []
@@ -156,11 +175,21 @@ async def lister_espaces_pedagogiques(
 
 @router.get("/espace/{id_espace}/etudiants")
 async def lister_etudiants_espace(
+    request: Request,
+    response: Response,
     id_espace: str,
+    tri: str = Query("nom", pattern="^(nom|matricule)$"),
+    limite: Optional[int] = Query(None, ge=1, le=500),
+    apres: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
-    """Lister les étudiants d'un espace pédagogique (Formateur uniquement)"""
+    """
+    Lister les étudiants d'un espace pédagogique (Formateur uniquement)
+
+    - tri : "nom" (nom, prénom) ou "matricule"
+    - limite / apres : pagination par curseur, sans limite toute la promotion est renvoyée
+    """
     
     if current_user.role != RoleEnum.FORMATEUR:
         raise HTTPException(
@@ -172,8 +201,16 @@ async def lister_etudiants_espace(
         Formateur.identifiant == current_user.identifiant
     ).first()
     
-    # Vérifier que l'espace existe et appartient au formateur
-    espace = db.query(EspacePedagogique).filter(
+    if not formateur:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profil formateur non trouvé"
+        )
+    
+    # Vérifier que l'espace existe et appartient au formateur, avant toute réponse 304
+    espace = db.query(EspacePedagogique).options(
+        joinedload(EspacePedagogique.promotion)
+    ).filter(
         EspacePedagogique.id_espace == id_espace,
         EspacePedagogique.id_formateur == formateur.id_formateur
     ).first()
@@ -184,25 +221,64 @@ async def lister_etudiants_espace(
             detail="Espace pédagogique non trouvé ou non autorisé"
         )
     
-    # Récupérer tous les étudiants de la promotion
-    etudiants = db.query(Etudiant).filter(
+    etag = calculer_etag(
+        db,
+        ["espace_pedagogique", "promotion", "etudiant", "utilisateur", "assignation", "travail"],
+        current_user.identifiant, id_espace, tri, limite, apres
+    )
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    if tri == "matricule":
+        colonnes_tri = [Etudiant.matricule, Etudiant.id_etudiant]
+    else:
+        colonnes_tri = [Utilisateur.nom, Utilisateur.prenom, Etudiant.id_etudiant]
+    
+    # Étudiants de la promotion et nombre de travaux assignés dans cet espace, en une passe.
+    # La jointure interne sur Utilisateur écarte les étudiants sans utilisateur associé.
+    requete = db.query(
+        Etudiant,
+        func.count(Travail.id_travail).label("nb_travaux")
+    ).join(
+        Utilisateur, Utilisateur.identifiant == Etudiant.identifiant
+    ).outerjoin(
+        Assignation, Assignation.id_etudiant == Etudiant.id_etudiant
+    ).outerjoin(
+        Travail, and_(
+            Travail.id_travail == Assignation.id_travail,
+            Travail.id_espace == id_espace
+        )
+    ).filter(
         Etudiant.id_promotion == espace.id_promotion
-    ).all()
+    ).group_by(
+        Etudiant.id_etudiant, *colonnes_tri[:-1]
+    ).options(
+        selectinload(Etudiant.utilisateur)
+    )
     
-    result = []
-    for etudiant in etudiants:
-        # Vérifier si l'utilisateur existe
-        if not etudiant.utilisateur:
-            print(f"Attention: étudiant {etudiant.id_etudiant} n'a pas d'utilisateur associé")
-            continue
-            
-        # Compter les travaux assignés à cet étudiant dans cet espace
-        nb_travaux = db.query(Assignation).join(Travail).filter(
-            Travail.id_espace == id_espace,
-            Assignation.id_etudiant == etudiant.id_etudiant
-        ).count()
-        
-        result.append({
+    curseur = decoder_curseur(apres, len(colonnes_tri))
+    if curseur is not None:
+        requete = requete.filter(condition_apres(colonnes_tri, curseur))
+    
+    requete = requete.order_by(*colonnes_tri)
+    if limite is not None:
+        requete = requete.limit(limite + 1)
+    
+    lignes = requete.all()
+    
+    page_suivante = None
+    if limite is not None and len(lignes) > limite:
+        lignes = lignes[:limite]
+        dernier = lignes[-1][0]
+        if tri == "matricule":
+            valeurs = [dernier.matricule, dernier.id_etudiant]
+        else:
+            valeurs = [dernier.utilisateur.nom, dernier.utilisateur.prenom, dernier.id_etudiant]
+        page_suivante = encoder_curseur(valeurs)
+    
+    result = [
+        {
             "id_etudiant": etudiant.id_etudiant,
             "nom": etudiant.utilisateur.nom,
             "prenom": etudiant.utilisateur.prenom,
@@ -210,7 +286,8 @@ async def lister_etudiants_espace(
             "email": etudiant.utilisateur.email,
             "statut": etudiant.statut,
             "nb_travaux_assignes": nb_travaux
-        })
+        } for etudiant, nb_travaux in lignes
+    ]
     
     return {
         "espace": {
@@ -219,15 +296,24 @@ async def lister_etudiants_espace(
             "promotion": espace.promotion.libelle
         },
         "etudiants": result,
-        "total": len(result)
+        "total": len(result),
+        "page_suivante": page_suivante
     }
 
 @router.get("/mes-espaces")
 async def mes_espaces_formateur(
+    request: Request,
+    response: Response,
+    include: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
-    """Lister les espaces du formateur connecté"""
+    """
+    Lister les espaces du formateur connecté
+
+    Par défaut seuls les compteurs sont renvoyés ; la liste des étudiants d'un espace
+    se consulte via /espace/{id_espace}/etudiants, ou s'inclut avec include=etudiants
+    """
     
     if current_user.role != RoleEnum.FORMATEUR:
         raise HTTPException(
@@ -245,39 +331,71 @@ async def mes_espaces_formateur(
             detail="Profil formateur non trouvé"
         )
     
-    espaces = db.query(EspacePedagogique).filter(
+    etag = calculer_etag(
+        db,
+        ["espace_pedagogique", "promotion", "formation", "formateur", "etudiant", "utilisateur", "travail"],
+        current_user.identifiant, include
+    )
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    inclure_etudiants = "etudiants" in (include or "").split(",")
+    
+    espaces = db.query(EspacePedagogique).options(
+        joinedload(EspacePedagogique.promotion).joinedload(Promotion.formation)
+    ).filter(
         EspacePedagogique.id_formateur == formateur.id_formateur
     ).all()
     
+    ids_promotions = {espace.id_promotion for espace in espaces}
+    ids_espaces = [espace.id_espace for espace in espaces]
+    
+    # Compteurs agrégés en une requête chacun
+    nb_etudiants_par_promotion = dict(
+        db.query(Etudiant.id_promotion, func.count(Etudiant.id_etudiant)).filter(
+            Etudiant.id_promotion.in_(ids_promotions)
+        ).group_by(Etudiant.id_promotion).all()
+    ) if ids_promotions else {}
+    
+    nb_travaux_par_espace = dict(
+        db.query(Travail.id_espace, func.count(Travail.id_travail)).filter(
+            Travail.id_espace.in_(ids_espaces)
+        ).group_by(Travail.id_espace).all()
+    ) if ids_espaces else {}
+    
+    # Étudiants de toutes les promotions chargés en un lot, uniquement sur demande
+    etudiants_par_promotion = {}
+    if inclure_etudiants and ids_promotions:
+        etudiants = db.query(Etudiant).options(
+            selectinload(Etudiant.utilisateur)
+        ).filter(
+            Etudiant.id_promotion.in_(ids_promotions)
+        ).order_by(Etudiant.matricule).all()
+        for e in etudiants:
+            etudiants_par_promotion.setdefault(e.id_promotion, []).append({
+                "id_etudiant": e.id_etudiant,
+                "nom": e.utilisateur.nom if e.utilisateur else "N/A",
+                "prenom": e.utilisateur.prenom if e.utilisateur else "N/A",
+                "matricule": e.matricule,
+                "email": e.utilisateur.email if e.utilisateur else "N/A"
+            })
+    
     result = []
     for espace in espaces:
-        etudiants = db.query(Etudiant).filter(
-            Etudiant.id_promotion == espace.id_promotion
-        ).all()
-        
-        nb_travaux = db.query(Travail).filter(
-            Travail.id_espace == espace.id_espace
-        ).count()
-        
-        result.append({
+        espace_data = {
             "id_espace": espace.id_espace,
             "nom_matiere": espace.nom_matiere,
             "description": espace.description,
             "code_acces": espace.code_acces,
             "promotion": espace.promotion.libelle,
             "formation": espace.promotion.formation.nom_formation,
-            "nb_etudiants": len(etudiants),
-            "nb_travaux": nb_travaux,
-            "etudiants": [
-                {
-                    "id_etudiant": e.id_etudiant,
-                    "nom": e.utilisateur.nom if e.utilisateur else "N/A",
-                    "prenom": e.utilisateur.prenom if e.utilisateur else "N/A",
-                    "matricule": e.matricule,
-                    "email": e.utilisateur.email if e.utilisateur else "N/A"
-                } for e in etudiants
-            ]
-        })
+            "nb_etudiants": nb_etudiants_par_promotion.get(espace.id_promotion, 0),
+            "nb_travaux": nb_travaux_par_espace.get(espace.id_espace, 0)
+        }
+        if inclure_etudiants:
+            espace_data["etudiants"] = etudiants_par_promotion.get(espace.id_promotion, [])
+        result.append(espace_data)
     
     return {"espaces": result, "total": len(result)}
 
@@ -285,6 +403,8 @@ async def mes_espaces_formateur(
 
 @router.get("/mes-cours")
 async def mes_cours_etudiant(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -296,7 +416,17 @@ async def mes_cours_etudiant(
             detail="Accès réservé aux étudiants"
         )
     
-    etudiant = db.query(Etudiant).filter(
+    # Liste conservée dans le cache des dashboards (préchauffée avant les pics de trafic),
+    # avec l'empreinte de son contenu comme ETag : le client ne reçoit jamais 304
+    # pour une version qui n'est pas celle servie
+    cle_cache = cle_mes_cours(current_user.identifiant)
+    en_cache = cache_dashboard.obtenir(cle_cache)
+    if en_cache is not None:
+        etag, reponse = en_cache
+        return non_modifie(request, response, etag) or reponse
+    generation = cache_dashboard.generation()
+    
+    etudiant = db.query(Etudiant.id_etudiant, Etudiant.id_promotion).filter(
         Etudiant.identifiant == current_user.identifiant
     ).first()
     
@@ -306,40 +436,44 @@ async def mes_cours_etudiant(
             detail="Profil étudiant non trouvé"
         )
     
-    # Récupérer tous les espaces de la promotion de l'étudiant
-    espaces = db.query(EspacePedagogique).filter(
-        EspacePedagogique.id_promotion == etudiant.id_promotion
-    ).all()
-    
-    result = []
-    for espace in espaces:
-        # Compter les travaux de cet espace
-        nb_travaux = db.query(Travail).filter(
-            Travail.id_espace == espace.id_espace
-        ).count()
-        
-        # Compter les travaux assignés à cet étudiant dans cet espace
-        nb_mes_travaux = db.query(Assignation).join(Travail).filter(
-            Travail.id_espace == espace.id_espace,
+    # Nombre de travaux assignés à cet étudiant par espace
+    mes_travaux_par_espace = dict(
+        db.query(Travail.id_espace, func.count(Assignation.id_assignation)).join(Travail).filter(
             Assignation.id_etudiant == etudiant.id_etudiant
-        ).count()
-        
-        result.append({
-            "id_espace": espace.id_espace,
-            "nom_matiere": espace.nom_matiere,
-            "description": espace.description,
-            "code_acces": espace.code_acces,
-            "formation": espace.promotion.formation.nom_formation,
+        ).group_by(Travail.id_espace).all()
+    )
+    
+    # Espaces de la promotion (calcul partagé entre les étudiants de la promotion)
+    espaces = await espaces_promotion(db, etudiant.id_promotion)
+    
+    result = [
+        {
+            "id_espace": espace["id_espace"],
+            "nom_matiere": espace["nom_matiere"],
+            "description": espace["description"],
+            "code_acces": espace["code_acces"],
+            "formation": espace["nom_formation"],
             "formateur": {
-                "nom": espace.formateur.utilisateur.nom,
-                "prenom": espace.formateur.utilisateur.prenom,
-                "email": espace.formateur.utilisateur.email
+                "nom": espace["formateur_nom"],
+                "prenom": espace["formateur_prenom"],
+                "email": espace["formateur_email"]
             },
-            "nb_travaux_total": nb_travaux,
-            "nb_mes_travaux": nb_mes_travaux
-        })
-    
-    return {"cours": result, "total": len(result)}
+            "nb_travaux_total": espace["nb_travaux"],
+            "nb_mes_travaux": mes_travaux_par_espace.get(espace["id_espace"], 0)
+        } for espace in espaces
+    ]
+    
+    reponse = {"cours": result, "total": len(result)}
+    # Invalidé par : ses assignations, un nouvel espace ou travail pour sa promotion
+    etiquettes = {
+        f"etudiant:{etudiant.id_etudiant}",
+        f"utilisateur:{current_user.identifiant}",
+        f"promotion:{etudiant.id_promotion}",
+        *(f"espace:{espace['id_espace']}" for espace in espaces)
+    }
+    etag = calculer_etag_contenu(reponse)
+    cache_dashboard.enregistrer(cle_cache, (etag, reponse), etiquettes, generation)
+    return non_modifie(request, response, etag) or reponse
 
 # ==================== ROUTES TRAVAUX ====================
 
@@ -387,53 +521,57 @@ async def creer_travail(
     )
     
     db.add(travail)
-    db.commit()
-    db.refresh(travail)
+    db.flush()
+    
+    # Déterminer les étudiants à assigner (colonnes utiles uniquement)
+    requete_etudiants = db.query(
+        Etudiant.id_etudiant,
+        Utilisateur.email,
+        Utilisateur.prenom
+    ).outerjoin(
+        Utilisateur, Utilisateur.identifiant == Etudiant.identifiant
+    ).filter(
+        Etudiant.id_promotion == espace.id_promotion
+    )
     
-    # Déterminer les étudiants à assigner
     if data.etudiants_selectionnes and len(data.etudiants_selectionnes) > 0:
-        # Assignation à des étudiants spécifiques
-        etudiants = db.query(Etudiant).filter(
-            Etudiant.id_etudiant.in_(data.etudiants_selectionnes),
-            Etudiant.id_promotion == espace.id_promotion  # Sécurité : vérifier qu'ils sont dans la bonne promotion
+        # Assignation à des étudiants spécifiques (limités à la promotion de l'espace par sécurité)
+        etudiants = requete_etudiants.filter(
+            Etudiant.id_etudiant.in_(data.etudiants_selectionnes)
         ).all()
-        print(f"Assignation individuelle à {len(etudiants)} étudiant(s) sélectionné(s)")
     else:
         # Assignation à toute la promotion (comportement par défaut)
-        etudiants = db.query(Etudiant).filter(
-            Etudiant.id_promotion == espace.id_promotion
-        ).all()
-        print(f"Assignation globale à {len(etudiants)} étudiant(s) de la promotion")
-    
-    # Créer les assignations
-    assignations_creees = []
-    for etudiant in etudiants:
-        id_assignation = generer_identifiant_unique("ASSIGNATION")
-        assignation = Assignation(
-            id_assignation=id_assignation,
-            id_etudiant=etudiant.id_etudiant,
-            id_travail=id_travail,
-            date_assignment=datetime.utcnow(),
-            statut=StatutAssignationEnum.ASSIGNE
+        etudiants = requete_etudiants.all()
+    
+    # Créer les assignations et les emails de notification en masse, dans la même transaction
+    assignations_creees = creer_assignations_en_masse(
+        db, id_travail, [e.id_etudiant for e in etudiants]
+    )
+    
+    nom_formateur = f"{formateur.utilisateur.prenom} {formateur.utilisateur.nom}"
+    emails_en_file = mettre_en_file_emails_en_masse(db, TYPE_ASSIGNATION_TRAVAIL, [
+        {
+            "destinataire": e.email,
+            "prenom": e.prenom,
+            "titre_travail": travail.titre,
+            "nom_matiere": espace.nom_matiere,
+            "formateur": nom_formateur,
+            "date_echeance": travail.date_echeance.strftime("%d/%m/%Y à %H:%M"),
+            "description": travail.description
+        } for e in etudiants if e.email
+    ])
+    
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de la création du travail: {str(e)}"
         )
-        db.add(assignation)
-        assignations_creees.append(assignation)
-        
-        # Envoyer email de notification
-        try:
-            email_service.envoyer_email_assignation_travail(
-                destinataire=etudiant.utilisateur.email,
-                prenom=etudiant.utilisateur.prenom,
-                titre_travail=travail.titre,
-                nom_matiere=espace.nom_matiere,
-                formateur=f"{formateur.utilisateur.prenom} {formateur.utilisateur.nom}",
-                date_echeance=travail.date_echeance.strftime("%d/%m/%Y à %H:%M"),
-                description=travail.description
-            )
-        except Exception as e:
-            print(f"Erreur envoi email à {etudiant.utilisateur.email}: {e}")
     
-    db.commit()
+    # Les emails sont envoyés en arrière-plan par le worker de l'outbox
+    email_outbox_worker.notifier()
     
     return {
         "message": "Travail créé et assigné avec succès",
@@ -442,12 +580,15 @@ async def creer_travail(
             "titre": travail.titre,
             "type_travail": travail.type_travail,
             "date_echeance": travail.date_echeance.isoformat(),
-            "nb_assignations": len(assignations_creees)
+            "nb_assignations": len(assignations_creees),
+            "emails_en_file": emails_en_file
         }
     }
 
 @router.get("/travaux/mes-travaux")
 async def mes_travaux_etudiant(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
@@ -459,35 +600,251 @@ async def mes_travaux_etudiant(
             detail="Accès réservé aux étudiants"
         )
     
-    etudiant = db.query(Etudiant).filter(
+    etudiant = db.query(Etudiant.id_etudiant).filter(
         Etudiant.identifiant == current_user.identifiant
     ).first()
     
-    assignations = db.query(Assignation).filter(
+    if not etudiant:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profil étudiant non trouvé"
+        )
+    
+    etag = calculer_etag(
+        db,
+        ["assignation", version_assignations_etudiant(etudiant.id_etudiant),
+         "travail", "espace_pedagogique", "formateur", "utilisateur", "etudiant"],
+        current_user.identifiant
+    )
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    # Assignations, travaux, espaces et formateurs projetés en une seule requête
+    assignations = db.query(
+        Assignation.id_assignation,
+        Assignation.statut,
+        Assignation.date_assignment,
+        Travail.id_travail,
+        Travail.titre,
+        Travail.description,
+        Travail.type_travail,
+        Travail.date_echeance,
+        Travail.note_max,
+        EspacePedagogique.nom_matiere,
+        Utilisateur.nom.label("formateur_nom"),
+        Utilisateur.prenom.label("formateur_prenom")
+    ).join(
+        Travail, Travail.id_travail == Assignation.id_travail
+    ).join(
+        EspacePedagogique, EspacePedagogique.id_espace == Travail.id_espace
+    ).join(
+        Formateur, Formateur.id_formateur == EspacePedagogique.id_formateur
+    ).join(
+        Utilisateur, Utilisateur.identifiant == Formateur.identifiant
+    ).filter(
         Assignation.id_etudiant == etudiant.id_etudiant
     ).all()
     
-    result = []
-    for assignation in assignations:
-        travail = assignation.travail
-        espace = travail.espace_pedagogique
-        
-        result.append({
-            "id_assignation": assignation.id_assignation,
-            "statut": assignation.statut,
-            "date_assignment": assignation.date_assignment.isoformat(),
+    result = [
+        {
+            "id_assignation": a.id_assignation,
+            "statut": a.statut,
+            "date_assignment": a.date_assignment.isoformat(),
             "travail": {
-                "id_travail": travail.id_travail,
-                "titre": travail.titre,
-                "description": travail.description,
-                "type_travail": travail.type_travail,
-                "date_echeance": travail.date_echeance.isoformat(),
-                "note_max": float(travail.note_max)
+                "id_travail": a.id_travail,
+                "titre": a.titre,
+                "description": a.description,
+                "type_travail": a.type_travail,
+                "date_echeance": a.date_echeance.isoformat(),
+                "note_max": float(a.note_max)
             },
             "espace": {
-                "nom_matiere": espace.nom_matiere,
-                "formateur": f"{espace.formateur.utilisateur.prenom} {espace.formateur.utilisateur.nom}"
+                "nom_matiere": a.nom_matiere,
+                "formateur": f"{a.formateur_prenom} {a.formateur_nom}"
             }
-        })
+        } for a in assignations
+    ]
     
-    return {"travaux": result, "total": len(result)}
\ No newline at end of file
+    return {"travaux": result, "total": len(result)}
+
+# ==================== ÉCHÉANCES (ÉTUDIANT ET FORMATEUR) ====================
+
+# Assignations encore à rendre : un travail rendu ou noté n'est ni à venir ni en retard
+STATUTS_A_RENDRE = (StatutAssignationEnum.ASSIGNE, StatutAssignationEnum.EN_COURS)
+
+
+def _travaux_par_echeance(
+    request: Request,
+    response: Response,
+    db: Session,
+    current_user: Utilisateur,
+    en_retard: bool,
+    jours: Optional[int],
+    limite: int,
+    apres: Optional[str]
+):
+    """
+    Travaux à rendre classés par échéance, page par page (curseur sur l'échéance) :
+    - étudiant : ses assignations à rendre (index assignation (id_etudiant, statut)) ;
+    - formateur : les travaux de ses espaces (index travail (id_espace, date_echeance))
+      avec le nombre d'assignations encore à rendre.
+    À venir : échéances croissantes ; en retard : les plus récentes d'abord.
+    """
+    
+    if current_user.role not in (RoleEnum.ETUDIANT, RoleEnum.FORMATEUR):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès réservé aux étudiants et aux formateurs"
+        )
+    
+    # Référence arrondie à la minute : la fenêtre (et l'ETag) reste la même pendant une minute
+    maintenant = datetime.now().replace(second=0, microsecond=0)
+    if en_retard:
+        fenetre = Travail.date_echeance < maintenant
+    else:
+        fenetre = Travail.date_echeance >= maintenant
+        if jours is not None:
+            fenetre = and_(fenetre, Travail.date_echeance < maintenant + timedelta(days=jours))
+    
+    # Profil vérifié avant de répondre, y compris par un 304
+    if current_user.role == RoleEnum.ETUDIANT:
+        etudiant = db.query(Etudiant.id_etudiant).filter(
+            Etudiant.identifiant == current_user.identifiant
+        ).first()
+        if not etudiant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Profil étudiant non trouvé"
+            )
+        versions_assignations = [version_assignations_etudiant(etudiant.id_etudiant)]
+    else:
+        formateur = db.query(Formateur.id_formateur).filter(
+            Formateur.identifiant == current_user.identifiant
+        ).first()
+        if not formateur:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Profil formateur non trouvé"
+            )
+        versions_assignations = [
+            version_assignations_espace(id_espace) for (id_espace,) in db.query(EspacePedagogique.id_espace).filter(
+                EspacePedagogique.id_formateur == formateur.id_formateur
+            )
+        ]
+    
+    etag = calculer_etag(
+        db,
+        ["assignation", *versions_assignations, "travail", "espace_pedagogique", "formateur", "etudiant"],
+        current_user.identifiant, en_retard, maintenant.isoformat(), jours, limite, apres
+    )
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    if current_user.role == RoleEnum.ETUDIANT:
+        requete = db.query(
+            Assignation.id_assignation,
+            Assignation.statut,
+            Travail.id_travail,
+            Travail.titre,
+            Travail.type_travail,
+            Travail.date_echeance,
+            Travail.note_max,
+            EspacePedagogique.id_espace,
+            EspacePedagogique.nom_matiere
+        ).join(
+            Travail, Travail.id_travail == Assignation.id_travail
+        ).join(
+            EspacePedagogique, EspacePedagogique.id_espace == Travail.id_espace
+        ).filter(
+            Assignation.id_etudiant == etudiant.id_etudiant,
+            Assignation.statut.in_(STATUTS_A_RENDRE),
+            fenetre
+        )
+        lignes, page_suivante = paginer(
+            requete, [Travail.date_echeance, Assignation.id_assignation], limite, apres, decroissant=en_retard
+        )
+        travaux = [
+            {
+                "id_assignation": ligne.id_assignation,
+                "statut": ligne.statut,
+                "id_travail": ligne.id_travail,
+                "titre": ligne.titre,
+                "type_travail": ligne.type_travail,
+                "date_echeance": ligne.date_echeance.isoformat(),
+                "note_max": float(ligne.note_max),
+                "espace": {"id_espace": ligne.id_espace, "nom_matiere": ligne.nom_matiere}
+            } for ligne in lignes
+        ]
+    else:
+        nb_a_rendre = func.coalesce(func.sum(case((Assignation.statut.in_(STATUTS_A_RENDRE), 1), else_=0)), 0)
+        colonnes = [
+            Travail.id_travail,
+            Travail.titre,
+            Travail.type_travail,
+            Travail.date_echeance,
+            Travail.note_max,
+            EspacePedagogique.id_espace,
+            EspacePedagogique.nom_matiere
+        ]
+        requete = db.query(
+            *colonnes,
+            func.count(Assignation.id_assignation).label("nb_assignations"),
+            nb_a_rendre.label("nb_a_rendre")
+        ).join(
+            EspacePedagogique, EspacePedagogique.id_espace == Travail.id_espace
+        ).outerjoin(
+            Assignation, Assignation.id_travail == Travail.id_travail
+        ).filter(
+            EspacePedagogique.id_formateur == formateur.id_formateur,
+            fenetre
+        ).group_by(*colonnes)
+        if en_retard:
+            # Seuls les travaux dont au moins une assignation n'a pas été rendue
+            requete = requete.having(nb_a_rendre > 0)
+        lignes, page_suivante = paginer(
+            requete, [Travail.date_echeance, Travail.id_travail], limite, apres, decroissant=en_retard
+        )
+        travaux = [
+            {
+                "id_travail": ligne.id_travail,
+                "titre": ligne.titre,
+                "type_travail": ligne.type_travail,
+                "date_echeance": ligne.date_echeance.isoformat(),
+                "note_max": float(ligne.note_max),
+                "espace": {"id_espace": ligne.id_espace, "nom_matiere": ligne.nom_matiere},
+                "nb_assignations": ligne.nb_assignations,
+                "nb_a_rendre": ligne.nb_a_rendre
+            } for ligne in lignes
+        ]
+    
+    return {"travaux": travaux, "total": len(travaux), "page_suivante": page_suivante}
+
+@router.get("/travaux/a-venir")
+async def travaux_a_venir(
+    request: Request,
+    response: Response,
+    jours: Optional[int] = Query(7, ge=1, le=366),
+    limite: int = Query(50, ge=1, le=500),
+    apres: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """
+    Travaux à rendre dont l'échéance tombe dans les `jours` prochains jours
+    (7 par défaut : "ce qui est dû cette semaine"), par échéance croissante
+    """
+    return _travaux_par_echeance(request, response, db, current_user, False, jours, limite, apres)
+
+@router.get("/travaux/en-retard")
+async def travaux_en_retard(
+    request: Request,
+    response: Response,
+    limite: int = Query(50, ge=1, le=500),
+    apres: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """Travaux non rendus dont l'échéance est passée, les plus récents d'abord"""
+    return _travaux_par_echeance(request, response, db, current_user, True, None, limite, apres)
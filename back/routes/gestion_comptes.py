@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import json
 
 from database.database import get_db
 from models import Utilisateur, Formateur, Etudiant, Promotion, Formation, RoleEnum, StatutEtudiantEnum
@@ -14,12 +16,22 @@ from utils.generators import (
     generer_numero_employe
 )
 from utils.email_service import email_service
+from utils.email_outbox import email_outbox_worker
+from utils.import_comptes import (
+    lire_lignes,
+    importer_etudiants,
+    preparer_import_formateurs,
+    importer_formateurs,
+    FormatImportError
+)
 from utils.promotion_generator import (
-    generer_promotion_automatique,
+    obtenir_id_promotion,
     valider_annee_academique,
     lister_annees_disponibles,
-    lister_promotions_existantes
+    page_promotions
 )
+from utils.pagination import paginer
+from utils.cache_http import calculer_etag, non_modifie
 
 router = APIRouter(prefix="/api/gestion-comptes", tags=["Gestion des comptes"])
 
@@ -67,7 +79,7 @@ async def creer_compte_formateur(
     
     # 2. Génération automatique
     identifiant = generer_identifiant_unique("FORMATEUR")
-    mot_de_passe = generer_mot_de_passe_aleatoire()  # Mot de passe simple A-Z + 0-9
+    mot_de_passe = generer_mot_de_passe_aleatoire()  # Mot de passe temporaire (12 caractères)
     id_formateur = generer_identifiant_unique("FORMATEUR")  # Utiliser la même fonction
     numero_employe = generer_numero_employe()
     # Plus besoin de token d'activation
@@ -109,7 +121,7 @@ async def creer_compte_formateur(
         )
     
     # 6. Envoi email avec identifiants
-    email_envoye = email_service.envoyer_email_creation_compte(
+    email_envoye = await email_service.envoyer_email_creation_compte_async(
         destinataire=formateur_data.email,
         prenom=formateur_data.prenom,
         email=formateur_data.email,
@@ -157,7 +169,7 @@ async def creer_compte_etudiant(
     
     # Générer automatiquement la promotion pour cette année
     try:
-        promotion = generer_promotion_automatique(db, etudiant_data.annee_academique)
+        id_promotion = obtenir_id_promotion(db, etudiant_data.annee_academique)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -166,7 +178,7 @@ async def creer_compte_etudiant(
     
     # 2. Génération automatique
     identifiant = generer_identifiant_unique("ETUDIANT")
-    mot_de_passe = generer_mot_de_passe_aleatoire()  # Mot de passe simple A-Z + 0-9
+    mot_de_passe = generer_mot_de_passe_aleatoire()  # Mot de passe temporaire (12 caractères)
     id_etudiant = generer_identifiant_unique("ETUDIANT")  # Utiliser la même fonction
     matricule = generer_matricule_unique()
     # Plus besoin de token d'activation
@@ -190,7 +202,7 @@ async def creer_compte_etudiant(
         id_etudiant=id_etudiant,
         identifiant=identifiant,  # Ce champ lie à Utilisateur.identifiant
         matricule=matricule,
-        id_promotion=promotion.id_promotion,
+        id_promotion=id_promotion,
         date_inscription=datetime.utcnow().date(),
         statut=StatutEtudiantEnum.ACTIF
     )
@@ -210,7 +222,7 @@ async def creer_compte_etudiant(
         )
     
     # 6. Envoi email avec identifiants
-    email_envoye = email_service.envoyer_email_creation_compte(
+    email_envoye = await email_service.envoyer_email_creation_compte_async(
         destinataire=etudiant_data.email,
         prenom=etudiant_data.prenom,
         email=etudiant_data.email,
@@ -226,6 +238,78 @@ async def creer_compte_etudiant(
         "matricule": matricule
     }
 
+@router.post("/importer-etudiants")
+async def importer_comptes_etudiants(
+    fichier: UploadFile = File(...),
+    annee_academique: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """
+    Import en masse d'étudiants depuis un fichier CSV ou XLSX (réservé au DE)
+    Colonnes : email, nom, prenom et annee_academique (ou annee_academique pour tout le fichier)
+    """
+    
+    if current_user.role != RoleEnum.DE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul un Directeur d'Établissement peut créer des comptes étudiants"
+        )
+    
+    try:
+        rapport = importer_etudiants(
+            db, lire_lignes(fichier.file, fichier.filename or ""), annee_academique
+        )
+    except FormatImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    # Les emails d'identifiants sont envoyés en arrière-plan par le worker de l'outbox
+    if rapport["crees"]:
+        email_outbox_worker.notifier()
+    
+    return {
+        "message": f"{rapport['crees']} compte(s) étudiant(s) créé(s), {rapport['erreurs']} ligne(s) en erreur",
+        **rapport
+    }
+
+@router.post("/importer-formateurs")
+async def importer_comptes_formateurs(
+    fichier: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """
+    Import en masse de formateurs depuis un fichier CSV ou XLSX (réservé au DE)
+    Colonnes : email, nom, prenom et specialite (facultative)
+    Réponse en flux NDJSON : une ligne d'avancement par lot, puis le rapport final
+    """
+    
+    if current_user.role != RoleEnum.DE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul un Directeur d'Établissement peut créer des comptes formateurs"
+        )
+    
+    # Le fichier est entièrement validé avant de commencer la réponse en flux
+    try:
+        a_importer, rapport = preparer_import_formateurs(lire_lignes(fichier.file, fichier.filename or ""))
+    except FormatImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    def flux():
+        for evenement in importer_formateurs(db, a_importer, rapport):
+            if evenement["type"] == "rapport" and evenement["crees"]:
+                email_outbox_worker.notifier()
+            yield json.dumps(evenement, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(flux(), media_type="application/x-ndjson")
+
 # Route d'activation supprimée - plus nécessaire avec la nouvelle logique
 
 @router.get("/annees-academiques")
@@ -250,10 +334,19 @@ async def lister_annees_academiques(
 
 @router.get("/promotions")
 async def lister_promotions(
+    request: Request,
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=500),
+    apres: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
-    """Liste toutes les promotions existantes"""
+    """
+    Liste les promotions existantes (plus récentes d'abord)
+
+    - limite / apres : pagination par curseur, sans limite toutes les promotions sont renvoyées
+    - ETag : répond 304 si If-None-Match correspond et que rien n'a changé
+    """
     
     if current_user.role != RoleEnum.DE:
         raise HTTPException(
@@ -261,19 +354,29 @@ async def lister_promotions(
             detail="Seul un DE peut accéder à cette information"
         )
     
-    promotions = lister_promotions_existantes(db)
+    etag = calculer_etag(db, ["promotion", "formation"], limite, apres)
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    promotions, page_suivante = page_promotions(db, limite, apres)
     
     return {
         "promotions": promotions,
-        "total": len(promotions)
+        "total": len(promotions),
+        "page_suivante": page_suivante
     }
 
 @router.get("/formations")
 async def lister_formations(
+    request: Request,
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=500),
+    apres: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
-    """Liste toutes les formations disponibles"""
+    """Liste les formations disponibles (par nom, pagination par curseur, ETag)"""
     
     if current_user.role != RoleEnum.DE:
         raise HTTPException(
@@ -281,7 +384,19 @@ async def lister_formations(
             detail="Seul un DE peut accéder à cette information"
         )
     
-    formations = db.query(Formation).all()
+    etag = calculer_etag(db, ["formation"], limite, apres)
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    requete = db.query(
+        Formation.id_formation,
+        Formation.nom_formation,
+        Formation.description
+    )
+    formations, page_suivante = paginer(
+        requete, [Formation.nom_formation, Formation.id_formation], limite, apres
+    )
     
     return {
         "formations": [
@@ -290,15 +405,20 @@ async def lister_formations(
                 "nom_formation": f.nom_formation,
                 "description": f.description
             } for f in formations
-        ]
+        ],
+        "page_suivante": page_suivante
     }
 
 @router.get("/formateurs")
 async def lister_formateurs(
+    request: Request,
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=500),
+    apres: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Utilisateur = Depends(get_current_user)
 ):
-    """Liste tous les formateurs disponibles"""
+    """Liste les formateurs disponibles (par nom, pagination par curseur, ETag)"""
     
     if current_user.role != RoleEnum.DE:
         raise HTTPException(
@@ -306,19 +426,38 @@ async def lister_formateurs(
             detail="Seul un DE peut accéder à cette information"
         )
     
-    formateurs = db.query(Formateur).join(Utilisateur).all()
+    etag = calculer_etag(db, ["formateur", "utilisateur"], limite, apres)
+    reponse_304 = non_modifie(request, response, etag)
+    if reponse_304:
+        return reponse_304
+    
+    # Colonnes utiles uniquement, en une requête
+    requete = db.query(
+        Formateur.id_formateur,
+        Formateur.specialite,
+        Formateur.numero_employe,
+        Utilisateur.nom,
+        Utilisateur.prenom,
+        Utilisateur.email
+    ).join(
+        Utilisateur, Utilisateur.identifiant == Formateur.identifiant
+    )
+    formateurs, page_suivante = paginer(
+        requete, [Utilisateur.nom, Utilisateur.prenom, Formateur.id_formateur], limite, apres
+    )
     
     return {
         "formateurs": [
             {
                 "id_formateur": f.id_formateur,
-                "nom": f.utilisateur.nom,
-                "prenom": f.utilisateur.prenom,
-                "email": f.utilisateur.email,
+                "nom": f.nom,
+                "prenom": f.prenom,
+                "email": f.email,
                 "specialite": f.specialite,
                 "numero_employe": f.numero_employe
             } for f in formateurs
-        ]
+        ],
+        "page_suivante": page_suivante
     }
 
 @router.post("/configurer-email")
@@ -337,3 +476,18 @@ async def configurer_email_service(
     email_service.configurer_mot_de_passe(mot_de_passe)
     
     return {"message": "Service email configuré avec succès"}
+
+
+@router.get("/email/metriques")
+async def metriques_email(
+    current_user: Utilisateur = Depends(get_current_user)
+):
+    """Files d'envoi, quotas restants et état du disjoncteur SMTP (réservé au DE)"""
+    
+    if current_user.role != RoleEnum.DE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul un DE peut consulter les métriques email"
+        )
+    
+    return email_service.metriques()
@@ -1,9 +1,11 @@
 import pytest
+from datetime import date
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from database.database import Base, get_db
-from main import app
+import models  # noqa: F401 (tables déclarées sur Base)
 
 # Base de données de test
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -27,9 +29,93 @@ def db_session(db):
     finally:
         session.close()
 
+@pytest.fixture
+def moteur_sqlite():
+    """Base SQLite en mémoire, toutes tables créées (une connexion partagée entre threads)"""
+    moteur = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=moteur)
+    yield moteur
+    moteur.dispose()
+
+@pytest.fixture
+def fabrique_sqlite(moteur_sqlite):
+    """Fabrique de sessions sur la base en mémoire (plusieurs sessions = plusieurs processus)"""
+    return sessionmaker(bind=moteur_sqlite)
+
+@pytest.fixture
+def session_sqlite(fabrique_sqlite):
+    """Session sur une base SQLite en mémoire vierge"""
+    session = fabrique_sqlite()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def base_espace(session_sqlite):
+    """Une promotion de 3 étudiants, un espace tenu par FMT_1, un autre formateur et un compte sans profil"""
+    from models import Utilisateur, Formateur, Etudiant, Formation, Promotion, EspacePedagogique, RoleEnum
+    
+    session = session_sqlite
+    session.add(Formation(id_formation="F_1", nom_formation="Génie logiciel", date_debut=date(2024, 9, 1)))
+    session.add(Promotion(id_promotion="P_1", id_formation="F_1", annee_academique="2024-2025",
+                          libelle="Promotion 2024", date_debut=date(2024, 9, 1), date_fin=date(2025, 6, 30)))
+    for identifiant, id_formateur in [("U_FMT", "FMT_1"), ("U_FMT2", "FMT_2"), ("U_SANS", None)]:
+        session.add(Utilisateur(identifiant=identifiant, email=f"{identifiant.lower()}@test.com",
+                                mot_de_passe="x", nom="Formateur", prenom=identifiant,
+                                role=RoleEnum.FORMATEUR))
+        if id_formateur:
+            session.add(Formateur(id_formateur=id_formateur, identifiant=identifiant))
+    session.add(EspacePedagogique(id_espace="ESP_1", id_promotion="P_1", nom_matiere="Algorithmique",
+                                  id_formateur="FMT_1"))
+    for i, nom in enumerate(["Martin", "Bernard", "Durand"]):
+        session.add(Utilisateur(identifiant=f"U_{i}", email=f"etudiant{i}@test.com", mot_de_passe="x",
+                                nom=nom, prenom=f"Prenom{i}", role=RoleEnum.ETUDIANT))
+        session.add(Etudiant(id_etudiant=f"E_{i}", identifiant=f"U_{i}", matricule=f"MAT{i:03d}",
+                             id_promotion="P_1", date_inscription=date(2024, 9, 1)))
+    session.commit()
+    return session
+
+@pytest.fixture
+def client_sqlite(fabrique_sqlite):
+    """Client des routeurs métier sur la base en mémoire, sans charger main"""
+    from fastapi import FastAPI
+    from routes import dashboard, espaces_pedagogiques, gestion_comptes
+    from utils.cache_dashboard import cache_dashboard
+    
+    app = FastAPI()
+    for module in (dashboard, espaces_pedagogiques, gestion_comptes):
+        app.include_router(module.router)
+    
+    def override_get_db():
+        session = fabrique_sqlite()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    app.dependency_overrides[get_db] = override_get_db
+    cache_dashboard.vider()
+    with TestClient(app) as test_client:
+        yield test_client
+    cache_dashboard.vider()
+
+@pytest.fixture
+def entetes_auth():
+    """Fabrique de l'en-tête Authorization portant un jeton valide pour un utilisateur"""
+    from core.jwt import create_access_token
+    
+    def entetes(identifiant: str) -> dict:
+        return {"Authorization": f"Bearer {create_access_token({'sub': identifiant})}"}
+    
+    return entetes
+
 @pytest.fixture
 def client(db_session):
     """Client de test avec base de données mockée"""
+    # Import local : main se connecte à la base MySQL au chargement
+    from main import app
+    
     def override_get_db():
         try:
             yield db_session
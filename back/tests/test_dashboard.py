@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+from models import (
+    Utilisateur, Etudiant, EspacePedagogique, Travail, Assignation,
+    RoleEnum, StatutEtudiantEnum, TypeTravailEnum, StatutAssignationEnum
+)
+
+
+class TestDashboardEtudiant:
+    """Tests du dashboard étudiant"""
+
+    URL = "/api/dashboard/etudiant"
+
+    def test_travaux_echus_et_a_venir(self, client_sqlite, base_espace, entetes_auth):
+        """Comme à l'origine : les 10 premiers travaux par échéance, échus compris et signalés en retard"""
+        maintenant = datetime.now().replace(microsecond=0)
+        echeances = [maintenant + timedelta(days=jours) for jours in (-3, -2, -1, 1, 2, 3, 4, 5, 6, 7, 8, 9)]
+        for i, echeance in sorted(enumerate(echeances), reverse=True):
+            base_espace.add(Travail(id_travail=f"T{i:02d}", id_espace="ESP_1", titre=f"Travail {i}",
+                                    description="Consigne", type_travail=TypeTravailEnum.INDIVIDUEL,
+                                    date_echeance=echeance))
+            base_espace.add(Assignation(id_assignation=f"A{i:02d}", id_etudiant="E_0", id_travail=f"T{i:02d}",
+                                        statut=StatutAssignationEnum.RENDU if i == 0 else StatutAssignationEnum.ASSIGNE))
+        base_espace.commit()
+
+        reponse = client_sqlite.get(self.URL, headers=entetes_auth("U_0"))
+
+        assert reponse.status_code == 200
+        travaux = reponse.json()["travaux"]
+        assert [t["titre"] for t in travaux] == [f"Travail {i}" for i in range(10)]
+        assert [t["date_echeance"] for t in travaux] == [e.isoformat() for e in echeances[:10]]
+        assert [t["en_retard"] for t in travaux] == [False, True, True] + [False] * 7
+        assert reponse.json()["statistiques"]["travaux_en_retard"] == 2
+
+
+class TestDashboardDE:
+    """Tests du dashboard du DE"""
+
+    URL = "/api/dashboard/de"
+
+    def test_statistiques_comme_a_l_origine(self, client_sqlite, base_espace, entetes_auth):
+        """Les six compteurs d'origine, tenus à jour après une modification"""
+        from utils.statistiques import initialiser_statistiques
+
+        base_espace.add(Utilisateur(identifiant="U_DE", email="de@test.com", mot_de_passe="x",
+                                    nom="Directeur", prenom="Test", role=RoleEnum.DE))
+        base_espace.commit()
+        initialiser_statistiques(base_espace)
+        base_espace.get(Etudiant, "E_2").statut = StatutEtudiantEnum.SUSPENDU
+        base_espace.commit()
+
+        reponse = client_sqlite.get(self.URL, headers=entetes_auth("U_DE"))
+
+        assert reponse.status_code == 200
+        statistiques = reponse.json()["statistiques"]
+        assert {cle: statistiques[cle] for cle in (
+            "total_formateurs", "total_etudiants", "total_promotions", "total_formations",
+            "etudiants_actifs", "etudiants_suspendus"
+        )} == {
+            "total_formateurs": 2, "total_etudiants": 3, "total_promotions": 1, "total_formations": 1,
+            "etudiants_actifs": 2, "etudiants_suspendus": 1
+        }
+        assert [p["id_promotion"] for p in reponse.json()["promotions_recentes"]] == ["P_1"]
+        assert {u["identifiant"] for u in reponse.json()["comptes_recents"]} == {
+            "U_FMT", "U_FMT2", "U_SANS", "U_0", "U_1", "U_2"
+        }
+
+
+class TestDashboardFormateur:
+    """Tests du dashboard formateur"""
+
+    URL = "/api/dashboard/formateur"
+
+    def test_compteurs_comme_a_l_origine(self, client_sqlite, base_espace, entetes_auth):
+        """Compteurs globaux et par espace, assignations à corriger et travaux récents d'origine"""
+        base_espace.add(EspacePedagogique(id_espace="ESP_2", id_promotion="P_1", nom_matiere="Réseaux",
+                                          id_formateur="FMT_1", date_creation=datetime(2024, 9, 2)))
+        base_espace.add(EspacePedagogique(id_espace="ESP_3", id_promotion="P_1", nom_matiere="Autre",
+                                          id_formateur="FMT_2"))
+        for i, id_espace in enumerate(["ESP_1", "ESP_1", "ESP_3"]):
+            base_espace.add(Travail(id_travail=f"T{i}", id_espace=id_espace, titre=f"Travail {i}",
+                                    description="Consigne", type_travail=TypeTravailEnum.INDIVIDUEL,
+                                    date_echeance=datetime(2030, 1, 15), date_creation=datetime(2024, 10, 1 + i)))
+        for j, (id_travail, statut) in enumerate([("T0", StatutAssignationEnum.RENDU),
+                                                  ("T1", StatutAssignationEnum.RENDU),
+                                                  ("T1", StatutAssignationEnum.ASSIGNE),
+                                                  ("T2", StatutAssignationEnum.RENDU)]):
+            base_espace.add(Assignation(id_assignation=f"A{j}", id_etudiant=f"E_{j % 3}", id_travail=id_travail,
+                                        statut=statut))
+        base_espace.commit()
+
+        reponse = client_sqlite.get(self.URL, headers=entetes_auth("U_FMT"))
+
+        assert reponse.status_code == 200
+        corps = reponse.json()
+        assert corps["statistiques"] == {
+            "total_espaces": 2, "total_travaux": 2, "total_etudiants": 3, "assignations_a_corriger": 2
+        }
+        espaces = {e["id_espace"]: e for e in corps["espaces_pedagogiques"]}
+        assert espaces["ESP_2"] == {
+            "id_espace": "ESP_2", "nom_matiere": "Réseaux", "description": None, "promotion": "Promotion 2024",
+            "nombre_travaux": 0, "nombre_etudiants": 3, "code_acces": espaces["ESP_2"]["code_acces"],
+            "date_creation": "2024-09-02T00:00:00"
+        }
+        assert (espaces["ESP_1"]["nombre_travaux"], espaces["ESP_1"]["nombre_etudiants"]) == (2, 3)
+        assert [(t["id_travail"], t["espace"]) for t in corps["travaux_recents"]] == [
+            ("T1", "Algorithmique"), ("T0", "Algorithmique")
+        ]
@@ -0,0 +1,153 @@
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+
+from models import Travail, Assignation, EmailOutbox, TypeTravailEnum
+from utils.cache_http import calculer_etag
+
+
+class TestListerEtudiantsEspace:
+    """Tests de /espace/{id_espace}/etudiants"""
+
+    URL = "/api/espaces-pedagogiques/espace/ESP_1/etudiants"
+
+    def test_liste_triee_par_nom(self, client_sqlite, base_espace, entetes_auth):
+        """Mêmes champs que la version d'origine, étudiants triés par nom"""
+        reponse = client_sqlite.get(self.URL, headers=entetes_auth("U_FMT"))
+        assert reponse.status_code == 200
+        corps = reponse.json()
+        assert corps["espace"] == {"id_espace": "ESP_1", "nom_matiere": "Algorithmique",
+                                   "promotion": "Promotion 2024"}
+        assert [e["nom"] for e in corps["etudiants"]] == ["Bernard", "Durand", "Martin"]
+        assert corps["etudiants"][0] == {
+            "id_etudiant": "E_1", "nom": "Bernard", "prenom": "Prenom1", "matricule": "MAT001",
+            "email": "etudiant1@test.com", "statut": "ACTIF", "nb_travaux_assignes": 0
+        }
+        assert corps["total"] == 3
+
+    def test_controle_d_acces_avant_le_304(self, client_sqlite, base_espace, entetes_auth):
+        """Un ETag valide ne dispense pas du contrôle du profil et de la propriété de l'espace"""
+        etag = client_sqlite.get(self.URL, headers=entetes_auth("U_FMT")).headers["ETag"]
+
+        assert client_sqlite.get(self.URL, headers={**entetes_auth("U_FMT"), "If-None-Match": etag}).status_code == 304
+        for intrus in ["U_FMT2", "U_SANS"]:
+            reponse = client_sqlite.get(self.URL, headers={**entetes_auth(intrus), "If-None-Match": etag})
+            assert reponse.status_code == 404
+
+
+class TestMesEspaces:
+    """Tests de /mes-espaces"""
+
+    URL = "/api/espaces-pedagogiques/mes-espaces"
+
+    def test_profil_verifie_avant_le_304(self, client_sqlite, base_espace, entetes_auth):
+        """Un compte formateur sans profil reçoit 404 même en présentant l'ETag d'un autre"""
+        reponse = client_sqlite.get(self.URL, headers=entetes_auth("U_FMT"))
+        assert reponse.status_code == 200
+        assert [e["nb_etudiants"] for e in reponse.json()["espaces"]] == [3]
+
+        # ETag que la route calculerait pour ce compte : il ne doit pas suffire à obtenir un 304
+        etag = calculer_etag(
+            base_espace,
+            ["espace_pedagogique", "promotion", "formation", "formateur", "etudiant", "utilisateur", "travail"],
+            "U_SANS", None
+        )
+        entetes = {**entetes_auth("U_SANS"), "If-None-Match": etag}
+        assert client_sqlite.get(self.URL, headers=entetes).status_code == 404
+
+    def test_resume_par_defaut_et_etudiants_sur_demande(self, client_sqlite, base_espace, entetes_auth):
+        """Compteurs seuls par défaut ; include=etudiants rend la liste d'origine"""
+        espace = client_sqlite.get(self.URL, headers=entetes_auth("U_FMT")).json()["espaces"][0]
+        assert espace == {
+            "id_espace": "ESP_1", "nom_matiere": "Algorithmique", "description": espace["description"],
+            "code_acces": espace["code_acces"], "promotion": "Promotion 2024",
+            "formation": espace["formation"], "nb_etudiants": 3, "nb_travaux": 0
+        }
+
+        reponse = client_sqlite.get(self.URL, params={"include": "etudiants"}, headers=entetes_auth("U_FMT"))
+        assert reponse.status_code == 200
+        etudiants = reponse.json()["espaces"][0]["etudiants"]
+        assert sorted(e["id_etudiant"] for e in etudiants) == ["E_0", "E_1", "E_2"]
+        assert next(e for e in etudiants if e["id_etudiant"] == "E_2") == {
+            "id_etudiant": "E_2", "nom": "Durand", "prenom": "Prenom2",
+            "matricule": "MAT002", "email": "etudiant2@test.com"
+        }
+
+
+class TestCreerTravail:
+    """Tests de /travaux/creer"""
+
+    URL = "/api/espaces-pedagogiques/travaux/creer"
+
+    def test_une_assignation_et_un_email_par_etudiant_en_une_transaction(
+        self, client_sqlite, base_espace, fabrique_sqlite, entetes_auth
+    ):
+        """Le travail, ses assignations et les emails en file sont validés par un seul commit"""
+        commits = []
+        event.listen(fabrique_sqlite, "after_commit", commits.append)
+
+        reponse = client_sqlite.post(self.URL, headers=entetes_auth("U_FMT"), json={
+            "id_espace": "ESP_1", "titre": "TP1", "description": "Premier TP",
+            "type_travail": "INDIVIDUEL", "date_echeance": "2030-01-15T23:59:00"
+        })
+
+        assert reponse.status_code == 200
+        assert reponse.json()["travail"]["nb_assignations"] == 3
+        assert reponse.json()["travail"]["emails_en_file"] == 3
+        assert len(commits) == 1
+
+        session = fabrique_sqlite()
+        try:
+            assert session.scalar(select(func.count()).select_from(Travail)) == 1
+            assert sorted(session.scalars(select(Assignation.id_etudiant))) == ["E_0", "E_1", "E_2"]
+            assert sorted(session.scalars(select(EmailOutbox.destinataire))) == [
+                "etudiant0@test.com", "etudiant1@test.com", "etudiant2@test.com"
+            ]
+        finally:
+            session.close()
+
+
+class TestVuesEtudiant:
+    """Tests de /mes-cours et /travaux/mes-travaux"""
+
+    def _un_travail_assigne(self, session):
+        session.add(Travail(id_travail="T_1", id_espace="ESP_1", titre="TP1", description="Premier TP",
+                            type_travail=TypeTravailEnum.INDIVIDUEL, date_echeance=datetime(2030, 1, 15, 23, 59)))
+        session.add(Assignation(id_assignation="A_1", id_etudiant="E_0", id_travail="T_1",
+                                date_assignment=datetime(2029, 12, 1, 8, 0)))
+        session.commit()
+
+    def test_mes_cours_comme_a_l_origine(self, client_sqlite, base_espace, entetes_auth):
+        """Mêmes champs et compteurs que la version d'origine"""
+        self._un_travail_assigne(base_espace)
+
+        reponse = client_sqlite.get("/api/espaces-pedagogiques/mes-cours", headers=entetes_auth("U_0"))
+
+        assert reponse.status_code == 200
+        corps = reponse.json()
+        assert corps["total"] == 1
+        assert corps["cours"][0] == {
+            "id_espace": "ESP_1", "nom_matiere": "Algorithmique", "description": None,
+            "code_acces": corps["cours"][0]["code_acces"], "formation": "Génie logiciel",
+            "formateur": {"nom": "Formateur", "prenom": "U_FMT", "email": "u_fmt@test.com"},
+            "nb_travaux_total": 1, "nb_mes_travaux": 1
+        }
+        autre = client_sqlite.get("/api/espaces-pedagogiques/mes-cours", headers=entetes_auth("U_1")).json()
+        assert autre["cours"][0]["nb_mes_travaux"] == 0
+
+    def test_mes_travaux_comme_a_l_origine(self, client_sqlite, base_espace, entetes_auth):
+        """Mêmes champs que la version d'origine, sans les assignations des autres étudiants"""
+        self._un_travail_assigne(base_espace)
+
+        reponse = client_sqlite.get("/api/espaces-pedagogiques/travaux/mes-travaux", headers=entetes_auth("U_0"))
+
+        assert reponse.status_code == 200
+        assert reponse.json() == {"travaux": [{
+            "id_assignation": "A_1", "statut": "ASSIGNE", "date_assignment": "2029-12-01T08:00:00",
+            "travail": {"id_travail": "T_1", "titre": "TP1", "description": "Premier TP",
+                        "type_travail": "INDIVIDUEL", "date_echeance": "2030-01-15T23:59:00",
+                        "note_max": 20.0},
+            "espace": {"nom_matiere": "Algorithmique", "formateur": "U_FMT Formateur"}
+        }], "total": 1}
+        autre = client_sqlite.get("/api/espaces-pedagogiques/travaux/mes-travaux", headers=entetes_auth("U_1"))
+        assert autre.json() == {"travaux": [], "total": 0}
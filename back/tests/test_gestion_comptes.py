@@ -183,6 +183,61 @@ class TestCreationCompteEtudiant:
             assert "matricule" in data
             assert "identifiant" in data
 
+class TestImportEtudiants:
+    """Tests pour l'import en masse d'étudiants (CSV)"""
+
+    def test_rapport_par_ligne_et_comptes_comme_a_l_unite(self, client_sqlite, base_espace, entetes_auth):
+        """Chaque ligne est créée ou rejetée avec son motif ; les comptes sont ceux de /creer-etudiant"""
+        from models import EmailOutbox, Promotion
+
+        base_espace.add(Utilisateur(identifiant="U_DE", email="de@test.com", mot_de_passe="x",
+                                    nom="Directeur", prenom="Test", role=RoleEnum.DE))
+        base_espace.commit()
+        fichier = (
+            "email,nom,prenom,annee_academique\n"
+            "sophie@test.com,Martin,Sophie,2025-2026\n"
+            "etudiant0@test.com,Martin,Paul,2025-2026\n"
+            "pas-un-email,Durand,Léa,2025-2026\n"
+            "marc@test.com,Petit,Marc,2025\n"
+        ).encode("utf-8")
+
+        response = client_sqlite.post(
+            "/api/gestion-comptes/importer-etudiants",
+            files={"fichier": ("etudiants.csv", fichier, "text/csv")},
+            headers=entetes_auth("U_DE")
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["total"], data["crees"], data["erreurs"]) == (4, 1, 3)
+        assert [(ligne["ligne"], ligne["statut"]) for ligne in data["lignes"]] == [
+            (2, "CREE"), (3, "ERREUR"), (4, "ERREUR"), (5, "ERREUR")
+        ]
+        assert data["lignes"][1]["erreur"] == "Cet email est déjà utilisé"
+        assert data["lignes"][2]["erreur"] == "Email invalide"
+
+        # Même compte qu'une création unitaire : actif, mot de passe temporaire, promotion de l'année
+        base_espace.expire_all()
+        utilisateur = base_espace.query(Utilisateur).filter(Utilisateur.email == "sophie@test.com").one()
+        assert utilisateur.role == RoleEnum.ETUDIANT
+        assert utilisateur.actif and utilisateur.mot_de_passe_temporaire
+        etudiant = base_espace.query(Etudiant).filter(Etudiant.identifiant == utilisateur.identifiant).one()
+        assert etudiant.id_etudiant == data["lignes"][0]["id_etudiant"]
+        assert etudiant.matricule == data["lignes"][0]["matricule"]
+        assert etudiant.statut == StatutEtudiantEnum.ACTIF
+        assert base_espace.get(Promotion, etudiant.id_promotion).annee_academique == "2025-2026"
+        assert [e.destinataire for e in base_espace.query(EmailOutbox)] == ["sophie@test.com"]
+
+    def test_reserve_au_de(self, client_sqlite, base_espace, entetes_auth):
+        """Comme /creer-etudiant, l'import est refusé aux autres rôles"""
+        response = client_sqlite.post(
+            "/api/gestion-comptes/importer-etudiants",
+            files={"fichier": ("etudiants.csv", b"email,nom,prenom\n", "text/csv")},
+            headers=entetes_auth("U_FMT")
+        )
+
+        assert response.status_code == 403
+
 class TestActivationCompte:
     """Tests pour l'activation de compte"""
     
@@ -279,8 +334,39 @@ class TestEmailService:
         mock_server.starttls.assert_called_once()
         mock_server.login.assert_called_once()
         mock_server.send_message.assert_called_once()
+        # La session reste ouverte dans le pool jusqu'à sa réinitialisation
+        mock_server.quit.assert_not_called()
+        service.reinitialiser_pool()
         mock_server.quit.assert_called_once()
 
+    @patch('smtplib.SMTP')
+    def test_envoi_emails_reutilise_la_session(self, mock_smtp):
+        """Test plusieurs envois sur une même session SMTP authentifiée"""
+        from utils.email_service import EmailService
+        
+        mock_server = MagicMock()
+        mock_server.noop.return_value = (250, b"OK")
+        mock_smtp.return_value = mock_server
+        
+        service = EmailService()
+        service.configurer_mot_de_passe("test_password")
+        service.configurer_pool(max_messages_par_connexion=2)
+        
+        for i in range(3):
+            assert service.envoyer_email_creation_compte(
+                destinataire=f"test{i}@test.com",
+                prenom="Test",
+                email=f"test{i}@test.com",
+                mot_de_passe="Pass123!",
+                role="FORMATEUR"
+            ) == True
+        
+        # 2 messages max par session : une session fermée puis une nouvelle ouverte
+        assert mock_smtp.call_count == 2
+        assert mock_server.login.call_count == 2
+        assert mock_server.send_message.call_count == 3
+        assert mock_server.quit.call_count == 1
+
     def test_envoi_email_sans_mot_de_passe(self):
         """Test envoi email sans mot de passe configuré"""
         from utils.email_service import EmailService
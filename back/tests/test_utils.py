@@ -4,7 +4,7 @@ from datetime import datetime, timedelta
 
 from utils.generators import (
     generer_identifiant_unique,
-    generer_mot_de_passe_aléatoire,
+    generer_mot_de_passe_aleatoire,
     generer_token_activation,
     generer_matricule_unique,
     generer_numero_employe
@@ -31,9 +31,9 @@ class TestGenerators:
         assert identifiant.startswith("ETD_")
         assert len(identifiant) > 10
     
-    def test_generer_mot_de_passe_aléatoire(self):
+    def test_generer_mot_de_passe_aleatoire(self):
         """Test génération mot de passe"""
-        mot_de_passe = generer_mot_de_passe_aléatoire()
+        mot_de_passe = generer_mot_de_passe_aleatoire()
         
         assert len(mot_de_passe) == 12  # Longueur par défaut
         assert any(c.isupper() for c in mot_de_passe)  # Contient des majuscules
@@ -42,12 +42,12 @@ class TestGenerators:
         assert any(c in "!@#$%&*" for c in mot_de_passe)  # Contient des caractères spéciaux
         
         # Vérifier que chaque génération est différente
-        mot_de_passe2 = generer_mot_de_passe_aléatoire()
+        mot_de_passe2 = generer_mot_de_passe_aleatoire()
         assert mot_de_passe != mot_de_passe2
     
     def test_generer_mot_de_passe_longueur_personnalisée(self):
         """Test génération mot de passe avec longueur personnalisée"""
-        mot_de_passe = generer_mot_de_passe_aléatoire(16)
+        mot_de_passe = generer_mot_de_passe_aleatoire(16)
         assert len(mot_de_passe) == 16
     
     def test_generer_token_activation(self):
@@ -186,5 +186,771 @@ class TestTokenValidation:
         with pytest.raises(Exception):  # Doit lever une exception
             verify_token(token_expiré)
 
+class TestModelesEmail:
+    """Tests pour les modèles d'emails précompilés"""
+    
+    def test_rendu_partiel_puis_encodage_identique_au_rendu_complet(self):
+        """Le corps pré-encodé doit donner le même texte qu'un rendu direct"""
+        import email.quoprimime
+        from utils.email_templates import MODELE_ASSIGNATION_TRAVAIL
+        
+        champs_travail = {
+            "titre_travail": "TP Algèbre",
+            "nom_matiere": "Mathématiques",
+            "formateur": "Zoé Durand",
+            "date_echeance": "01/12/2026 à 10:00",
+            "description": "Lire le chapitre 3.\nRésoudre les exercices."
+        }
+        corps = MODELE_ASSIGNATION_TRAVAIL.partiel(**champs_travail).encodage()
+        
+        # Seule la ligne contenant le prénom reste à rendre
+        assert [b.champs for b in corps.blocs if not isinstance(b, str)] == [{"prenom"}]
+        
+        texte = email.quoprimime.body_decode(corps.encoder(prenom="Éloïse"))
+        attendu = MODELE_ASSIGNATION_TRAVAIL.rendre(prenom="Éloïse", **champs_travail)
+        assert texte.encode("latin-1").decode("utf-8") == attendu
+    
+    def test_preparation_mise_en_cache_par_travail(self):
+        """Les parties communes d'un travail ne sont préparées qu'une fois"""
+        from utils.email_templates import preparer_assignation_travail
+        
+        preparer_assignation_travail.cache_clear()
+        for _ in range(3):
+            preparer_assignation_travail("TP", "Maths", "Zoé Durand", "01/12/2026", "Description")
+        
+        assert preparer_assignation_travail.cache_info().misses == 1
+        assert preparer_assignation_travail.cache_info().hits == 2
+
+class TestServeurSMTPLocal:
+    """Tests pour le serveur SMTP local utilisé par les benchmarks"""
+    
+    def test_reception_et_echec_injecte(self):
+        """Les messages sont reçus ; un taux d'échec de 100% renvoie une erreur 451"""
+        import smtplib
+        from utils.smtp_local import ServeurSMTPLocal
+        
+        with ServeurSMTPLocal() as serveur:
+            with smtplib.SMTP(serveur.hote, serveur.port) as smtp:
+                smtp.login("test", "test")
+                smtp.sendmail("de@example.com", ["etudiant@example.com"], "Subject: Test\r\n\r\nBonjour")
+            assert serveur.statistiques["messages_recus"] == 1
+            assert b"Bonjour" in serveur.messages[0]
+            
+            serveur.taux_echec = 1.0
+            with smtplib.SMTP(serveur.hote, serveur.port) as smtp:
+                with pytest.raises(smtplib.SMTPDataError) as erreur:
+                    smtp.sendmail("de@example.com", ["etudiant@example.com"], "Subject: Test\r\n\r\nBonjour")
+            assert erreur.value.smtp_code == 451
+            assert serveur.statistiques["echecs_injectes"] == 1
+
+class TestEmailServiceAsync:
+    """Tests de l'API awaitable du service email"""
+
+    def _service(self, serveur):
+        from utils.email_service import EmailService
+
+        service = EmailService()
+        service.smtp_server, service.smtp_port, service.smtp_starttls = serveur.hote, serveur.port, False
+        return service
+
+    def test_envoi_sans_bloquer_la_boucle(self):
+        """Même email qu'à l'origine ; la boucle reste libre pendant l'envoi"""
+        import asyncio
+        import email
+        import email.policy
+        from utils.smtp_local import ServeurSMTPLocal
+
+        async def scenario(service):
+            battements = []
+
+            async def battre():
+                while True:
+                    battements.append(1)
+                    await asyncio.sleep(0.01)
+
+            tache = asyncio.create_task(battre())
+            envoye = await service.envoyer_email_creation_compte_async(
+                "etudiant@test.com", "Jean", "etudiant@test.com", "Pass123!", "ETUDIANT"
+            )
+            tache.cancel()
+            return envoye, len(battements)
+
+        with ServeurSMTPLocal(latence=0.2) as serveur:
+            service = self._service(serveur)
+            try:
+                envoye, battements = asyncio.run(scenario(service))
+            finally:
+                service.fermer()
+            assert envoye is True
+            assert battements >= 5
+            recu = email.message_from_bytes(serveur.messages[0], policy=email.policy.default)
+            assert recu["Subject"] == "Création de votre compte etudiant"
+            assert recu["To"] == "etudiant@test.com"
+            assert "Pass123!" in recu.get_content()
+
+    def test_attente_bornee(self):
+        """Au-delà de delai_max_envoi, l'envoi est abandonné et signalé comme échoué"""
+        import asyncio
+        from utils.smtp_local import ServeurSMTPLocal
+
+        with ServeurSMTPLocal(latence=1.0) as serveur:
+            service = self._service(serveur)
+            service.delai_max_envoi = 0.1
+            try:
+                envoye = asyncio.run(service.envoyer_email_assignation_travail_async(
+                    "etudiant@test.com", "Jean", "TP1", "Algorithmique", "Zoé Durand", "15/01/2030", "Premier TP"
+                ))
+            finally:
+                service.fermer()
+            assert envoye is False
+
+class TestRepartiteurEmails:
+    """Tests pour les quotas, le disjoncteur et les priorités du répartiteur d'emails"""
+    
+    def test_seau_jetons(self, monkeypatch):
+        """Le seau se vide puis se recharge au débit capacite / periode"""
+        from utils import repartiteur_emails
+        from utils.repartiteur_emails import SeauJetons
+        
+        horloge = [0.0]
+        monkeypatch.setattr(repartiteur_emails.time, "monotonic", lambda: horloge[0])
+        seau = SeauJetons(capacite=2, periode=60)
+        for _ in range(2):
+            assert seau.attente() == 0
+            seau.consommer()
+        assert seau.attente() == pytest.approx(30)
+        
+        horloge[0] = 30
+        assert seau.attente() == 0
+        horloge[0] = 1000
+        assert seau.attente() == 0 and seau.jetons == 2
+    
+    def test_disjoncteur(self, monkeypatch):
+        """Ouvert après le seuil d'échecs, un seul essai une fois le délai écoulé, refermé par un succès"""
+        from utils import repartiteur_emails
+        from utils.repartiteur_emails import Disjoncteur
+        
+        horloge = [0.0]
+        monkeypatch.setattr(repartiteur_emails.time, "monotonic", lambda: horloge[0])
+        disjoncteur = Disjoncteur(seuil_echecs=2, delai_reouverture=60)
+        disjoncteur.echec()
+        assert disjoncteur.autoriser()
+        disjoncteur.echec()
+        assert disjoncteur.etat == Disjoncteur.OUVERT and not disjoncteur.autoriser()
+        
+        horloge[0] = 60
+        assert disjoncteur.autoriser()
+        assert not disjoncteur.autoriser()
+        disjoncteur.echec()
+        assert disjoncteur.etat == Disjoncteur.OUVERT
+        
+        horloge[0] = 120
+        assert disjoncteur.autoriser()
+        disjoncteur.succes()
+        assert disjoncteur.etat == Disjoncteur.FERME
+    
+    def test_priorites(self):
+        """Les messages en attente partent par priorité : identifiants, rappels, puis notifications"""
+        import threading
+        import time
+        from email.message import EmailMessage
+        from utils.repartiteur_emails import (
+            RepartiteurEmails, PRIORITE_IDENTIFIANTS, PRIORITE_RAPPEL, PRIORITE_NOTIFICATION
+        )
+        
+        envoyes, liberation = [], threading.Event()
+        
+        def envoyer(message):
+            liberation.wait(5)
+            envoyes.append(message["To"])
+        
+        def message(destinataire):
+            m = EmailMessage()
+            m["To"] = destinataire
+            return m
+        
+        repartiteur = RepartiteurEmails(envoyer, nb_threads=1, limite_par_minute=100, limite_par_jour=100)
+        futures = [repartiteur.soumettre(message("en-cours"), PRIORITE_NOTIFICATION)]
+        while repartiteur.metriques()["profondeur_totale"]:
+            time.sleep(0.01)
+        for destinataire, priorite in [("notification", PRIORITE_NOTIFICATION), ("rappel", PRIORITE_RAPPEL),
+                                       ("identifiants", PRIORITE_IDENTIFIANTS)]:
+            futures.append(repartiteur.soumettre(message(destinataire), priorite))
+        liberation.set()
+        for future in futures:
+            future.result(timeout=5)
+        repartiteur.arreter()
+        assert envoyes == ["en-cours", "identifiants", "rappel", "notification"]
+    
+    def test_quota_partage_entre_processus(self, fabrique_sqlite):
+        """Le quota journalier est commun aux processus et survit à un redémarrage"""
+        from utils.quota_emails import QuotaEmailsPartage
+        
+        maintenant = [datetime(2024, 11, 4, 9, 30)]
+        
+        def processus():
+            return QuotaEmailsPartage(fabrique_sqlite, limite_par_minute=10, limite_par_jour=3,
+                                      horloge=lambda: maintenant[0])
+        
+        a, b = processus(), processus()
+        assert [a.reserver(), b.reserver(), a.reserver()] == [0, 0, 0]
+        assert b.reserver() > 0
+        assert processus().reserver() == (datetime(2024, 11, 5) - maintenant[0]).total_seconds()
+        
+        a.rendre()
+        assert b.reserver() == 0
+        maintenant[0] = datetime(2024, 11, 5, 0, 1)
+        assert processus().reserver() == 0
+        assert a.erreurs == b.erreurs == 0
+
+
+class TestEmailOutbox:
+    """Tests pour la file d'emails : réservation, reprises et mise à l'écart"""
+    
+    @pytest.fixture
+    def session(self, session_sqlite):
+        return session_sqlite
+    
+    def _email(self, session, minutes=-1, **colonnes):
+        from models import EmailOutbox, StatutEmailEnum
+        from utils.email_outbox import TYPE_CREATION_COMPTE
+        
+        email = EmailOutbox(
+            type_email=TYPE_CREATION_COMPTE,
+            destinataire="etudiant@test.com",
+            parametres='{"destinataire": "etudiant@test.com", "prenom": "Jean", "email": "etudiant@test.com", '
+                       '"mot_de_passe": "X", "role": "ETUDIANT"}',
+            statut=colonnes.pop("statut", StatutEmailEnum.EN_ATTENTE),
+            tentatives=colonnes.pop("tentatives", 0),
+            prochaine_tentative=datetime.utcnow() + timedelta(minutes=minutes),
+            date_creation=datetime.utcnow()
+        )
+        session.add(email)
+        session.commit()
+        return email
+    
+    def test_reservation(self, session):
+        """Seuls les emails dus sont réservés, une seule fois, pour la durée du bail"""
+        from models import StatutEmailEnum
+        from utils.email_outbox import reserver_emails, DUREE_BAIL
+        
+        du = self._email(session)
+        self._email(session, minutes=10)
+        
+        groupes = reserver_emails(session)
+        assert [[email.id_email for email in groupe] for groupe in groupes] == [[du.id_email]]
+        assert du.statut == StatutEmailEnum.EN_COURS
+        assert du.prochaine_tentative > datetime.utcnow() + timedelta(seconds=DUREE_BAIL - 5)
+        assert reserver_emails(session) == []
+    
+    def test_reprise_avec_backoff(self, session):
+        """Un échec remet l'email en attente avec un délai qui double à chaque tentative"""
+        from models import StatutEmailEnum
+        from utils.email_outbox import reserver_emails, envoyer_groupe_outbox, calculer_delai_reprise, email_service
+        
+        assert [calculer_delai_reprise(n).total_seconds() for n in (1, 2, 3)] == [30, 60, 120]
+        assert calculer_delai_reprise(20).total_seconds() == 3600
+        
+        email = self._email(session, tentatives=1)
+        with patch.object(email_service, "soumettre", side_effect=ConnectionError("SMTP indisponible")):
+            assert not envoyer_groupe_outbox(session, reserver_emails(session)[0])
+        
+        assert email.statut == StatutEmailEnum.EN_ATTENTE
+        assert email.tentatives == 2
+        assert email.derniere_erreur == "SMTP indisponible"
+        attente = (email.prochaine_tentative - datetime.utcnow()).total_seconds()
+        assert 55 < attente <= 60
+    
+    def test_mise_a_l_ecart(self, session):
+        """Après MAX_TENTATIVES échecs, ou un bail expiré de trop, l'email passe en ECHEC"""
+        from models import StatutEmailEnum
+        from utils.email_outbox import reserver_emails, envoyer_groupe_outbox, email_service, MAX_TENTATIVES
+        
+        email = self._email(session, tentatives=MAX_TENTATIVES - 1)
+        with patch.object(email_service, "soumettre", side_effect=ConnectionError("SMTP indisponible")):
+            envoyer_groupe_outbox(session, reserver_emails(session)[0])
+        assert email.statut == StatutEmailEnum.ECHEC
+        
+        # Bail expiré (worker arrêté pendant l'envoi) : compté comme une tentative
+        interrompu = self._email(session, statut=StatutEmailEnum.EN_COURS, tentatives=1)
+        assert len(reserver_emails(session)) == 1
+        assert interrompu.tentatives == 2
+        
+        bloquant = self._email(session, statut=StatutEmailEnum.EN_COURS, tentatives=MAX_TENTATIVES - 1)
+        assert reserver_emails(session) == []
+        assert bloquant.statut == StatutEmailEnum.ECHEC
+    
+    def test_lot_soumis_en_une_fois(self, session):
+        """Tout le lot est soumis au répartiteur ; un message resté en file (quota) est reporté sans tentative"""
+        from concurrent.futures import Future
+        from models import StatutEmailEnum
+        from utils.email_outbox import traiter_file_emails, email_service
+        
+        envoye, en_file = self._email(session), self._email(session)
+        envois = [Future(), Future()]
+        envois[0].set_result(True)
+        with patch.object(email_service, "soumettre", side_effect=envois) as soumettre, \
+                patch("utils.email_outbox.DELAI_ATTENTE_LOT", 0.05):
+            bilan = traiter_file_emails(session)
+        
+        assert soumettre.call_count == 2
+        assert bilan["envoyes"] == 1 and bilan["reportes"] == 1
+        assert envois[1].cancelled()
+        statuts = {email.statut for email in (envoye, en_file)}
+        assert statuts == {StatutEmailEnum.ENVOYE, StatutEmailEnum.EN_ATTENTE}
+        assert {email.tentatives for email in (envoye, en_file)} == {0, 1}
+    
+    def test_mot_de_passe_efface_apres_envoi(self, session):
+        """Le mot de passe initial ne reste dans l'outbox que tant que l'email peut être envoyé"""
+        import json
+        from concurrent.futures import Future
+        from utils.email_outbox import reserver_emails, envoyer_groupe_outbox, email_service, MAX_TENTATIVES
+        
+        envoye, abandonne, en_reprise = (self._email(session), self._email(session, tentatives=MAX_TENTATIVES - 1),
+                                         self._email(session))
+        succes = Future()
+        succes.set_result(True)
+        with patch.object(email_service, "soumettre", side_effect=[succes, ConnectionError("SMTP indisponible")]):
+            groupes = reserver_emails(session)
+            envoyer_groupe_outbox(session, groupes[0])
+            envoyer_groupe_outbox(session, groupes[1])
+        
+        for email in (envoye, abandonne):
+            parametres = json.loads(email.parametres)
+            assert "mot_de_passe" not in parametres and parametres["email"] == "etudiant@test.com"
+        assert json.loads(en_reprise.parametres)["mot_de_passe"] == "X"
+
+    def test_assignations_regroupees_par_etudiant(self, session):
+        """Un seul email par étudiant pour ses travaux en attente ; un travail isolé garde l'email d'origine"""
+        from concurrent.futures import Future
+        from email.header import decode_header, make_header
+        from models import StatutEmailEnum
+        from utils.email_outbox import mettre_en_file_email, traiter_file_emails, email_service, TYPE_ASSIGNATION_TRAVAIL
+
+        emails = [
+            mettre_en_file_email(session, TYPE_ASSIGNATION_TRAVAIL, destinataire, prenom=prenom,
+                                 titre_travail=titre, nom_matiere="Algorithmique", formateur="Zoé Durand",
+                                 date_echeance="15/01/2030 à 23:59", description="Consigne")
+            for destinataire, prenom, titre in [("jean@test.com", "Jean", "TP1"), ("jean@test.com", "Jean", "TP2"),
+                                                ("lea@test.com", "Léa", "TP1")]
+        ]
+        session.commit()
+        # Fenêtre écoulée pour le premier email de chaque étudiant seulement
+        emails[0].prochaine_tentative = emails[2].prochaine_tentative = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+
+        messages = []
+        def soumettre(message, priorite):
+            messages.append(message)
+            envoi = Future()
+            envoi.set_result(True)
+            return envoi
+
+        with patch.object(email_service, "soumettre", side_effect=soumettre):
+            bilan = traiter_file_emails(session)
+
+        assert bilan["messages"] == 2 and bilan["envoyes"] == 3
+        assert {email.statut for email in emails} == {StatutEmailEnum.ENVOYE}
+        par_destinataire = {message["To"]: message for message in messages}
+        digest = par_destinataire["jean@test.com"]
+        assert digest["Subject"] == "2 nouveaux travaux assignés"
+        assert "TP1" in digest.get_content() and "TP2" in digest.get_content()
+        sujet_isole = str(make_header(decode_header(par_destinataire["lea@test.com"]["Subject"])))
+        assert sujet_isole == "Nouveau travail assigné : TP1"
+
+
+class TestImportComptes:
+    """Tests pour l'import en masse des comptes"""
+    
+    @pytest.fixture
+    def session(self, session_sqlite):
+        return session_sqlite
+    
+    def test_seules_les_lignes_fautives_sont_rejetees(self, session):
+        """Un lot dont l'insertion échoue est repris ligne par ligne"""
+        from utils import import_comptes
+        
+        lignes = [(i + 2, {"email": f"formateur{i}@test.com", "nom": "Nom", "prenom": "Prenom"}) for i in range(5)]
+        lignes.append((7, {"email": "long@test.com", "nom": "N" * 101, "prenom": "Prenom"}))
+        a_importer, rapport = import_comptes.preparer_import_formateurs(lignes)
+        assert [ligne["erreur"] for ligne in rapport] == ["Valeurs trop longues: nom"]
+        
+        # Compte créé par un autre import après le contrôle des emails existants
+        list(import_comptes.importer_formateurs(session, [a_importer[3]], []))
+        with patch.object(import_comptes, "emails_existants", return_value=set()):
+            *_, resultat = import_comptes.importer_formateurs(session, a_importer, rapport)
+        
+        assert resultat["crees"] == 4 and resultat["erreurs"] == 2
+        assert [ligne["statut"] for ligne in resultat["lignes"]] == ["CREE", "CREE", "CREE", "ERREUR", "CREE", "ERREUR"]
+
+
+class TestEtagVersions:
+    """Tests pour les ETags calculés à partir des versions de tables"""
+    
+    def test_version_partagee_et_transactionnelle(self, fabrique_sqlite):
+        """Un commit d'une autre session (autre processus) change l'ETag ; un rollback non"""
+        from models import Formation
+        from utils.cache_http import calculer_etag
+        
+        def formation():
+            return Formation(id_formation="F1", nom_formation="Informatique", date_debut=datetime.utcnow().date())
+        
+        lecteur, ecrivain = fabrique_sqlite(), fabrique_sqlite()
+        
+        etag = calculer_etag(lecteur, ["formation"], 50)
+        assert calculer_etag(lecteur, ["formation"], 100) != etag
+        
+        ecrivain.add(formation())
+        ecrivain.flush()
+        ecrivain.rollback()
+        assert calculer_etag(lecteur, ["formation"], 50) == etag
+        
+        ecrivain.add(formation())
+        ecrivain.commit()
+        assert calculer_etag(lecteur, ["formation"], 50) != etag
+    
+    def test_tables_de_service_non_versionnees(self, session_sqlite):
+        """Les écritures hors des tables lues par les ETag ne touchent pas version_table"""
+        from models import TentativeConnexion, VersionTable
+        from utils.cache_http import calculer_etag
+        
+        session_sqlite.add(TentativeConnexion(email="u@test.com"))
+        session_sqlite.commit()
+        assert session_sqlite.query(VersionTable).count() == 0
+        with pytest.raises(ValueError):
+            calculer_etag(session_sqlite, ["tentative_connexion"])
+    
+    def test_statut_d_assignation_versionne_par_etudiant_et_espace(self, base_espace):
+        """Rendre un travail ne change que les ETag de l'étudiant et de l'espace concernés"""
+        from models import Assignation, Travail, TypeTravailEnum, StatutAssignationEnum
+        from utils.cache_http import (
+            calculer_etag, version_assignations_etudiant, version_assignations_espace
+        )
+        
+        session = base_espace
+        session.add(Travail(id_travail="T1", id_espace="ESP_1", titre="TP", description="TP",
+                            type_travail=TypeTravailEnum.INDIVIDUEL, date_echeance=datetime(2030, 1, 1)))
+        for i in range(2):
+            session.add(Assignation(id_assignation=f"A{i}", id_etudiant=f"E_{i}", id_travail="T1"))
+        session.commit()
+        
+        def etags():
+            return [
+                calculer_etag(session, ["assignation", cle])
+                for cle in [version_assignations_etudiant("E_0"), version_assignations_etudiant("E_1"),
+                            version_assignations_espace("ESP_1"), version_assignations_espace("ESP_2")]
+            ]
+        
+        avant = etags()
+        session.get(Assignation, "A0").statut = StatutAssignationEnum.RENDU
+        session.commit()
+        apres = etags()
+        assert [a != b for a, b in zip(avant, apres)] == [True, False, True, False]
+
+
+class TestStatistiques:
+    """Tests pour les compteurs de l'établissement tenus à jour à chaque commit"""
+    
+    def test_deltas_de_l_orm(self, base_espace):
+        """Créations et changements de statut faits par l'ORM s'appliquent en incréments"""
+        from models import Etudiant, StatutEtudiantEnum
+        from utils.statistiques import initialiser_statistiques, lire_statistiques
+        
+        session = base_espace
+        initialiser_statistiques(session)
+        assert lire_statistiques(session)["etudiants_actifs"] == 3
+        
+        session.get(Etudiant, "E_0").statut = StatutEtudiantEnum.SUSPENDU
+        session.commit()
+        statistiques = lire_statistiques(session)
+        assert (statistiques["total_etudiants"], statistiques["etudiants_actifs"], statistiques["etudiants_suspendus"]) == (3, 2, 1)
+    
+    def test_insertion_en_masse_comptee(self, base_espace):
+        """Les assignations insérées en masse sont comptées ligne à ligne, sans recalcul"""
+        from models import Travail, TypeTravailEnum
+        from utils.assignations_masse import creer_assignations_en_masse
+        from utils.statistiques import initialiser_statistiques, lire_statistiques
+        
+        session = base_espace
+        initialiser_statistiques(session)
+        session.add(Travail(id_travail="T1", id_espace="ESP_1", titre="TP", description="TP",
+                            type_travail=TypeTravailEnum.INDIVIDUEL, date_echeance=datetime(2030, 1, 1)))
+        session.flush()
+        creer_assignations_en_masse(session, "T1", ["E_0", "E_1", "E_2"], taille_lot=2)
+        session.commit()
+        assert lire_statistiques(session)["assignations_par_statut"]["ASSIGNE"] == 3
+    
+    def test_sans_ligne_le_commit_ne_la_cree_pas(self, base_espace):
+        """Tant que la ligne n'est pas initialisée, les commits ne tentent pas de la créer"""
+        from models import Statistiques, Formation
+        from utils.statistiques import ID_STATISTIQUES, lire_statistiques
+        
+        session = base_espace
+        session.add(Formation(id_formation="F_2", nom_formation="Réseaux", date_debut=datetime(2024, 9, 1).date()))
+        session.commit()
+        assert session.get(Statistiques, ID_STATISTIQUES) is None
+        assert lire_statistiques(session)["total_formations"] == 2
+    
+    def test_reconciliation_corrige_les_ecarts(self, base_espace):
+        """Une modification hors session est corrigée par la réconciliation"""
+        from sqlalchemy import text
+        from utils.statistiques import initialiser_statistiques, lire_statistiques, reconcilier_statistiques
+        
+        session = base_espace
+        initialiser_statistiques(session)
+        session.execute(text("DELETE FROM etudiant WHERE id_etudiant = 'E_2'"))
+        session.commit()
+        assert lire_statistiques(session)["total_etudiants"] == 3
+        
+        assert reconcilier_statistiques(session) == {"total_etudiants": -1, "etudiants_actifs": -1}
+        assert lire_statistiques(session)["total_etudiants"] == 2
+        assert reconcilier_statistiques(session) == {}
+
+
+class TestPromotionGenerator:
+    """Tests pour la résolution des promotions et de la formation par défaut"""
+    
+    def test_cache_expire_et_modifications_en_masse(self, session_sqlite, monkeypatch):
+        """Un identifiant supprimé ailleurs n'est plus servi après la durée de vie ; un delete en masse invalide"""
+        from sqlalchemy import delete, text
+        from models import Promotion
+        from utils import promotion_generator
+        
+        promotion_generator.invalider_cache_promotions()
+        horloge = [1000.0]
+        monkeypatch.setattr(promotion_generator, "monotonic", lambda: horloge[0])
+        
+        id_promotion = promotion_generator.obtenir_id_promotion(session_sqlite, "2024-2025")
+        # Suppression par un autre processus : aucun événement dans celui-ci
+        session_sqlite.execute(text("DELETE FROM promotion"))
+        session_sqlite.commit()
+        assert promotion_generator.obtenir_id_promotion(session_sqlite, "2024-2025") == id_promotion
+        
+        horloge[0] += promotion_generator.DUREE_VIE_CACHE_PROMOTIONS + 1
+        id_recree = promotion_generator.obtenir_id_promotion(session_sqlite, "2024-2025")
+        assert id_recree != id_promotion
+        assert session_sqlite.get(Promotion, id_recree) is not None
+        
+        session_sqlite.execute(delete(Promotion))
+        session_sqlite.commit()
+        assert promotion_generator.obtenir_id_promotion(session_sqlite, "2024-2025") != id_recree
+        promotion_generator.invalider_cache_promotions()
+    
+    def test_formation_par_defaut_creee_en_parallele(self, session_sqlite):
+        """Si une autre requête crée la formation par défaut entre la vérification et l'insertion, elle est relue"""
+        from sqlalchemy import event, false
+        from models import Formation
+        from utils.promotion_generator import NOM_FORMATION_PAR_DEFAUT, obtenir_formation_par_defaut
+        
+        session_sqlite.add(Formation(id_formation="F_AUTRE", nom_formation=NOM_FORMATION_PAR_DEFAUT,
+                                     date_debut=datetime(2024, 9, 1).date()))
+        session_sqlite.commit()
+        
+        # La vérification ne voit pas encore la formation créée par l'autre requête
+        verifications = []
+        
+        @event.listens_for(session_sqlite, "do_orm_execute")
+        def verification_anterieure(etat):
+            if etat.is_select and not verifications:
+                verifications.append(etat.statement)
+                return etat.invoke_statement(statement=etat.statement.where(false()))
+        
+        assert obtenir_formation_par_defaut(session_sqlite).id_formation == "F_AUTRE"
+        assert verifications
+        assert session_sqlite.query(Formation).count() == 1
+
+
+class TestCacheDashboard:
+    """Tests pour le cache des réponses de dashboard"""
+    
+    def test_expiration_et_invalidation_par_etiquette(self):
+        """Une entrée expire après son TTL et n'est invalidée que par ses étiquettes"""
+        from utils.cache_dashboard import CacheDashboard
+        
+        maintenant = [0.0]
+        cache = CacheDashboard(duree_vie=60, taille_max=10, horloge=lambda: maintenant[0])
+        cache.enregistrer(("ETUDIANT", "U1"), {"a": 1}, {"etudiant:E1", "espace:ES1"}, cache.generation())
+        cache.enregistrer(("ETUDIANT", "U2"), {"a": 2}, {"etudiant:E2", "espace:ES2"}, cache.generation())
+        
+        cache.invalider({"espace:ES1"})
+        assert cache.obtenir(("ETUDIANT", "U1")) is None
+        assert cache.obtenir(("ETUDIANT", "U2")) == {"a": 2}
+        
+        maintenant[0] = 61
+        assert cache.obtenir(("ETUDIANT", "U2")) is None
+    
+    def test_taille_bornee_et_calcul_concurrent(self):
+        """Éviction LRU au-delà de la taille max ; pas de mise en cache si une de ses étiquettes a été invalidée pendant le calcul"""
+        from utils.cache_dashboard import CacheDashboard
+        
+        cache = CacheDashboard(taille_max=2)
+        for i in range(3):
+            cache.enregistrer(("DE", f"U{i}"), i, {"de"}, cache.generation())
+        assert cache.obtenir(("DE", "U0")) is None
+        assert cache.metriques()["entrees"] == 2
+        
+        generation = cache.generation()
+        cache.invalider({"autre"})
+        cache.enregistrer(("DE", "U8"), 8, {"de"}, generation)
+        assert cache.obtenir(("DE", "U8")) == 8
+        
+        generation = cache.generation()
+        cache.invalider({"de"})
+        cache.enregistrer(("DE", "U9"), 9, {"de"}, generation)
+        assert cache.obtenir(("DE", "U9")) is None
+        
+        generation = cache.generation()
+        cache.vider()
+        cache.enregistrer(("DE", "U9"), 9, {"de"}, generation)
+        assert cache.obtenir(("DE", "U9")) is None
+
+class TestSingleFlight:
+    """Tests pour le regroupement des calculs concurrents"""
+    
+    def test_appels_simultanes_regroupes(self):
+        """Des appels simultanés sur la même clé partagent un seul calcul"""
+        import asyncio
+        import time
+        from utils.single_flight import SingleFlight
+        
+        single_flight = SingleFlight()
+        executions = []
+        
+        def calcul(valeur):
+            executions.append(valeur)
+            time.sleep(0.05)
+            return valeur * 2
+        
+        async def scenario():
+            return await asyncio.gather(*[single_flight.executer("cle", calcul, 21) for _ in range(10)])
+        
+        assert asyncio.run(scenario()) == [42] * 10
+        assert executions == [21]
+        metriques = single_flight.metriques()
+        assert metriques["executions"] == 1
+        assert metriques["regroupes"] == 9
+        assert metriques["en_cours"] == 0
+
+
+class TestEspacesPromotion:
+    """Tests pour le calcul partagé des espaces d'une promotion"""
+    
+    def test_objets_de_l_appelant_lisibles_sans_requete(self, session_sqlite, moteur_sqlite):
+        """Après l'attente, lire l'utilisateur courant n'interroge plus la base"""
+        import asyncio
+        from sqlalchemy import event
+        from models import Utilisateur, RoleEnum
+        from utils.espaces_promotion import espaces_promotion
+        
+        session_sqlite.add(Utilisateur(identifiant="U1", email="u1@test.com", mot_de_passe="x",
+                                       nom="Martin", prenom="Sophie", role=RoleEnum.ETUDIANT))
+        session_sqlite.commit()
+        utilisateur = session_sqlite.query(Utilisateur).filter(Utilisateur.identifiant == "U1").one()
+        
+        assert asyncio.run(espaces_promotion(session_sqlite, "P_1")) == []
+        
+        requetes = []
+        event.listen(moteur_sqlite, "before_cursor_execute", lambda *args: requetes.append(args[2]))
+        assert (utilisateur.identifiant, utilisateur.nom, utilisateur.prenom, utilisateur.email) == (
+            "U1", "Martin", "Sophie", "u1@test.com"
+        )
+        assert requetes == []
+
+
+class TestPagination:
+    """Tests pour la pagination par curseur"""
+    
+    def test_curseur_sur_echeance(self):
+        """Les dates du curseur sont reconverties pour être comparées à la colonne"""
+        from models import Travail
+        from utils.pagination import encoder_curseur, decoder_curseur, convertir_curseur
+        
+        echeance = datetime(2024, 11, 4, 23, 59, 30, 125000)
+        curseur = encoder_curseur([echeance, "TRAV_1"])
+        valeurs = convertir_curseur([Travail.date_echeance, Travail.id_travail], decoder_curseur(curseur, 2))
+        assert valeurs == [echeance, "TRAV_1"]
+
+
+class TestSyntheseNotes:
+    """Tests pour la synthèse des notes par étudiant"""
+    
+    def test_moyenne_ramenee_sur_20(self):
+        """Les notes sur des barèmes différents sont ramenées sur 20 avant la moyenne"""
+        from decimal import Decimal
+        from utils.synthese_notes import normaliser_note, moyenne_generale
+        
+        assert normaliser_note(Decimal("5"), Decimal("10")) == Decimal("10")
+        assert normaliser_note(Decimal("30"), Decimal("40")) == Decimal("15")
+        
+        synthese = {
+            "ESP_1": {"nombre_notes": 1, "somme_notes": 10.0, "moyenne": 10.0},
+            "ESP_2": {"nombre_notes": 2, "somme_notes": 31.0, "moyenne": 15.5}
+        }
+        assert moyenne_generale(synthese) == 13.67
+        assert moyenne_generale({}) is None
+    
+    def test_seule_la_derniere_livraison_notee_compte(self, session_sqlite):
+        """Une livraison renotée après correction remplace la note précédente du travail"""
+        from decimal import Decimal
+        from models import Assignation, Livraison, Travail, TypeTravailEnum
+        from utils.synthese_notes import lire_synthese_etudiant, recalculer_synthese_notes
+        
+        session = session_sqlite
+        session.add(Travail(id_travail="T1", id_espace="ESP_1", titre="TP", description="TP",
+                            type_travail=TypeTravailEnum.INDIVIDUEL, date_echeance=datetime(2024, 1, 1),
+                            note_max=Decimal("10")))
+        session.add(Assignation(id_assignation="A1", id_etudiant="E1", id_travail="T1"))
+        session.add(Livraison(id_livraison="L1", id_assignation="A1", chemin_fichier="v1.pdf",
+                              date_livraison=datetime(2024, 1, 1), note_attribuee=Decimal("4")))
+        session.commit()
+        session.add(Livraison(id_livraison="L2", id_assignation="A1", chemin_fichier="v2.pdf",
+                              date_livraison=datetime(2024, 1, 2), note_attribuee=Decimal("8")))
+        session.commit()
+        
+        attendu = {"nombre_notes": 1, "somme_notes": 16.0, "moyenne": 16.0, "derniere_note": 8.0, "derniere_note_max": 10.0}
+        assert lire_synthese_etudiant(session, "E1") == {"ESP_1": attendu}
+        recalculer_synthese_notes(session)
+        session.commit()
+        assert lire_synthese_etudiant(session, "E1") == {"ESP_1": attendu}
+
+
+class TestPrechauffage:
+    """Tests pour le préchauffage du cache avant les pics de trafic"""
+    
+    def test_fenetre_creneau_de_cours(self):
+        """Le préchauffage commence avant le début du créneau et couvre le début du pic"""
+        from utils.prechauffage import en_pic_de_cours
+        
+        assert en_pic_de_cours(datetime(2024, 11, 4, 7, 56))
+        assert en_pic_de_cours(datetime(2024, 11, 4, 8, 10))
+        assert not en_pic_de_cours(datetime(2024, 11, 4, 7, 30))
+        assert not en_pic_de_cours(datetime(2024, 11, 4, 9, 0))
+    
+    def test_passes_bornees_completees_par_les_suivantes(self, base_espace, fabrique_sqlite, monkeypatch):
+        """Chaque processus préchauffe son cache ; une passe bornée laisse le reste aux passes suivantes"""
+        from utils import prechauffage
+        from utils.cache_dashboard import cache_dashboard
+        
+        monkeypatch.setattr(prechauffage, "MAX_CALCULS_PAR_PASSE", 3)
+        cache_dashboard.vider()
+        # 3 étudiants (dashboard et mes-cours) et le formateur de leur espace
+        bilans = []
+        for _ in range(3):
+            with fabrique_sqlite() as db:
+                bilans.append(prechauffage.prechauffer_promotions(db, {"P_1"}))
+        assert [(b["dashboards"] + b["mes_cours"], b["non_prechauffes"]) for b in bilans] == [(3, 4), (3, 1), (1, 0)]
+        assert all(b["erreurs"] == 0 for b in bilans)
+        assert cache_dashboard.metriques()["entrees"] == 7
+        cache_dashboard.vider()
+    
+    def test_capacite_calee_sur_la_duree_de_vie(self):
+        """Trois passes par durée de vie du cache, chacune plus courte que l'intervalle"""
+        from utils import prechauffage
+        from utils.cache_dashboard import DUREE_VIE_CACHE
+        
+        assert prechauffage.INTERVALLE_PRECHAUFFAGE * 3 <= DUREE_VIE_CACHE
+        assert prechauffage.DUREE_MAX_PASSE < prechauffage.INTERVALLE_PRECHAUFFAGE
+        assert prechauffage.CAPACITE_PRECHAUFFAGE == 1500
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
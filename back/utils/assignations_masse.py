@@ -0,0 +1,49 @@
+"""
+Création d'assignations en masse
+
+Insère toutes les assignations d'un travail par lots (executemany) sans
+instancier d'objets ORM, dans la transaction de l'appelant.
+"""
+
+from datetime import datetime
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from models import Assignation, StatutAssignationEnum
+from utils.generators import generer_identifiants_bloc
+from utils.insertion_masse import inserer_en_masse
+
+# Nombre de lignes par requête INSERT (reste sous max_allowed_packet de MySQL)
+TAILLE_LOT_INSERTION = 1000
+
+
+def creer_assignations_en_masse(db: Session, id_travail: str, ids_etudiants: List[str],
+                                taille_lot: int = TAILLE_LOT_INSERTION) -> List[str]:
+    """
+    Assigne un travail à une liste d'étudiants
+
+    Le travail doit déjà être présent en base (db.flush()) ; la transaction
+    n'est pas validée ici. Retourne les identifiants des assignations créées.
+    """
+    if not ids_etudiants:
+        return []
+
+    ids_assignations = generer_identifiants_bloc("ASSIGNATION", len(ids_etudiants))
+    maintenant = datetime.utcnow()
+    lignes = [
+        {
+            "id_assignation": id_assignation,
+            "id_etudiant": id_etudiant,
+            "id_travail": id_travail,
+            "id_groupe": None,
+            "date_assignment": maintenant,
+            "statut": StatutAssignationEnum.ASSIGNE
+        }
+        for id_assignation, id_etudiant in zip(ids_assignations, ids_etudiants)
+    ]
+
+    for debut in range(0, len(lignes), taille_lot):
+        inserer_en_masse(db, Assignation.__table__, lignes[debut:debut + taille_lot])
+
+    return ids_assignations
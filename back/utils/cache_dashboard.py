@@ -0,0 +1,259 @@
+"""
+Cache mémoire des réponses de dashboard, par (rôle, utilisateur), et des
+listes mes-cours des étudiants
+
+Chaque réponse est conservée avec une durée de vie (TTL) et des étiquettes
+décrivant les données dont elle dépend ("espace:<id>", "etudiant:<id>",
+"de"...). Le nombre d'entrées est borné (éviction LRU).
+
+Les événements de session relèvent les modifications du domaine pendant le
+flush et invalident, après le commit, uniquement les entrées dont une
+étiquette est concernée :
+- travail créé / modifié -> dashboards des étudiants et du formateur de l'espace ;
+- assignation créée ou changeant de statut (RENDU...) -> l'étudiant et le
+  formateur de l'espace (assignations à corriger) ;
+- livraison / note -> l'étudiant ;
+- création de compte, promotion, formation, assignation -> dashboard DE.
+
+Le cache est propre au processus ; le TTL borne la durée pendant laquelle
+une modification faite ailleurs (autre processus, SQL brut) reste invisible.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import (
+    Utilisateur, Formateur, Etudiant, Promotion, Formation,
+    EspacePedagogique, Travail, Assignation, Livraison
+)
+from utils.insertion_masse import lignes_inserees
+
+DUREE_VIE_CACHE = 60  # secondes
+TAILLE_MAX_CACHE = 5000  # entrées (une par utilisateur connecté)
+
+ETIQUETTE_DE = "de"
+_CLE_ETIQUETTES = "cache_dashboard_etiquettes"
+_TOUT = "*"
+
+
+class CacheDashboard:
+    """Cache LRU à durée de vie limitée, invalidable par étiquettes"""
+
+    def __init__(self, duree_vie: float = DUREE_VIE_CACHE, taille_max: int = TAILLE_MAX_CACHE,
+                 horloge: Callable[[], float] = time.monotonic):
+        self.duree_vie = duree_vie
+        self.taille_max = taille_max
+        self._horloge = horloge
+        self._entrees: "OrderedDict[Hashable, Tuple[float, Any, Set[str]]]" = OrderedDict()
+        self._par_etiquette: Dict[str, Set[Hashable]] = {}
+        self._generation = 0
+        # Étiquette -> génération de sa dernière invalidation ; les calculs commencés
+        # avant le plancher sont refusés (invalidation totale, ou historique oublié)
+        self._invalidations: Dict[str, int] = {}
+        self._plancher = 0
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+
+    def generation(self) -> int:
+        """
+        Numéro d'invalidation courant, à lire avant de calculer une réponse :
+        si une de ses étiquettes est invalidée pendant le calcul, la réponse
+        n'est pas mise en cache (elle peut déjà être périmée)
+        """
+        return self._generation
+
+    def obtenir(self, cle: Hashable) -> Optional[Any]:
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None or entree[0] <= self._horloge():
+                if entree is not None:
+                    self._retirer(cle)
+                self.echecs += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.succes += 1
+            return entree[1]
+
+    def contient(self, cle: Hashable) -> bool:
+        """Entrée présente et non expirée (sans compter un succès ni rafraîchir l'ordre LRU)"""
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            return entree is not None and entree[0] > self._horloge()
+
+    def enregistrer(self, cle: Hashable, valeur: Any, etiquettes: Iterable[str], generation: int):
+        etiquettes = set(etiquettes)
+        with self._verrou:
+            if generation < self._plancher or any(
+                self._invalidations.get(etiquette, 0) > generation for etiquette in etiquettes
+            ):
+                return
+            self._retirer(cle)
+            self._entrees[cle] = (self._horloge() + self.duree_vie, valeur, etiquettes)
+            for etiquette in etiquettes:
+                self._par_etiquette.setdefault(etiquette, set()).add(cle)
+            while len(self._entrees) > self.taille_max:
+                self._retirer(next(iter(self._entrees)))
+
+    def invalider(self, etiquettes: Iterable[str]):
+        """Retire les entrées portant au moins une des étiquettes ("*" : tout)"""
+        with self._verrou:
+            self._generation += 1
+            etiquettes = set(etiquettes)
+            if _TOUT in etiquettes:
+                self._entrees.clear()
+                self._par_etiquette.clear()
+                self._invalidations.clear()
+                self._plancher = self._generation
+                return
+            for etiquette in etiquettes:
+                self._invalidations[etiquette] = self._generation
+                for cle in list(self._par_etiquette.get(etiquette, ())):
+                    self._retirer(cle)
+            if len(self._invalidations) > self.taille_max:
+                self._invalidations.clear()
+                self._plancher = self._generation
+
+    def vider(self):
+        self.invalider([_TOUT])
+
+    def metriques(self) -> Dict[str, int]:
+        with self._verrou:
+            return {"entrees": len(self._entrees), "succes": self.succes, "echecs": self.echecs}
+
+    def _retirer(self, cle: Hashable):
+        entree = self._entrees.pop(cle, None)
+        if entree is None:
+            return
+        for etiquette in entree[2]:
+            cles = self._par_etiquette.get(etiquette)
+            if cles is not None:
+                cles.discard(cle)
+                if not cles:
+                    del self._par_etiquette[etiquette]
+
+
+# Instance globale du cache
+cache_dashboard = CacheDashboard()
+
+
+def cle_dashboard(role, identifiant: str) -> Tuple[Any, str]:
+    """Clé du dashboard d'un utilisateur"""
+    return (role, identifiant)
+
+
+def cle_mes_cours(identifiant: str) -> Tuple[str, str]:
+    """Clé de la liste mes-cours d'un étudiant"""
+    return ("mes-cours", identifiant)
+
+
+# ==================== ÉVÉNEMENTS DU DOMAINE ====================
+
+def _espace_du_travail(session: Session, id_travail: str) -> Optional[str]:
+    travail = session.get(Travail, id_travail)
+    return travail.id_espace if travail is not None else None
+
+
+def _statut_modifie(instance) -> bool:
+    return bool(inspect(instance).attrs.statut.history.added)
+
+
+def _etiquettes_instance(session: Session, instance, nouvelle_ou_supprimee: bool) -> Set[str]:
+    """Étiquettes des dashboards qui affichent cette ligne"""
+    if isinstance(instance, Travail):
+        return {f"espace:{instance.id_espace}"}
+    if isinstance(instance, Assignation):
+        if not nouvelle_ou_supprimee and not _statut_modifie(instance):
+            return {f"etudiant:{instance.id_etudiant}"}
+        # Le dashboard DE affiche les assignations par statut
+        return {
+            ETIQUETTE_DE,
+            f"etudiant:{instance.id_etudiant}",
+            f"correction:{_espace_du_travail(session, instance.id_travail)}"
+        }
+    if isinstance(instance, Livraison):
+        assignation = session.get(Assignation, instance.id_assignation)
+        return {f"etudiant:{assignation.id_etudiant}"} if assignation is not None else {_TOUT}
+    if isinstance(instance, EspacePedagogique):
+        return {f"formateur:{instance.id_formateur}", f"promotion:{instance.id_promotion}"}
+    if isinstance(instance, Etudiant):
+        return {ETIQUETTE_DE, f"etudiant:{instance.id_etudiant}", f"effectif:{instance.id_promotion}"}
+    if isinstance(instance, Formateur):
+        return {ETIQUETTE_DE, f"formateur:{instance.id_formateur}"}
+    if isinstance(instance, Utilisateur):
+        return {ETIQUETTE_DE, f"utilisateur:{instance.identifiant}"}
+    if isinstance(instance, Promotion):
+        return {ETIQUETTE_DE, f"promotion:{instance.id_promotion}"}
+    if isinstance(instance, Formation):
+        # Le nom de la formation apparaît dans tous les dashboards étudiants
+        return {ETIQUETTE_DE} if nouvelle_ou_supprimee else {_TOUT}
+    return set()
+
+
+def _etiquettes_ligne(nom_table: str, ligne: Dict[str, Any]) -> Set[str]:
+    """Étiquettes pour une ligne insérée en masse (utils/insertion_masse.py)"""
+    if nom_table == Assignation.__tablename__:
+        return {ETIQUETTE_DE, f"etudiant:{ligne.get('id_etudiant')}"}
+    if nom_table == Etudiant.__tablename__:
+        return {ETIQUETTE_DE, f"effectif:{ligne.get('id_promotion')}"}
+    if nom_table in (Utilisateur.__tablename__, Formateur.__tablename__, Promotion.__tablename__):
+        return {ETIQUETTE_DE}
+    return {_TOUT}
+
+
+_TABLES_SUIVIES = {
+    modele.__tablename__ for modele in (
+        Utilisateur, Formateur, Etudiant, Promotion, Formation,
+        EspacePedagogique, Travail, Assignation, Livraison
+    )
+}
+
+
+def _etiquettes(session: Session) -> Set[str]:
+    return session.info.setdefault(_CLE_ETIQUETTES, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _relever_flush(session, contexte_flush):
+    etiquettes = None
+    for instances, nouvelle_ou_supprimee in ((session.new, True), (session.deleted, True), (session.dirty, False)):
+        for instance in instances:
+            if getattr(getattr(instance, "__table__", None), "name", None) not in _TABLES_SUIVIES:
+                continue
+            if not nouvelle_ou_supprimee and not session.is_modified(instance, include_collections=False):
+                continue
+            etiquettes = etiquettes if etiquettes is not None else _etiquettes(session)
+            etiquettes |= _etiquettes_instance(session, instance, nouvelle_ou_supprimee)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _relever_execution(etat):
+    if not (etat.is_insert or etat.is_update or etat.is_delete):
+        return
+    table = getattr(etat.statement, "table", None)
+    if table is None or table.name not in _TABLES_SUIVIES:
+        return
+    etiquettes = _etiquettes(etat.session)
+    lignes = lignes_inserees(etat)
+    if lignes is None:
+        etiquettes.add(_TOUT)
+        return
+    for ligne in lignes:
+        etiquettes |= _etiquettes_ligne(table.name, ligne)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalider_apres_commit(session):
+    etiquettes = session.info.pop(_CLE_ETIQUETTES, None)
+    if etiquettes:
+        cache_dashboard.invalider(etiquettes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier_etiquettes(session):
+    session.info.pop(_CLE_ETIQUETTES, None)
@@ -0,0 +1,190 @@
+"""
+Validation de cache HTTP (ETag / If-None-Match) à partir de versions de tables
+
+La table version_table contient un compteur par table, incrémenté dans la
+transaction même qui modifie la table, que ce soit par l'ORM (flush) ou par
+une requête d'insertion / mise à jour / suppression exécutée via la session
+(imports en masse...). Les versions sont donc partagées par tous les
+processus (workers, scripts) et ne sont visibles qu'une fois la modification
+validée. Un ETag se calcule à partir des versions des tables dont dépend une
+réponse, en une requête sur clé primaire : si le client présente le même
+ETag, la route répond 304. Les réponses conservées en mémoire (dashboards)
+utilisent plutôt une empreinte de leur contenu, calculée une fois à la mise
+en cache.
+
+Seules les tables lues par des ETag (TABLES_VERSIONNEES) sont versionnées :
+les tables de service (outbox, tentatives de connexion, statistiques...)
+n'écrivent pas dans version_table. Les assignations changent à chaque rendu
+ou notation : une mise à jour par l'ORM ne fait évoluer que les versions des
+assignations de l'étudiant et de l'espace concernés, seuls les ajouts,
+suppressions et modifications en masse changent la version de la table.
+Une route qui lit les statuts d'assignation d'un étudiant ou des espaces
+d'un formateur dépend donc de "assignation" et de ces clés.
+
+Les modifications faites hors d'une session où ce module est importé
+(SQL brut, autre application) doivent appeler incrementer_versions.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Assignation, Travail, VersionTable
+
+_CLE_TABLES_MODIFIEES = "tables_modifiees"
+
+# Tables dont dépendent les ETag calculés par calculer_etag
+TABLES_VERSIONNEES = frozenset({
+    "utilisateur", "formateur", "etudiant", "promotion", "formation",
+    "espace_pedagogique", "travail", "assignation"
+})
+
+
+def version_assignations_etudiant(id_etudiant: str) -> str:
+    """Clé de version des assignations d'un étudiant (à lire avec celle de la table assignation)"""
+    return f"assignation:etudiant:{id_etudiant}"
+
+
+def version_assignations_espace(id_espace: str) -> str:
+    """Clé de version des assignations aux travaux d'un espace (à lire avec celle de la table assignation)"""
+    return f"assignation:espace:{id_espace}"
+
+
+def versions_tables(db: Session, noms_tables: Iterable[str]) -> Dict[str, int]:
+    """Versions des tables (0 pour une table jamais modifiée), en une requête"""
+    noms_tables = list(noms_tables)
+    lignes = db.query(VersionTable.nom_table, VersionTable.version).filter(
+        VersionTable.nom_table.in_(noms_tables)
+    ).all()
+    versions = {nom_table: 0 for nom_table in noms_tables}
+    versions.update({ligne.nom_table: ligne.version for ligne in lignes})
+    return versions
+
+
+def incrementer_versions(db: Session, noms_tables: Iterable[str]):
+    """
+    Signale une modification des tables dans la transaction en cours
+    (tables triées : deux transactions verrouillent les lignes dans le même ordre)
+    """
+    table = VersionTable.__table__
+    dialecte = db.get_bind().dialect.name
+    for nom_table in sorted(noms_tables):
+        if dialecte == "mysql":
+            requete = mysql.insert(table).values(nom_table=nom_table, version=1)
+            db.execute(requete.on_duplicate_key_update(version=table.c.version + 1))
+        elif dialecte in ("sqlite", "postgresql"):
+            module = sqlite if dialecte == "sqlite" else postgresql
+            requete = module.insert(table).values(nom_table=nom_table, version=1)
+            db.execute(requete.on_conflict_do_update(
+                index_elements=["nom_table"], set_={"version": table.c.version + 1}
+            ))
+        else:
+            resultat = db.execute(
+                update(VersionTable)
+                .where(VersionTable.nom_table == nom_table)
+                .values(version=VersionTable.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if resultat.rowcount == 0:
+                db.execute(table.insert().values(nom_table=nom_table, version=1))
+
+
+def _tables_modifiees(session: Session) -> Set[str]:
+    return session.info.setdefault(_CLE_TABLES_MODIFIEES, set())
+
+
+def _cles_assignation_modifiee(session: Session, instance) -> Set[str]:
+    """Clés de version touchées par la mise à jour d'une assignation (anciennes et nouvelles valeurs)"""
+    etat = inspect(instance)
+    cles = {version_assignations_etudiant(valeur) for valeur in etat.attrs.id_etudiant.history.sum() if valeur}
+    for id_travail in etat.attrs.id_travail.history.sum():
+        travail = session.get(Travail, id_travail) if id_travail else None
+        if travail is not None:
+            cles.add(version_assignations_espace(travail.id_espace))
+    return cles
+
+
+@event.listens_for(Session, "after_flush")
+def _noter_flush(session, contexte_flush):
+    tables = _tables_modifiees(session)
+    for instance in (*session.new, *session.deleted):
+        table = getattr(instance, "__table__", None)
+        if table is not None and table.name in TABLES_VERSIONNEES:
+            tables.add(table.name)
+    for instance in session.dirty:
+        table = getattr(instance, "__table__", None)
+        if table is None or table.name not in TABLES_VERSIONNEES or not session.is_modified(instance):
+            continue
+        if isinstance(instance, Assignation):
+            tables.update(_cles_assignation_modifiee(session, instance))
+        else:
+            tables.add(table.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _noter_execution(etat):
+    if etat.is_insert or etat.is_update or etat.is_delete:
+        table = getattr(etat.statement, "table", None)
+        if table is not None and table.name in TABLES_VERSIONNEES:
+            _tables_modifiees(etat.session).add(table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _publier_versions(session):
+    session.flush()
+    tables = session.info.pop(_CLE_TABLES_MODIFIEES, None)
+    if tables:
+        incrementer_versions(session, tables)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _oublier_modifications(session):
+    session.info.pop(_CLE_TABLES_MODIFIEES, None)
+
+
+def calculer_etag(db: Session, tables: Iterable[str], *variantes: Any) -> str:
+    """
+    ETag faible d'une réponse dépendant de tables et de variantes
+    (paramètres de requête, utilisateur...)
+
+    tables contient des noms de TABLES_VERSIONNEES ou des clés version_assignations_*.
+    """
+    tables = list(tables)
+    non_versionnees = {table.split(":", 1)[0] for table in tables} - TABLES_VERSIONNEES
+    if non_versionnees:
+        raise ValueError(f"Tables sans version : {sorted(non_versionnees)}")
+    versions = versions_tables(db, tables)
+    empreinte = "|".join([
+        *(f"{table}:{versions[table]}" for table in sorted(versions)),
+        *(str(variante) for variante in variantes)
+    ])
+    return 'W/"' + hashlib.sha1(empreinte.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def calculer_etag_contenu(contenu: Any) -> str:
+    """
+    ETag faible calculé à partir du contenu d'une réponse déjà construite
+    (réponses mises en cache : l'empreinte n'est calculée qu'une fois)
+    """
+    donnees = json.dumps(jsonable_encoder(contenu), sort_keys=True, separators=(",", ":"))
+    return 'W/"' + hashlib.sha1(donnees.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def non_modifie(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Retourne une réponse 304 si le client possède déjà cette version,
+    sinon ajoute l'ETag aux en-têtes de la réponse et retourne None
+    """
+    en_tetes = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    candidats = {valeur.strip() for valeur in request.headers.get("if-none-match", "").split(",")}
+    if etag in candidats or "*" in candidats:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=en_tetes)
+    response.headers.update(en_tetes)
+    return None
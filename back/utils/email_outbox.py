@@ -0,0 +1,362 @@
+"""
+File d'attente transactionnelle des emails (outbox)
+
+Les emails sont enregistrés dans la table email_outbox dans la même transaction
+que les données métier, puis envoyés par un worker en arrière-plan avec
+reprises, backoff exponentiel et mise à l'écart après trop d'échecs.
+
+Les notifications d'assignation sont regroupées par destinataire : elles
+attendent FENETRE_DIGEST secondes et toutes celles en attente pour un même
+étudiant partent dans un seul email récapitulatif.
+"""
+
+import json
+import secrets
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+from datetime import datetime, timedelta
+from email.message import Message
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal
+from models import EmailOutbox, StatutEmailEnum
+from utils.email_service import email_service
+from utils.insertion_masse import inserer_en_masse
+from utils.repartiteur_emails import PRIORITE_IDENTIFIANTS, PRIORITE_NOTIFICATION
+
+# Configuration du worker
+TAILLE_LOT = 50                  # Emails traités par passe
+INTERVALLE_SCRUTATION = 5        # Secondes entre deux passes quand la file est vide
+MAX_TENTATIVES = 5               # Au-delà, l'email passe en ECHEC (dead letter)
+DELAI_BASE_REPRISE = 30          # Secondes avant la première reprise, doublé à chaque échec
+DELAI_MAX_REPRISE = 3600         # Plafond du backoff
+DUREE_BAIL = 300                 # Un email EN_COURS depuis plus longtemps est repris
+DELAI_ATTENTE_LOT = 150          # Attente maximale des envois d'un lot, inférieure au bail
+FENETRE_DIGEST = 300             # Secondes d'attente pour regrouper les assignations (0 = envoi immédiat)
+
+TYPE_ASSIGNATION_TRAVAIL = "ASSIGNATION_TRAVAIL"
+TYPE_CREATION_COMPTE = "CREATION_COMPTE"
+
+# Paramètres effacés de l'outbox dès que l'email est envoyé ou abandonné :
+# le mot de passe initial n'est conservé que le temps de l'envoyer
+PARAMETRES_SECRETS = ("mot_de_passe",)
+
+# Type d'email -> (construction du message à partir des paramètres enregistrés, priorité).
+# Les messages d'un lot sont tous soumis au répartiteur (file à priorités, envois
+# parallèles, quotas) puis attendus ensemble ; l'erreur réelle de chaque envoi
+# (disjoncteur, délai, SMTP) est conservée dans derniere_erreur.
+MESSAGES: Dict[str, Tuple[Callable[..., Message], int]] = {
+    TYPE_ASSIGNATION_TRAVAIL: (lambda **p: email_service.message_assignation_travail(**p), PRIORITE_NOTIFICATION),
+    TYPE_CREATION_COMPTE: (lambda **p: email_service.message_creation_compte(**p), PRIORITE_IDENTIFIANTS),
+}
+
+
+def _message_digest_travaux(liste_parametres: List[Dict[str, Any]]) -> Message:
+    premier = liste_parametres[0]
+    travaux = [
+        {cle: p[cle] for cle in ("titre_travail", "nom_matiere", "formateur", "date_echeance", "description")}
+        for p in liste_parametres
+    ]
+    return email_service.message_digest_travaux(
+        destinataire=premier["destinataire"],
+        prenom=premier["prenom"],
+        travaux=travaux
+    )
+
+
+# Types regroupables par destinataire -> (construction du message à partir de la liste des paramètres, priorité)
+MESSAGES_DIGEST: Dict[str, Tuple[Callable[[List[Dict[str, Any]]], Message], int]] = {
+    TYPE_ASSIGNATION_TRAVAIL: (_message_digest_travaux, PRIORITE_NOTIFICATION),
+}
+
+
+def _date_premiere_tentative(type_email: str, maintenant: datetime) -> datetime:
+    if type_email in MESSAGES_DIGEST:
+        return maintenant + timedelta(seconds=FENETRE_DIGEST)
+    return maintenant
+
+
+def mettre_en_file_email(db: Session, type_email: str, destinataire: str, **parametres: Any) -> EmailOutbox:
+    """
+    Ajoute un email à la file sans valider la transaction :
+    il ne sera envoyé que si l'appelant fait db.commit()
+    """
+    if type_email not in MESSAGES:
+        raise ValueError(f"Type d'email inconnu: {type_email}")
+
+    email = EmailOutbox(
+        type_email=type_email,
+        destinataire=destinataire,
+        parametres=json.dumps({"destinataire": destinataire, **parametres}, default=str),
+        statut=StatutEmailEnum.EN_ATTENTE,
+        tentatives=0,
+        prochaine_tentative=_date_premiere_tentative(type_email, datetime.utcnow()),
+        date_creation=datetime.utcnow()
+    )
+    db.add(email)
+    return email
+
+
+def mettre_en_file_emails_en_masse(db: Session, type_email: str,
+                                   emails: List[Dict[str, Any]], taille_lot: int = 1000) -> int:
+    """
+    Version en masse de mettre_en_file_email : chaque élément contient
+    "destinataire" et les paramètres du modèle. Insertion par lots, sans commit.
+    """
+    if type_email not in MESSAGES:
+        raise ValueError(f"Type d'email inconnu: {type_email}")
+
+    maintenant = datetime.utcnow()
+    lignes = [
+        {
+            "id_email": secrets.token_urlsafe(16),
+            "type_email": type_email,
+            "destinataire": parametres["destinataire"],
+            "parametres": json.dumps(parametres, default=str),
+            "statut": StatutEmailEnum.EN_ATTENTE,
+            "tentatives": 0,
+            "prochaine_tentative": _date_premiere_tentative(type_email, maintenant),
+            "derniere_erreur": None,
+            "date_creation": maintenant,
+            "date_envoi": None
+        }
+        for parametres in emails
+    ]
+
+    for debut in range(0, len(lignes), taille_lot):
+        inserer_en_masse(db, EmailOutbox.__table__, lignes[debut:debut + taille_lot])
+
+    return len(lignes)
+
+
+def calculer_delai_reprise(tentatives: int) -> timedelta:
+    """Backoff exponentiel : 30s, 60s, 120s... plafonné à DELAI_MAX_REPRISE"""
+    secondes = DELAI_BASE_REPRISE * (2 ** max(tentatives - 1, 0))
+    return timedelta(seconds=min(secondes, DELAI_MAX_REPRISE))
+
+
+def _effacer_secrets(email: EmailOutbox):
+    """Retire les paramètres secrets d'un email qui ne sera plus envoyé"""
+    parametres = json.loads(email.parametres)
+    if any(nom in parametres for nom in PARAMETRES_SECRETS):
+        email.parametres = json.dumps(
+            {nom: valeur for nom, valeur in parametres.items() if nom not in PARAMETRES_SECRETS}, default=str
+        )
+
+
+def reserver_emails(db: Session, limite: int = TAILLE_LOT) -> List[List[EmailOutbox]]:
+    """
+    Réserve les emails dus en les passant EN_COURS pour la durée du bail,
+    afin que plusieurs workers ne les envoient pas en double.
+
+    Retourne des groupes d'emails à envoyer ensemble : pour un type regroupable,
+    les autres emails en attente du même destinataire rejoignent le groupe
+    même si leur fenêtre n'est pas écoulée.
+    """
+    maintenant = datetime.utcnow()
+    emails = db.query(EmailOutbox).filter(
+        or_(
+            EmailOutbox.statut == StatutEmailEnum.EN_ATTENTE,
+            EmailOutbox.statut == StatutEmailEnum.EN_COURS
+        ),
+        EmailOutbox.prochaine_tentative <= maintenant
+    ).order_by(
+        EmailOutbox.prochaine_tentative
+    ).limit(limite).with_for_update(skip_locked=True).all()
+
+    groupes: Dict[tuple, List[EmailOutbox]] = {}
+    for email in emails:
+        if email.statut == StatutEmailEnum.EN_COURS:
+            # Bail expiré : le worker s'est arrêté pendant l'envoi, ce qui compte
+            # comme une tentative (un message qui fait tomber le worker finit en ECHEC)
+            email.tentatives += 1
+            email.derniere_erreur = "Bail expiré : envoi interrompu"
+            if email.tentatives >= MAX_TENTATIVES:
+                email.statut = StatutEmailEnum.ECHEC
+                _effacer_secrets(email)
+                print(f"✗ Email {email.id_email} abandonné après {email.tentatives} tentatives: bail expiré")
+                continue
+        if email.type_email in MESSAGES_DIGEST:
+            cle = (email.type_email, email.destinataire)
+        else:
+            cle = (email.type_email, email.id_email)
+        groupes.setdefault(cle, []).append(email)
+
+    # Compléter les groupes avec les emails en attente des mêmes destinataires
+    for (type_email, destinataire), groupe in groupes.items():
+        if type_email not in MESSAGES_DIGEST:
+            continue
+        deja_reserves = {email.id_email for email in groupe}
+        en_attente = db.query(EmailOutbox).filter(
+            EmailOutbox.type_email == type_email,
+            EmailOutbox.destinataire == destinataire,
+            EmailOutbox.statut == StatutEmailEnum.EN_ATTENTE
+        ).with_for_update(skip_locked=True).all()
+        groupe.extend(email for email in en_attente if email.id_email not in deja_reserves)
+
+    for groupe in groupes.values():
+        groupe.sort(key=lambda email: email.date_creation)
+        for email in groupe:
+            email.statut = StatutEmailEnum.EN_COURS
+            email.prochaine_tentative = maintenant + timedelta(seconds=DUREE_BAIL)
+
+    db.commit()
+    return list(groupes.values())
+
+
+def _soumettre_groupe(emails: List[EmailOutbox]) -> Future:
+    """Construit le message du groupe (un récapitulatif si le type est regroupable) et le soumet au répartiteur"""
+    type_email = emails[0].type_email
+    try:
+        if len(emails) > 1:
+            construire, priorite = MESSAGES_DIGEST[type_email]
+            message = construire([json.loads(email.parametres) for email in emails])
+        else:
+            construire, priorite = MESSAGES[type_email]
+            message = construire(**json.loads(emails[0].parametres))
+        return email_service.soumettre(message, priorite)
+    except Exception as e:
+        envoi = Future()
+        envoi.set_exception(e)
+        return envoi
+
+
+def _enregistrer_resultat(emails: List[EmailOutbox], erreur: Optional[str], maintenant: datetime):
+    """Succès, reprise avec backoff ou échec définitif de chaque email du groupe"""
+    for email in emails:
+        email.tentatives += 1
+        if erreur is None:
+            email.statut = StatutEmailEnum.ENVOYE
+            email.date_envoi = maintenant
+            email.derniere_erreur = None
+            _effacer_secrets(email)
+        elif email.tentatives >= MAX_TENTATIVES:
+            email.statut = StatutEmailEnum.ECHEC
+            email.derniere_erreur = erreur
+            _effacer_secrets(email)
+            print(f"✗ Email {email.id_email} abandonné après {email.tentatives} tentatives: {erreur}")
+        else:
+            email.statut = StatutEmailEnum.EN_ATTENTE
+            email.prochaine_tentative = maintenant + calculer_delai_reprise(email.tentatives)
+            email.derniere_erreur = erreur
+
+
+def envoyer_groupes_outbox(db: Session, groupes: List[List[EmailOutbox]]) -> List[Optional[bool]]:
+    """
+    Soumet tous les groupes réservés au répartiteur puis attend leurs envois
+    ensemble, au plus DELAI_ATTENTE_LOT secondes (bien avant la fin du bail).
+    Un message encore en file à l'échéance (quota du fournisseur épuisé) est
+    retiré de la file et rendu à l'outbox sans compter de tentative.
+    Retourne, par groupe : True (envoyé), False (échec) ou None (reporté).
+    """
+    envois = [_soumettre_groupe(groupe) for groupe in groupes]
+    wait(envois, timeout=DELAI_ATTENTE_LOT)
+
+    maintenant = datetime.utcnow()
+    resultats: List[Optional[bool]] = []
+    for groupe, envoi in zip(groupes, envois):
+        if not envoi.done() and envoi.cancel():
+            for email in groupe:
+                email.statut = StatutEmailEnum.EN_ATTENTE
+                email.prochaine_tentative = maintenant
+            resultats.append(None)
+            continue
+
+        erreur = None
+        try:
+            # Envoi déjà commencé : il se termine dans le délai SMTP
+            envoi.result(timeout=email_service.delai_max_envoi)
+        except FutureTimeoutError:
+            erreur = "Délai dépassé pour l'envoi de l'email"
+        except Exception as e:
+            erreur = str(e)
+        _enregistrer_resultat(groupe, erreur, maintenant)
+        resultats.append(erreur is None)
+
+    db.commit()
+    return resultats
+
+
+def envoyer_groupe_outbox(db: Session, emails: List[EmailOutbox]) -> bool:
+    """
+    Envoie un groupe d'emails réservés (un seul message si le type est regroupable)
+    et enregistre le résultat sur chacun : succès, reprise ou échec définitif
+    """
+    return envoyer_groupes_outbox(db, [emails])[0] is True
+
+
+def envoyer_email_outbox(db: Session, email: EmailOutbox) -> bool:
+    """Envoie un email réservé et enregistre le résultat"""
+    return envoyer_groupe_outbox(db, [email])
+
+
+def traiter_file_emails(db: Session, limite: int = TAILLE_LOT) -> Dict[str, int]:
+    """Traite un lot d'emails dus et retourne le bilan de la passe"""
+    bilan = {"traites": 0, "envoyes": 0, "echecs": 0, "reportes": 0, "messages": 0}
+
+    groupes = reserver_emails(db, limite)
+    for groupe, resultat in zip(groupes, envoyer_groupes_outbox(db, groupes) if groupes else []):
+        bilan["traites"] += len(groupe)
+        bilan["messages"] += 1
+        if resultat is None:
+            bilan["reportes"] += len(groupe)
+        elif resultat:
+            bilan["envoyes"] += len(groupe)
+        else:
+            bilan["echecs"] += len(groupe)
+
+    return bilan
+
+
+class EmailOutboxWorker:
+    """Thread d'arrière-plan qui vide la file d'emails en continu"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self._reveil = threading.Event()
+        self._arret = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def demarrer(self):
+        """Démarre le worker s'il ne tourne pas déjà"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._boucle, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def arreter(self, timeout: float = 10):
+        """Arrête le worker après la passe en cours"""
+        self._arret.set()
+        self._reveil.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def notifier(self):
+        """Réveille le worker sans attendre l'intervalle de scrutation (après un commit)"""
+        self._reveil.set()
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            bilan = {"traites": 0}
+            db = self.session_factory()
+            try:
+                bilan = traiter_file_emails(db)
+            except Exception as e:
+                db.rollback()
+                print(f"Erreur du worker email: {e}")
+            finally:
+                db.close()
+
+            # Lot complet : il reste probablement des emails dus, on enchaîne
+            # (sauf si des envois ont été reportés faute de quota)
+            if bilan["traites"] < TAILLE_LOT or bilan.get("reportes"):
+                self._reveil.wait(INTERVALLE_SCRUTATION)
+                self._reveil.clear()
+
+
+# Instance globale du worker
+email_outbox_worker = EmailOutboxWorker()
@@ -1,142 +1,437 @@
+import asyncio
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from email.message import EmailMessage, Message
+from typing import Callable, Dict, Any, List, Optional
 import os
 
+from utils.email_templates import (
+    MODELE_ACTIVATION_COMPTE,
+    MODELE_CREATION_COMPTE,
+    MODELE_DIGEST_TRAVAUX,
+    construire_message,
+    preparer_assignation_travail,
+    rendre_liste_travaux
+)
+from utils.quota_emails import QuotaEmailsPartage
+from utils.repartiteur_emails import (
+    RepartiteurEmails,
+    PRIORITE_IDENTIFIANTS,
+    PRIORITE_NOTIFICATION
+)
+
+
+class EmailNonConfigureError(Exception):
+    """Aucun mot de passe SMTP n'est configuré"""
+
+
+class ConnexionSMTP:
+    """Session SMTP authentifiée réutilisable pour plusieurs messages"""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.nb_messages = 0
+        self.date_creation = time.monotonic()
+        self.derniere_utilisation = self.date_creation
+
+    def est_vivante(self) -> bool:
+        """Vérifie par un NOOP que le serveur n'a pas fermé la session"""
+        try:
+            code, _ = self.smtp.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def fermer(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.smtp.close()
+            except OSError:
+                pass
+
+
+class PoolConnexionsSMTP:
+    """
+    Pool de connexions SMTP persistantes
+
+    - au plus taille_max sessions ouvertes simultanément
+    - une session est fermée après max_messages_par_connexion envois
+    - une session inactive depuis plus de delai_verification secondes est testée
+      (NOOP) avant réutilisation, et remplacée si le serveur l'a fermée
+    """
+
+    def __init__(self, fabrique: Callable[[], smtplib.SMTP], taille_max: int = 3,
+                 max_messages_par_connexion: int = 100, delai_verification: float = 30):
+        self.fabrique = fabrique
+        self.taille_max = taille_max
+        self.max_messages_par_connexion = max_messages_par_connexion
+        self.delai_verification = delai_verification
+        self._disponibles: List[ConnexionSMTP] = []
+        self._verrou = threading.Lock()
+        self._places = threading.BoundedSemaphore(taille_max)
+        self.statistiques = {"connexions_ouvertes": 0, "reconnexions": 0, "messages_envoyes": 0}
+
+    def _obtenir(self) -> ConnexionSMTP:
+        while True:
+            with self._verrou:
+                connexion = self._disponibles.pop() if self._disponibles else None
+            if connexion is None:
+                connexion = ConnexionSMTP(self.fabrique())
+                self.statistiques["connexions_ouvertes"] += 1
+                return connexion
+            if time.monotonic() - connexion.derniere_utilisation < self.delai_verification:
+                return connexion
+            if connexion.est_vivante():
+                return connexion
+            connexion.fermer()
+            self.statistiques["reconnexions"] += 1
+
+    def _rendre(self, connexion: ConnexionSMTP):
+        connexion.derniere_utilisation = time.monotonic()
+        if connexion.nb_messages >= self.max_messages_par_connexion:
+            connexion.fermer()
+            return
+        with self._verrou:
+            self._disponibles.append(connexion)
+
+    @contextmanager
+    def connexion(self):
+        """Emprunte une session ; elle est jetée si une erreur survient pendant l'utilisation"""
+        self._places.acquire()
+        connexion = None
+        try:
+            connexion = self._obtenir()
+            yield connexion
+        except Exception:
+            if connexion is not None:
+                connexion.fermer()
+                connexion = None
+            raise
+        finally:
+            if connexion is not None:
+                self._rendre(connexion)
+            self._places.release()
+
+    def envoyer(self, message: Message):
+        """Envoie un message, en réessayant une fois sur une nouvelle session si l'ancienne est morte"""
+        for tentative in range(2):
+            try:
+                with self.connexion() as connexion:
+                    connexion.smtp.send_message(message)
+                    connexion.nb_messages += 1
+                self.statistiques["messages_envoyes"] += 1
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                if tentative == 1:
+                    raise
+                # Les autres sessions inactives ont probablement été coupées aussi
+                self.fermer()
+                self.statistiques["reconnexions"] += 1
+                print(f"Connexion SMTP perdue, reconnexion: {e}")
+
+    def fermer(self):
+        """Ferme toutes les sessions inactives"""
+        with self._verrou:
+            connexions, self._disponibles = self._disponibles, []
+        for connexion in connexions:
+            connexion.fermer()
+
+
 class EmailService:
     def __init__(self):
         self.smtp_server = "smtp.gmail.com"
         self.smtp_port = 587
+        self.smtp_starttls = True
         self.email_sender = "tfxyesu@gmail.com"
         # Pour Gmail, il faut utiliser un "App Password" pas le mot de passe normal
         self.email_password = "ybbc zyld mxbj olui"  # Mot de passe d'application Gmail
+        # Pool de connexions SMTP
+        self.taille_pool = 3
+        self.max_messages_par_connexion = 100
+        self._pool: Optional[PoolConnexionsSMTP] = None
+        self._verrou_pool = threading.Lock()
+        # Répartiteur : threads d'envoi, quotas du fournisseur (Gmail) et disjoncteur
+        self.envois_simultanes_max = 3
+        self.limite_par_minute = 20
+        self.limite_par_jour = 500
+        self.delai_max_envoi = 60  # Secondes avant d'abandonner l'attente d'un envoi
+        # Sessions des compteurs d'envoi communs à tous les processus (None : quotas propres au processus)
+        self.session_factory_quota: Optional[Callable] = None
+        self._repartiteur: Optional[RepartiteurEmails] = None
     
     def configurer_mot_de_passe(self, mot_de_passe: str):
         """Configure le mot de passe pour l'envoi d'emails"""
         self.email_password = mot_de_passe
+        self.reinitialiser_pool()
+    
+    def configurer_pool(self, taille_pool: int = None, max_messages_par_connexion: int = None):
+        """Configure la taille du pool SMTP et le nombre de messages par connexion"""
+        if taille_pool is not None:
+            self.taille_pool = taille_pool
+        if max_messages_par_connexion is not None:
+            self.max_messages_par_connexion = max_messages_par_connexion
+        self.reinitialiser_pool()
+    
+    def configurer_debit(self, limite_par_minute: int = None, limite_par_jour: int = None,
+                         session_factory_quota: Optional[Callable] = None):
+        """
+        Configure les quotas d'envoi du fournisseur (messages par minute et par jour).
+        Avec session_factory_quota, les quotas sont comptés en base pour tous les processus.
+        """
+        if limite_par_minute is not None:
+            self.limite_par_minute = limite_par_minute
+        if limite_par_jour is not None:
+            self.limite_par_jour = limite_par_jour
+        if session_factory_quota is not None:
+            self.session_factory_quota = session_factory_quota
+        with self._verrou_pool:
+            repartiteur, self._repartiteur = self._repartiteur, None
+        if repartiteur:
+            repartiteur.arreter()
+    
+    def reinitialiser_pool(self):
+        """Ferme les connexions existantes ; le pool sera recréé au prochain envoi"""
+        with self._verrou_pool:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.fermer()
+    
+    def _ouvrir_connexion(self) -> smtplib.SMTP:
+        """Ouvre et authentifie une nouvelle session SMTP"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        if self.smtp_starttls:
+            server.starttls()
+        if self.email_password:
+            server.login(self.email_sender, self.email_password)
+        return server
+    
+    def _obtenir_pool(self) -> PoolConnexionsSMTP:
+        with self._verrou_pool:
+            if self._pool is None:
+                self._pool = PoolConnexionsSMTP(
+                    self._ouvrir_connexion,
+                    taille_max=self.taille_pool,
+                    max_messages_par_connexion=self.max_messages_par_connexion
+                )
+            return self._pool
+    
+    def _envoyer_smtp(self, message: Message):
+        """Envoie un message via une connexion du pool (appelé par les threads du répartiteur)"""
+        self._obtenir_pool().envoyer(message)
+    
+    def _obtenir_repartiteur(self) -> RepartiteurEmails:
+        with self._verrou_pool:
+            if self._repartiteur is None:
+                quota_partage = None
+                if self.session_factory_quota is not None:
+                    quota_partage = QuotaEmailsPartage(
+                        self.session_factory_quota,
+                        limite_par_minute=self.limite_par_minute,
+                        limite_par_jour=self.limite_par_jour
+                    )
+                self._repartiteur = RepartiteurEmails(
+                    self._envoyer_smtp,
+                    nb_threads=self.envois_simultanes_max,
+                    limite_par_minute=self.limite_par_minute,
+                    limite_par_jour=self.limite_par_jour,
+                    quota_partage=quota_partage
+                )
+            return self._repartiteur
+    
+    def soumettre(self, message: Message, priorite: int = PRIORITE_NOTIFICATION) -> Future:
+        """Met un message dans la file du répartiteur et retourne le Future de son envoi"""
+        if not self.email_password:
+            raise EmailNonConfigureError("Mot de passe email non configuré")
+        return self._obtenir_repartiteur().soumettre(message, priorite)
+    
+    def envoyer_message(self, message: Message, priorite: int = PRIORITE_NOTIFICATION):
+        """Envoie un message et attend le résultat ; lève l'erreur d'envoi le cas échéant"""
+        future = self.soumettre(message, priorite)
+        try:
+            future.result(timeout=self.delai_max_envoi)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Délai dépassé pour l'envoi de l'email à {message['To']}")
+    
+    async def envoyer_message_async(self, message: Message, priorite: int = PRIORITE_NOTIFICATION):
+        """Version awaitable de envoyer_message, sans bloquer la boucle d'événements"""
+        future = self.soumettre(message, priorite)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.delai_max_envoi)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Délai dépassé pour l'envoi de l'email à {message['To']}")
+    
+    def metriques(self) -> Dict[str, Any]:
+        """Métriques du répartiteur (files, débit, disjoncteur) et du pool SMTP"""
+        metriques = self._obtenir_repartiteur().metriques()
+        metriques["pool_smtp"] = dict(self._pool.statistiques) if self._pool else None
+        return metriques
+    
+    def fermer(self):
+        """Termine les envois en cours et ferme les connexions SMTP (arrêt de l'application)"""
+        with self._verrou_pool:
+            repartiteur, self._repartiteur = self._repartiteur, None
+        if repartiteur:
+            repartiteur.arreter()
+        self.reinitialiser_pool()
+    
+    # ==================== CONSTRUCTION DES MESSAGES ====================
+    
+    def message_creation_compte(self, destinataire: str, prenom: str,
+                                email: str, mot_de_passe: str, role: str) -> Message:
+        """Email de création de compte avec identifiants"""
+        corps_message = MODELE_CREATION_COMPTE.rendre(
+            prenom=prenom,
+            email=email,
+            mot_de_passe=mot_de_passe,
+            role=role,
+            role_minuscule=role.lower()
+        )
+        return self._message_texte(destinataire, f"Création de votre compte {role.lower()}", corps_message)
+    
+    def message_activation_compte(self, destinataire: str, prenom: str, identifiant: str,
+                                  mot_de_passe: str, token_activation: str, role: str) -> Message:
+        """Email de création de compte avec identifiant et code d'activation (ancien parcours)"""
+        corps_message = MODELE_ACTIVATION_COMPTE.rendre(
+            prenom=prenom,
+            identifiant=identifiant,
+            email=destinataire,
+            mot_de_passe=mot_de_passe,
+            token_activation=token_activation,
+            role=role,
+            role_minuscule=role.lower()
+        )
+        return self._message_texte(destinataire, f"Création de votre compte {role.lower()}", corps_message)
+    
+    def message_assignation_travail(self, destinataire: str, prenom: str,
+                                    titre_travail: str, nom_matiere: str,
+                                    formateur: str, date_echeance: str,
+                                    description: str) -> Message:
+        """Email de notification d'assignation de travail"""
+        # Sujet et corps communs préparés une fois par travail, seul le prénom est encodé ici
+        sujet, corps = preparer_assignation_travail(
+            titre_travail, nom_matiere, formateur, date_echeance, description
+        )
+        return construire_message(self.email_sender, destinataire, sujet, corps.encoder(prenom=prenom))
+    
+    def message_digest_travaux(self, destinataire: str, prenom: str,
+                               travaux: List[Dict[str, Any]]) -> Message:
+        """
+        Email récapitulant plusieurs travaux assignés
+        Chaque travail contient titre_travail, nom_matiere, formateur, date_echeance
+        """
+        if len(travaux) == 1:
+            return self.message_assignation_travail(destinataire=destinataire, prenom=prenom, **travaux[0])
+        
+        corps_message = MODELE_DIGEST_TRAVAUX.rendre(
+            prenom=prenom,
+            nb_travaux=len(travaux),
+            liste_travaux=rendre_liste_travaux(travaux)
+        )
+        return self._message_texte(destinataire, f"{len(travaux)} nouveaux travaux assignés", corps_message)
+    
+    def _message_texte(self, destinataire: str, sujet: str, corps_message: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.email_sender
+        message["To"] = destinataire
+        message["Subject"] = sujet
+        message.set_content(corps_message, charset="utf-8")
+        return message
+    
+    # ==================== ENVOIS ====================
+    
+    def _signaler_echec(self, erreur: Exception, objet: str, destinataire: str, details: Dict[str, Any]) -> bool:
+        """Journalise un envoi qui n'a pas abouti (service non configuré ou erreur d'envoi)"""
+        if isinstance(erreur, EmailNonConfigureError):
+            print("⚠️ Mot de passe email non configuré - Email non envoyé")
+            print(f"Destinataire: {destinataire}")
+            for libelle, valeur in details.items():
+                print(f"{libelle}: {valeur}")
+        else:
+            print(f"Erreur lors de l'envoi {objet} à {destinataire}: {type(erreur).__name__}: {erreur}")
+        return False
+    
+    def _envoyer(self, construire: Callable[[], Message], priorite: int, objet: str,
+                 destinataire: str, details: Dict[str, Any]) -> bool:
+        """Construit et envoie un message ; True si l'envoi a abouti"""
+        try:
+            self.envoyer_message(construire(), priorite)
+            return True
+        except Exception as e:
+            return self._signaler_echec(e, objet, destinataire, details)
+    
+    async def _envoyer_async(self, construire: Callable[[], Message], priorite: int, objet: str,
+                             destinataire: str, details: Dict[str, Any]) -> bool:
+        """Version awaitable de _envoyer"""
+        try:
+            await self.envoyer_message_async(construire(), priorite)
+            return True
+        except Exception as e:
+            return self._signaler_echec(e, objet, destinataire, details)
     
     def envoyer_email_creation_compte(self, destinataire: str, prenom: str, 
                                      email: str, mot_de_passe: str, role: str) -> bool:
         """Envoie un email de création de compte avec identifiants"""
-        try:
-            # Création du message
-            message = MIMEMultipart()
-            message["From"] = self.email_sender
-            message["To"] = destinataire
-            message["Subject"] = f"Création de votre compte {role.lower()}"
-            
-            # Corps du message
-            corps_message = f"""
-Bonjour {prenom},
-
-Votre compte {role.lower()} a été créé par le Directeur d'Établissement.
-
-Voici vos informations de connexion :
-• Email : {email}
-• Mot de passe : {mot_de_passe}
-• Rôle : {role}
-
-🔗 Pour vous connecter :
-Rendez-vous sur le site et connectez-vous avec ces identifiants.
-
-⚠️ Important :
-- Lors de votre première connexion, vous devrez obligatoirement changer votre mot de passe
-- Conservez ces informations en sécurité
-
-Si vous n'avez pas demandé la création de ce compte, veuillez ignorer cet email.
-
-Cordialement,
-L'équipe administrative
-            """
-            
-            message.attach(MIMEText(corps_message, "plain", "utf-8"))
-            
-            # Envoi de l'email
-            if self.email_password:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                server.starttls()
-                server.login(self.email_sender, self.email_password)
-                server.send_message(message)
-                server.quit()
-                return True
-            else:
-                print("⚠️ Mot de passe email non configuré - Email non envoyé")
-                print(f"Destinataire: {destinataire}")
-                print(f"Email: {email}")
-                print(f"Mot de passe: {mot_de_passe}")
-                return False
-                
-        except Exception as e:
-            print(f"Erreur lors de l'envoi de l'email: {e}")
-            return False
+        return self._envoyer(
+            lambda: self.message_creation_compte(destinataire, prenom, email, mot_de_passe, role),
+            PRIORITE_IDENTIFIANTS, "de l'email", destinataire, {"Email": email, "Mot de passe": mot_de_passe}
+        )
+    
+    async def envoyer_email_creation_compte_async(self, destinataire: str, prenom: str,
+                                                  email: str, mot_de_passe: str, role: str) -> bool:
+        """Version awaitable de envoyer_email_creation_compte (file prioritaire des identifiants)"""
+        return await self._envoyer_async(
+            lambda: self.message_creation_compte(destinataire, prenom, email, mot_de_passe, role),
+            PRIORITE_IDENTIFIANTS, "de l'email", destinataire, {"Email": email, "Mot de passe": mot_de_passe}
+        )
 
     def envoyer_email_activation_compte(self, destinataire: str, prenom: str, 
                                        identifiant: str, mot_de_passe: str, 
                                        token_activation: str, role: str) -> bool:
         """Ancienne méthode - conservée pour compatibilité"""
-        return self.envoyer_email_creation_compte(destinataire, prenom, destinataire, mot_de_passe, role)
+        return self._envoyer(
+            lambda: self.message_activation_compte(destinataire, prenom, identifiant, mot_de_passe, token_activation, role),
+            PRIORITE_IDENTIFIANTS, "de l'email", destinataire, {"Identifiant": identifiant, "Mot de passe": mot_de_passe}
+        )
 
     def envoyer_email_assignation_travail(self, destinataire: str, prenom: str,
                                          titre_travail: str, nom_matiere: str,
                                          formateur: str, date_echeance: str,
                                          description: str) -> bool:
         """Envoie un email de notification d'assignation de travail"""
-        try:
-            # Création du message
-            message = MIMEMultipart()
-            message["From"] = self.email_sender
-            message["To"] = destinataire
-            message["Subject"] = f"Nouveau travail assigné : {titre_travail}"
-            
-            # Corps du message
-            corps_message = f"""
-Bonjour {prenom},
-
-Un nouveau travail vous a été assigné dans le cours {nom_matiere}.
-
-📋 Détails du travail :
-• Titre : {titre_travail}
-• Matière : {nom_matiere}
-• Formateur : {formateur}
-• Date d'échéance : {date_echeance}
-
-📝 Description :
-{description}
-
-🔗 Pour consulter et soumettre votre travail :
-Connectez-vous à votre espace étudiant sur la plateforme.
-
-⚠️ Important :
-- Respectez la date d'échéance
-- Consultez régulièrement vos travaux assignés
-- Contactez votre formateur en cas de questions
-
-Bon travail !
-
-L'équipe pédagogique
-            """
-            
-            message.attach(MIMEText(corps_message, "plain", "utf-8"))
-            
-            # Envoi de l'email
-            if self.email_password:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                server.starttls()
-                server.login(self.email_sender, self.email_password)
-                server.send_message(message)
-                server.quit()
-                return True
-            else:
-                print("⚠️ Mot de passe email non configuré - Email non envoyé")
-                print(f"Destinataire: {destinataire}")
-                print(f"Travail: {titre_travail}")
-                return False
-                
-        except Exception as e:
-            print(f"Erreur lors de l'envoi de l'email d'assignation: {e}")
-            return False
+        return self._envoyer(
+            lambda: self.message_assignation_travail(
+                destinataire, prenom, titre_travail, nom_matiere, formateur, date_echeance, description
+            ),
+            PRIORITE_NOTIFICATION, "de l'email d'assignation", destinataire, {"Travail": titre_travail}
+        )
     
+    async def envoyer_email_assignation_travail_async(self, destinataire: str, prenom: str,
+                                                      titre_travail: str, nom_matiere: str,
+                                                      formateur: str, date_echeance: str,
+                                                      description: str) -> bool:
+        """Version awaitable de envoyer_email_assignation_travail"""
+        return await self._envoyer_async(
+            lambda: self.message_assignation_travail(
+                destinataire, prenom, titre_travail, nom_matiere, formateur, date_echeance, description
+            ),
+            PRIORITE_NOTIFICATION, "de l'email d'assignation", destinataire, {"Travail": titre_travail}
+        )
+
+    def envoyer_email_digest_travaux(self, destinataire: str, prenom: str,
+                                     travaux: List[Dict[str, Any]]) -> bool:
+        """Envoie un seul email récapitulant plusieurs travaux assignés"""
+        return self._envoyer(
+            lambda: self.message_digest_travaux(destinataire, prenom, travaux),
+            PRIORITE_NOTIFICATION, "du récapitulatif de travaux", destinataire, {"Travaux": len(travaux)}
+        )
+
     def envoyer_email_test(self) -> bool:
         """Envoie un email de test pour vérifier la configuration"""
         return self.envoyer_email_activation_compte(
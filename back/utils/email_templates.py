@@ -0,0 +1,256 @@
+"""
+Modèles d'emails précompilés
+
+Chaque modèle est découpé une seule fois (au chargement du module) en segments
+littéraux et champs {nom}. Un modèle peut être partiellement rendu (champs
+communs à tous les destinataires) puis encodé : les lignes qui ne dépendent
+plus que de constantes sont encodées en quoted-printable une seule fois, et
+seules les lignes contenant des champs propres au destinataire sont encodées
+à chaque envoi.
+"""
+
+import re
+import email.quoprimime
+from email.header import Header
+from email.message import Message
+from functools import lru_cache
+from typing import Dict, List, Tuple, Union
+
+_CHAMP = re.compile(r"\{(\w+)\}")
+
+
+def _encoder_qp(texte: str) -> str:
+    """Encode du texte UTF-8 en quoted-printable (ligne par ligne, donc concaténable)"""
+    return email.quoprimime.body_encode(texte.encode("utf-8").decode("latin-1"))
+
+
+def encoder_entete(valeur: str) -> str:
+    """Encode une valeur d'en-tête (RFC 2047) pour la réutiliser telle quelle"""
+    return Header(valeur, "utf-8").encode()
+
+
+class ModeleEmail:
+    """Modèle compilé : alternance de textes littéraux et de noms de champs"""
+
+    def __init__(self, segments: List[Union[str, Tuple[str]]]):
+        # Un segment str est littéral, un tuple (nom,) est un champ à remplacer
+        self.segments = segments
+        self.champs = {segment[0] for segment in segments if isinstance(segment, tuple)}
+
+    @classmethod
+    def compiler(cls, texte: str) -> "ModeleEmail":
+        segments: List[Union[str, Tuple[str]]] = []
+        position = 0
+        for correspondance in _CHAMP.finditer(texte):
+            if correspondance.start() > position:
+                segments.append(texte[position:correspondance.start()])
+            segments.append((correspondance.group(1),))
+            position = correspondance.end()
+        if position < len(texte):
+            segments.append(texte[position:])
+        return cls(segments)
+
+    def rendre(self, **valeurs) -> str:
+        return "".join(
+            segment if isinstance(segment, str) else str(valeurs[segment[0]])
+            for segment in self.segments
+        )
+
+    def partiel(self, **valeurs) -> "ModeleEmail":
+        """Remplace les champs fournis et retourne le modèle restant, littéraux fusionnés"""
+        segments: List[Union[str, Tuple[str]]] = []
+        for segment in self.segments:
+            if isinstance(segment, tuple) and segment[0] in valeurs:
+                segment = str(valeurs[segment[0]])
+            if isinstance(segment, str) and segments and isinstance(segments[-1], str):
+                segments[-1] += segment
+            else:
+                segments.append(segment)
+        return ModeleEmail(segments)
+
+    def encodage(self) -> "CorpsEncode":
+        return CorpsEncode(self)
+
+
+class CorpsEncode:
+    """
+    Corps d'email prêt à l'envoi : les lignes sans champ sont déjà encodées,
+    les lignes avec champ restent des modèles rendus puis encodés par destinataire
+    """
+
+    def __init__(self, modele: ModeleEmail):
+        self.blocs: List[Union[str, ModeleEmail]] = []
+        texte_fixe = ""
+        for ligne in self._lignes(modele):
+            if ligne.champs:
+                if texte_fixe:
+                    self.blocs.append(_encoder_qp(texte_fixe))
+                    texte_fixe = ""
+                self.blocs.append(ligne)
+            else:
+                texte_fixe += ligne.rendre()
+        if texte_fixe:
+            self.blocs.append(_encoder_qp(texte_fixe))
+
+    @staticmethod
+    def _lignes(modele: ModeleEmail) -> List[ModeleEmail]:
+        """Découpe un modèle en lignes (fin de ligne incluse)"""
+        lignes: List[List[Union[str, Tuple[str]]]] = [[]]
+        for segment in modele.segments:
+            if isinstance(segment, tuple):
+                lignes[-1].append(segment)
+                continue
+            morceaux = segment.split("\n")
+            for i, morceau in enumerate(morceaux):
+                fin = "\n" if i < len(morceaux) - 1 else ""
+                if morceau or fin:
+                    lignes[-1].append(morceau + fin)
+                if fin:
+                    lignes.append([])
+        return [ModeleEmail(segments) for segments in lignes if segments]
+
+    def encoder(self, **valeurs) -> str:
+        """Corps encodé en quoted-printable pour un destinataire"""
+        return "".join(
+            bloc if isinstance(bloc, str) else _encoder_qp(bloc.rendre(**valeurs))
+            for bloc in self.blocs
+        )
+
+
+def construire_message(expediteur: str, destinataire: str, sujet_encode: str, corps_encode: str) -> Message:
+    """Assemble un message texte à partir d'un sujet et d'un corps déjà encodés"""
+    message = Message()
+    message["MIME-Version"] = "1.0"
+    message["Content-Type"] = 'text/plain; charset="utf-8"'
+    message["Content-Transfer-Encoding"] = "quoted-printable"
+    message["From"] = expediteur
+    message["To"] = destinataire
+    message["Subject"] = sujet_encode
+    message.set_payload(corps_encode)
+    return message
+
+
+# ==================== MODÈLES ====================
+
+MODELE_CREATION_COMPTE = ModeleEmail.compiler("""
+Bonjour {prenom},
+
+Votre compte {role_minuscule} a été créé par le Directeur d'Établissement.
+
+Voici vos informations de connexion :
+• Email : {email}
+• Mot de passe : {mot_de_passe}
+• Rôle : {role}
+
+🔗 Pour vous connecter :
+Rendez-vous sur le site et connectez-vous avec ces identifiants.
+
+⚠️ Important :
+- Lors de votre première connexion, vous devrez obligatoirement changer votre mot de passe
+- Conservez ces informations en sécurité
+
+Si vous n'avez pas demandé la création de ce compte, veuillez ignorer cet email.
+
+Cordialement,
+L'équipe administrative
+""")
+
+MODELE_ACTIVATION_COMPTE = ModeleEmail.compiler("""
+Bonjour {prenom},
+
+Votre compte {role_minuscule} a été créé par le Directeur d'Établissement.
+
+Voici vos informations de connexion :
+• Identifiant : {identifiant}
+• Email : {email}
+• Mot de passe : {mot_de_passe}
+• Rôle : {role}
+• Code d'activation : {token_activation}
+
+🔗 Pour vous connecter :
+Rendez-vous sur le site et connectez-vous avec ces identifiants.
+
+⚠️ Important :
+- Lors de votre première connexion, vous devrez obligatoirement changer votre mot de passe
+- Conservez ces informations en sécurité
+
+Si vous n'avez pas demandé la création de ce compte, veuillez ignorer cet email.
+
+Cordialement,
+L'équipe administrative
+""")
+
+MODELE_ASSIGNATION_TRAVAIL = ModeleEmail.compiler("""
+Bonjour {prenom},
+
+Un nouveau travail vous a été assigné dans le cours {nom_matiere}.
+
+📋 Détails du travail :
+• Titre : {titre_travail}
+• Matière : {nom_matiere}
+• Formateur : {formateur}
+• Date d'échéance : {date_echeance}
+
+📝 Description :
+{description}
+
+🔗 Pour consulter et soumettre votre travail :
+Connectez-vous à votre espace étudiant sur la plateforme.
+
+⚠️ Important :
+- Respectez la date d'échéance
+- Consultez régulièrement vos travaux assignés
+- Contactez votre formateur en cas de questions
+
+Bon travail !
+
+L'équipe pédagogique
+""")
+
+MODELE_DIGEST_TRAVAUX = ModeleEmail.compiler("""
+Bonjour {prenom},
+
+{nb_travaux} nouveaux travaux vous ont été assignés.
+
+📋 Récapitulatif :
+{liste_travaux}
+🔗 Pour consulter les descriptions et soumettre vos travaux :
+Connectez-vous à votre espace étudiant sur la plateforme.
+
+⚠️ Important :
+- Respectez les dates d'échéance
+- Consultez régulièrement vos travaux assignés
+- Contactez vos formateurs en cas de questions
+
+Bon travail !
+
+L'équipe pédagogique
+""")
+
+MODELE_DIGEST_ELEMENT = ModeleEmail.compiler("""• {titre_travail}
+    Matière : {nom_matiere}
+    Formateur : {formateur}
+    Date d'échéance : {date_echeance}
+""")
+
+
+@lru_cache(maxsize=256)
+def preparer_assignation_travail(titre_travail: str, nom_matiere: str, formateur: str,
+                                 date_echeance: str, description: str) -> Tuple[str, CorpsEncode]:
+    """
+    Sujet encodé et corps pré-rendu d'une notification de travail,
+    calculés une fois par travail ; seul le prénom reste à remplir
+    """
+    sujet = encoder_entete(f"Nouveau travail assigné : {titre_travail}")
+    corps = MODELE_ASSIGNATION_TRAVAIL.partiel(
+        titre_travail=titre_travail,
+        nom_matiere=nom_matiere,
+        formateur=formateur,
+        date_echeance=date_echeance,
+        description=description
+    ).encodage()
+    return sujet, corps
+
+
+def rendre_liste_travaux(travaux: List[Dict[str, str]]) -> str:
+    return "\n".join(MODELE_DIGEST_ELEMENT.rendre(**travail) for travail in travaux)
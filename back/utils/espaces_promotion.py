@@ -0,0 +1,84 @@
+"""
+Espaces pédagogiques d'une promotion, partagés entre les étudiants
+
+Donnée identique pour tous les étudiants d'une promotion (mes-cours,
+dashboard étudiant) : les appels concurrents sont regroupés en un seul
+calcul (voir utils/single_flight.py).
+"""
+
+from typing import Any, Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal
+from models import EspacePedagogique, Promotion, Formation, Formateur, Utilisateur, Travail
+from utils.single_flight import single_flight
+
+
+def lister_espaces_promotion(db: Session, id_promotion: str) -> List[Dict[str, Any]]:
+    """Espaces de la promotion avec formation, formateur et nombre de travaux, en une requête"""
+    nb_travaux = db.query(
+        Travail.id_espace.label("id_espace"),
+        func.count(Travail.id_travail).label("nb")
+    ).join(EspacePedagogique).filter(
+        EspacePedagogique.id_promotion == id_promotion
+    ).group_by(Travail.id_espace).subquery()
+
+    espaces = db.query(
+        EspacePedagogique.id_espace,
+        EspacePedagogique.nom_matiere,
+        EspacePedagogique.description,
+        EspacePedagogique.code_acces,
+        Formation.nom_formation,
+        Utilisateur.nom.label("formateur_nom"),
+        Utilisateur.prenom.label("formateur_prenom"),
+        Utilisateur.email.label("formateur_email"),
+        func.coalesce(nb_travaux.c.nb, 0).label("nb_travaux")
+    ).join(
+        Promotion, Promotion.id_promotion == EspacePedagogique.id_promotion
+    ).join(
+        Formation, Formation.id_formation == Promotion.id_formation
+    ).outerjoin(
+        Formateur, Formateur.id_formateur == EspacePedagogique.id_formateur
+    ).outerjoin(
+        Utilisateur, Utilisateur.identifiant == Formateur.identifiant
+    ).outerjoin(
+        nb_travaux, nb_travaux.c.id_espace == EspacePedagogique.id_espace
+    ).filter(
+        EspacePedagogique.id_promotion == id_promotion
+    ).order_by(EspacePedagogique.id_espace).all()
+
+    return [dict(espace._mapping) for espace in espaces]
+
+
+def _calculer_espaces_promotion(moteur: Engine, id_promotion: str) -> List[Dict[str, Any]]:
+    """Calcul partagé, dans sa propre session : il ne dépend pas de la session d'un des appelants"""
+    db = SessionLocal(bind=moteur)
+    try:
+        return lister_espaces_promotion(db, id_promotion)
+    finally:
+        db.close()
+
+
+async def espaces_promotion(db: Session, id_promotion: str) -> List[Dict[str, Any]]:
+    """
+    lister_espaces_promotion, calculé une seule fois pour les appels simultanés
+
+    À appeler en dernier accès à la base d'une route en lecture seule : la
+    session de l'appelant est fermée pour rendre la connexion au pool pendant
+    l'attente. Ses objets (current_user...) restent lisibles sans requête :
+    ils sont détachés avec les valeurs déjà chargées, là où un rollback les
+    aurait expirés et fait recharger depuis la boucle d'événements. Les routes sont asynchrones et interrogent la base depuis la
+    boucle d'événements : des centaines de requêtes réveillées en même temps
+    qui chercheraient chacune une connexion bloqueraient la boucle, pool épuisé.
+
+    Le calcul s'exécute dans le pool de threads avec une session dédiée, sur
+    la même base que db : la session de l'appelant n'est jamais utilisée
+    depuis un autre thread, même si cet appelant abandonne la requête.
+    """
+    db.close()
+    return await single_flight.executer(
+        ("espaces_promotion", id_promotion), _calculer_espaces_promotion, db.get_bind(), id_promotion
+    )
@@ -2,7 +2,7 @@ import secrets
 import string
 import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 
 def generer_identifiant_unique(role: str) -> str:
     """Génère un identifiant unique basé sur le rôle"""
@@ -19,11 +19,20 @@ def generer_identifiant_unique(role: str) -> str:
     
     return f"{prefixe}_{timestamp}_{aleatoire}"
 
-def generer_mot_de_passe_aleatoire(longueur: int = 8) -> str:
-    """Génère un mot de passe simple avec lettres majuscules et chiffres uniquement"""
-    caracteres = string.ascii_uppercase + string.digits  # A-Z + 0-9 seulement
-    mot_de_passe = ''.join(secrets.choice(caracteres) for _ in range(longueur))
-    return mot_de_passe
+CARACTERES_SPECIAUX = "!@#$%&*"
+
+
+def generer_mot_de_passe_aleatoire(longueur: int = 12) -> str:
+    """
+    Génère un mot de passe temporaire contenant au moins une majuscule,
+    une minuscule, un chiffre et un caractère spécial
+    """
+    familles = [string.ascii_uppercase, string.ascii_lowercase, string.digits, CARACTERES_SPECIAUX]
+    caracteres = "".join(familles)
+    mot_de_passe = [secrets.choice(famille) for famille in familles]
+    mot_de_passe += [secrets.choice(caracteres) for _ in range(longueur - len(familles))]
+    secrets.SystemRandom().shuffle(mot_de_passe)
+    return "".join(mot_de_passe)
 
 def generer_token_activation() -> str:
     """Génère un token d'activation sécurisé"""
@@ -41,3 +50,22 @@ def generer_numero_employe() -> str:
     annee = datetime.now().year
     numero = secrets.randbelow(900) + 100
     return f"EMP{annee}{str(numero).zfill(3)}"
+
+def generer_identifiants_bloc(role: str, nombre: int) -> List[str]:
+    """Génère un bloc d'identifiants uniques en une fois (insertion en masse)"""
+    identifiant_base = generer_identifiant_unique(role)
+    # Suffixe aléatoire commun au bloc pour éviter les collisions entre deux blocs de la même seconde
+    bloc = secrets.token_hex(3)
+    return [f"{identifiant_base}_{bloc}{i:05d}" for i in range(nombre)]
+
+def generer_matricules_bloc(nombre: int) -> List[str]:
+    """Génère un bloc de matricules uniques (import en masse d'étudiants)"""
+    annee = datetime.now().year
+    bloc = secrets.token_hex(2).upper()
+    return [f"MAT{annee}{bloc}{i:04d}" for i in range(nombre)]
+
+def generer_numeros_employe_bloc(nombre: int) -> List[str]:
+    """Génère un bloc de numéros d'employé (import en masse de formateurs)"""
+    annee = datetime.now().year
+    bloc = secrets.token_hex(2).upper()
+    return [f"EMP{annee}{bloc}{i:04d}" for i in range(nombre)]
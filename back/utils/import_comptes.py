@@ -0,0 +1,373 @@
+"""
+Import en masse de comptes depuis un fichier CSV ou XLSX
+
+Toutes les lignes sont validées en mémoire (champs obligatoires, longueurs,
+format de l'email, doublons dans le fichier), puis traitées par lots : une
+seule requête IN par lot pour les emails déjà utilisés, insertion en masse des
+utilisateurs et de leur profil, mise en file des emails d'identifiants et un
+commit par lot. Si l'insertion d'un lot échoue malgré tout (email créé entre-
+temps par un autre import...), le lot est repris ligne par ligne : seules les
+lignes fautives sont rejetées.
+Le résultat est un rapport ligne par ligne ; l'import des formateurs
+produit en plus l'avancement après chaque lot (réponse en flux).
+"""
+
+import codecs
+import csv
+import unicodedata
+from datetime import date, datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+
+from models import Utilisateur, Etudiant, Formateur, RoleEnum, StatutEtudiantEnum
+from core.auth import get_password_hash as hash_password
+from utils.generators import (
+    generer_identifiants_bloc,
+    generer_matricules_bloc,
+    generer_numeros_employe_bloc,
+    generer_mot_de_passe_aleatoire
+)
+from utils.promotion_generator import obtenir_id_promotion, valider_annee_academique
+from utils.email_outbox import mettre_en_file_emails_en_masse, TYPE_CREATION_COMPTE
+from utils.insertion_masse import inserer_en_masse
+
+TAILLE_LOT_IMPORT = 500      # Lignes insérées (et validées en base) par transaction
+MAX_LIGNES_IMPORT = 10000    # Au-delà, le fichier est refusé
+
+STATUT_CREE = "CREE"
+STATUT_ERREUR = "ERREUR"
+
+_ADAPTATEUR_EMAIL = TypeAdapter(EmailStr)
+
+# Longueur maximale des colonnes importées (models.Utilisateur, models.Formateur)
+LONGUEURS_MAX = {"email": 191, "nom": 100, "prenom": 100, "specialite": 255}
+
+
+class FormatImportError(ValueError):
+    """Fichier illisible ou colonnes obligatoires absentes"""
+
+
+# ==================== LECTURE DU FICHIER ====================
+
+def _normaliser_entete(valeur: Any) -> str:
+    """'Prénom' -> 'prenom', 'Année académique' -> 'annee_academique'"""
+    texte = unicodedata.normalize("NFKD", str(valeur or "")).encode("ascii", "ignore").decode()
+    return "_".join(texte.strip().lower().replace("-", " ").split())
+
+
+def _texte_cellule(valeur: Any) -> str:
+    if valeur is None:
+        return ""
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    return str(valeur).strip()
+
+
+def _lire_csv(fichier: BinaryIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    # Décodage au fil de la lecture, sans charger le fichier en mémoire
+    texte = codecs.iterdecode(fichier, "utf-8-sig")
+    try:
+        entete = next(texte, "")
+        # Les exports Excel français utilisent le point-virgule
+        separateur = ";" if entete.count(";") > entete.count(",") else ","
+        colonnes = [_normaliser_entete(c) for c in next(csv.reader([entete], delimiter=separateur), [])]
+        for numero, valeurs in enumerate(csv.reader(texte, delimiter=separateur), start=2):
+            if any(v.strip() for v in valeurs):
+                yield numero, {c: v.strip() for c, v in zip(colonnes, valeurs)}
+    except UnicodeDecodeError:
+        raise FormatImportError("Le fichier CSV doit être encodé en UTF-8")
+
+
+def _lire_xlsx(fichier: BinaryIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise FormatImportError("Import XLSX indisponible sur ce serveur (openpyxl non installé), utilisez un CSV")
+
+    try:
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+    except Exception as e:
+        raise FormatImportError(f"Fichier XLSX illisible: {e}")
+    try:
+        lignes = classeur.active.iter_rows(values_only=True)
+        colonnes = [_normaliser_entete(c) for c in next(lignes, ())]
+        for numero, valeurs in enumerate(lignes, start=2):
+            valeurs = [_texte_cellule(v) for v in valeurs]
+            if any(valeurs):
+                yield numero, dict(zip(colonnes, valeurs))
+    finally:
+        classeur.close()
+
+
+def lire_lignes(fichier: BinaryIO, nom_fichier: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Lit un fichier CSV ou XLSX ligne par ligne : (numéro de ligne, {colonne: valeur})"""
+    if nom_fichier.lower().endswith((".xlsx", ".xlsm")):
+        return _lire_xlsx(fichier)
+    return _lire_csv(fichier)
+
+
+# ==================== VALIDATION ====================
+
+def _erreur(numero: int, ligne: Dict[str, str], message: str) -> Dict[str, Any]:
+    return {"ligne": numero, "email": ligne.get("email", ""), "statut": STATUT_ERREUR, "erreur": message}
+
+
+def valider_lignes(lignes: Iterable[Tuple[int, Dict[str, str]]],
+                   colonnes_obligatoires: Sequence[str]) -> Tuple[List[Tuple[int, Dict[str, str]]], List[Dict[str, Any]]]:
+    """
+    Contrôles communs à tous les imports, sans accès à la base :
+    champs obligatoires, format de l'email et doublons dans le fichier.
+    Retourne les lignes valides et le rapport des lignes rejetées.
+    """
+    valides: List[Tuple[int, Dict[str, str]]] = []
+    rejets: List[Dict[str, Any]] = []
+    emails_vus: Dict[str, int] = {}
+    colonnes_verifiees = False
+
+    for numero, ligne in lignes:
+        if not colonnes_verifiees:
+            manquantes = [c for c in colonnes_obligatoires if c not in ligne]
+            if manquantes:
+                raise FormatImportError(f"Colonnes obligatoires manquantes: {', '.join(manquantes)}")
+            colonnes_verifiees = True
+        if len(valides) + len(rejets) >= MAX_LIGNES_IMPORT:
+            raise FormatImportError(f"Fichier trop volumineux (maximum {MAX_LIGNES_IMPORT} lignes)")
+
+        vides = [c for c in colonnes_obligatoires if not ligne.get(c)]
+        if vides:
+            rejets.append(_erreur(numero, ligne, f"Champs obligatoires vides: {', '.join(vides)}"))
+            continue
+        trop_longs = [c for c, longueur in LONGUEURS_MAX.items() if len(ligne.get(c) or "") > longueur]
+        if trop_longs:
+            rejets.append(_erreur(numero, ligne, f"Valeurs trop longues: {', '.join(trop_longs)}"))
+            continue
+        try:
+            _ADAPTATEUR_EMAIL.validate_python(ligne["email"])
+        except ValidationError:
+            rejets.append(_erreur(numero, ligne, "Email invalide"))
+            continue
+        cle = ligne["email"].lower()
+        if cle in emails_vus:
+            rejets.append(_erreur(numero, ligne, f"Email en double dans le fichier (ligne {emails_vus[cle]})"))
+            continue
+        emails_vus[cle] = numero
+        valides.append((numero, ligne))
+
+    return valides, rejets
+
+
+def emails_existants(db: Session, emails: List[str]) -> Set[str]:
+    """Emails déjà utilisés parmi ceux fournis (une seule requête IN, comparaison sans casse)"""
+    if not emails:
+        return set()
+    lignes = db.query(Utilisateur.email).filter(Utilisateur.email.in_(emails)).all()
+    return {email.lower() for (email,) in lignes}
+
+
+def rapport_import(lignes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    lignes.sort(key=lambda ligne: ligne["ligne"])
+    crees = sum(1 for ligne in lignes if ligne["statut"] == STATUT_CREE)
+    return {
+        "total": len(lignes),
+        "crees": crees,
+        "erreurs": len(lignes) - crees,
+        "lignes": lignes
+    }
+
+
+def importer_par_lots(db: Session, a_importer: List[Tuple[int, Dict[str, str]]], rapport: List[Dict[str, Any]],
+                      inserer_lot: Callable[[List[Tuple[int, Dict[str, str]]]], List[Dict[str, Any]]],
+                      taille_lot: int = TAILLE_LOT_IMPORT) -> Iterator[Dict[str, Any]]:
+    """
+    Traite les lignes validées lot par lot : écarte les emails déjà utilisés
+    (une requête IN), appelle inserer_lot sur les autres puis valide la
+    transaction du lot. Un lot en échec est repris ligne par ligne.
+    Complète rapport et produit l'avancement après chaque lot.
+    """
+    total = len(a_importer)
+    for numero_lot, debut in enumerate(range(0, total, taille_lot), start=1):
+        lot = a_importer[debut:debut + taille_lot]
+        deja_utilises = emails_existants(db, [ligne["email"] for _, ligne in lot])
+        nouveaux = []
+        for numero, ligne in lot:
+            if ligne["email"].lower() in deja_utilises:
+                rapport.append(_erreur(numero, ligne, "Cet email est déjà utilisé"))
+            else:
+                nouveaux.append((numero, ligne))
+
+        if nouveaux:
+            try:
+                crees = inserer_lot(nouveaux)
+                db.commit()
+                rapport.extend(crees)
+            except Exception:
+                db.rollback()
+                # Une seule ligne fautive ne doit pas faire rejeter tout le lot
+                for numero, ligne in nouveaux:
+                    try:
+                        crees = inserer_lot([(numero, ligne)])
+                        db.commit()
+                        rapport.extend(crees)
+                    except Exception as e:
+                        db.rollback()
+                        rapport.append(_erreur(numero, ligne, f"Erreur lors de la création du compte: {e}"))
+
+        yield {
+            "lot": numero_lot,
+            "traites": min(debut + taille_lot, total),
+            "total": total,
+            "crees": sum(1 for ligne in rapport if ligne["statut"] == STATUT_CREE),
+            "erreurs": sum(1 for ligne in rapport if ligne["statut"] == STATUT_ERREUR)
+        }
+
+
+def _utilisateurs(nouveaux: List[Tuple[int, Dict[str, str]]], identifiants: List[str],
+                  mots_de_passe: List[str], role: RoleEnum) -> List[Dict[str, Any]]:
+    """Lignes de la table utilisateur (compte actif, mot de passe temporaire)"""
+    maintenant = datetime.utcnow()
+    # Le hachage (SHA-256) est fait pour tout le lot avant l'insertion
+    hashes = [hash_password(mot_de_passe) for mot_de_passe in mots_de_passe]
+    return [
+        {
+            "identifiant": identifiants[i],
+            "email": ligne["email"],
+            "mot_de_passe": hashes[i],
+            "nom": ligne["nom"],
+            "prenom": ligne["prenom"],
+            "role": role,
+            "actif": True,
+            "date_creation": maintenant,
+            "token_activation": None,
+            "date_expiration_token": None,
+            "mot_de_passe_temporaire": True
+        } for i, (_, ligne) in enumerate(nouveaux)
+    ]
+
+
+def _emails_identifiants(nouveaux: List[Tuple[int, Dict[str, str]]], mots_de_passe: List[str],
+                         role: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "destinataire": ligne["email"],
+            "prenom": ligne["prenom"],
+            "email": ligne["email"],
+            "mot_de_passe": mots_de_passe[i],
+            "role": role
+        } for i, (_, ligne) in enumerate(nouveaux)
+    ]
+
+
+# ==================== IMPORT DES ÉTUDIANTS ====================
+
+def importer_etudiants(db: Session, lignes: Iterable[Tuple[int, Dict[str, str]]],
+                       annee_academique: Optional[str] = None,
+                       taille_lot: int = TAILLE_LOT_IMPORT) -> Dict[str, Any]:
+    """
+    Crée les comptes étudiants d'un fichier (colonnes email, nom, prenom et
+    annee_academique, cette dernière pouvant être fournie pour tout le fichier)
+    """
+    valides, rapport = valider_lignes(lignes, ("email", "nom", "prenom"))
+
+    # Année académique de chaque ligne, et une seule promotion par année
+    a_importer: List[Tuple[int, Dict[str, str]]] = []
+    for numero, ligne in valides:
+        annee = ligne.get("annee_academique") or annee_academique
+        if not annee or not valider_annee_academique(annee):
+            rapport.append(_erreur(numero, ligne, "Année académique absente ou invalide (format YYYY-YYYY)"))
+            continue
+        ligne["annee_academique"] = annee
+        a_importer.append((numero, ligne))
+
+    promotions = {
+        annee: obtenir_id_promotion(db, annee)
+        for annee in {ligne["annee_academique"] for _, ligne in a_importer}
+    }
+
+    def inserer_lot(nouveaux: List[Tuple[int, Dict[str, str]]]) -> List[Dict[str, Any]]:
+        identifiants = generer_identifiants_bloc("ETUDIANT", len(nouveaux))
+        ids_etudiants = generer_identifiants_bloc("ETUDIANT", len(nouveaux))
+        matricules = generer_matricules_bloc(len(nouveaux))
+        mots_de_passe = [generer_mot_de_passe_aleatoire() for _ in nouveaux]
+
+        inserer_en_masse(db, Utilisateur.__table__, _utilisateurs(nouveaux, identifiants, mots_de_passe, RoleEnum.ETUDIANT))
+        inserer_en_masse(db, Etudiant.__table__, [
+            {
+                "id_etudiant": ids_etudiants[i],
+                "identifiant": identifiants[i],
+                "matricule": matricules[i],
+                "id_promotion": promotions[ligne["annee_academique"]],
+                "date_inscription": datetime.utcnow().date(),
+                "statut": StatutEtudiantEnum.ACTIF
+            } for i, (_, ligne) in enumerate(nouveaux)
+        ])
+        mettre_en_file_emails_en_masse(db, TYPE_CREATION_COMPTE, _emails_identifiants(nouveaux, mots_de_passe, "ETUDIANT"))
+
+        return [
+            {
+                "ligne": numero,
+                "email": ligne["email"],
+                "statut": STATUT_CREE,
+                "identifiant": identifiants[i],
+                "id_etudiant": ids_etudiants[i],
+                "matricule": matricules[i],
+                "annee_academique": ligne["annee_academique"]
+            } for i, (numero, ligne) in enumerate(nouveaux)
+        ]
+
+    for _ in importer_par_lots(db, a_importer, rapport, inserer_lot, taille_lot):
+        pass
+
+    return rapport_import(rapport)
+
+
+# ==================== IMPORT DES FORMATEURS ====================
+
+def preparer_import_formateurs(lignes: Iterable[Tuple[int, Dict[str, str]]]) -> Tuple[List[Tuple[int, Dict[str, str]]], List[Dict[str, Any]]]:
+    """Lit et valide tout le fichier (colonnes email, nom, prenom et specialite facultative)"""
+    return valider_lignes(lignes, ("email", "nom", "prenom"))
+
+
+def importer_formateurs(db: Session, a_importer: List[Tuple[int, Dict[str, str]]],
+                        rapport: List[Dict[str, Any]],
+                        taille_lot: int = TAILLE_LOT_IMPORT) -> Iterator[Dict[str, Any]]:
+    """
+    Crée les comptes formateurs validés par preparer_import_formateurs.
+    Produit un événement d'avancement par lot puis le rapport final.
+    """
+
+    def inserer_lot(nouveaux: List[Tuple[int, Dict[str, str]]]) -> List[Dict[str, Any]]:
+        identifiants = generer_identifiants_bloc("FORMATEUR", len(nouveaux))
+        ids_formateurs = generer_identifiants_bloc("FORMATEUR", len(nouveaux))
+        numeros_employe = generer_numeros_employe_bloc(len(nouveaux))
+        mots_de_passe = [generer_mot_de_passe_aleatoire() for _ in nouveaux]
+
+        inserer_en_masse(db, Utilisateur.__table__, _utilisateurs(nouveaux, identifiants, mots_de_passe, RoleEnum.FORMATEUR))
+        inserer_en_masse(db, Formateur.__table__, [
+            {
+                "id_formateur": ids_formateurs[i],
+                "identifiant": identifiants[i],
+                "numero_employe": numeros_employe[i],
+                "specialite": ligne.get("specialite") or None
+            } for i, (_, ligne) in enumerate(nouveaux)
+        ])
+        mettre_en_file_emails_en_masse(db, TYPE_CREATION_COMPTE, _emails_identifiants(nouveaux, mots_de_passe, "FORMATEUR"))
+
+        return [
+            {
+                "ligne": numero,
+                "email": ligne["email"],
+                "statut": STATUT_CREE,
+                "identifiant": identifiants[i],
+                "id_formateur": ids_formateurs[i],
+                "numero_employe": numeros_employe[i]
+            } for i, (numero, ligne) in enumerate(nouveaux)
+        ]
+
+    for avancement in importer_par_lots(db, a_importer, rapport, inserer_lot, taille_lot):
+        yield {"type": "progression", **avancement}
+
+    yield {"type": "rapport", **rapport_import(rapport)}
@@ -0,0 +1,30 @@
+"""
+Insertions en masse (executemany) reconnaissables par les événements de session
+
+Les statistiques, la synthèse des notes et le cache des dashboards relèvent
+les requêtes exécutées via la session. Une insertion faite par
+inserer_en_masse porte l'option d'exécution LIGNES_EXPLICITES : ses lignes
+sont toutes dans les paramètres et peuvent être prises en compte une à une.
+Toute autre requête de modification (values(), upsert, insert ... select,
+update / delete en masse) est traitée comme une modification inconnue.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Table, insert
+from sqlalchemy.orm import ORMExecuteState, Session
+
+LIGNES_EXPLICITES = "lignes_explicites"
+
+
+def inserer_en_masse(db: Session, table: Table, lignes: List[Dict[str, Any]]):
+    """insert(table) exécuté avec une liste de lignes, sans commit"""
+    return db.execute(insert(table).execution_options(**{LIGNES_EXPLICITES: True}), lignes)
+
+
+def lignes_inserees(etat: ORMExecuteState) -> Optional[List[Dict[str, Any]]]:
+    """Lignes d'une insertion faite par inserer_en_masse, None pour toute autre requête"""
+    if not (etat.is_insert and etat.execution_options.get(LIGNES_EXPLICITES) and etat.parameters):
+        return None
+    parametres = etat.parameters
+    return parametres if isinstance(parametres, list) else [parametres]
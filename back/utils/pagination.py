@@ -0,0 +1,96 @@
+"""
+Pagination par curseur (keyset) pour les listes volumineuses
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Date, DateTime, and_, or_
+
+
+def encoder_curseur(valeurs: List[Any]) -> str:
+    """Encode les valeurs de la dernière ligne d'une page en curseur opaque"""
+    brut = json.dumps(valeurs, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(brut.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decoder_curseur(curseur: Optional[str], nb_valeurs: int) -> Optional[List[Any]]:
+    """Décode un curseur produit par encoder_curseur, None si absent"""
+    if not curseur:
+        return None
+
+    try:
+        rembourrage = "=" * (-len(curseur) % 4)
+        valeurs = json.loads(base64.urlsafe_b64decode(curseur + rembourrage).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        valeurs = None
+
+    if not isinstance(valeurs, list) or len(valeurs) != nb_valeurs:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide"
+        )
+
+    return valeurs
+
+
+def convertir_curseur(colonnes: List[Any], valeurs: List[Any]) -> List[Any]:
+    """
+    Reconvertit les dates du curseur (encodées en texte) selon le type des
+    colonnes de tri, pour les comparer aux colonnes DateTime / Date
+    """
+    try:
+        return [
+            datetime.fromisoformat(valeur) if isinstance(colonne.type, DateTime) and isinstance(valeur, str)
+            else date.fromisoformat(valeur) if isinstance(colonne.type, Date) and isinstance(valeur, str)
+            else valeur
+            for colonne, valeur in zip(colonnes, valeurs)
+        ]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide"
+        )
+
+
+def condition_apres(colonnes: List[Any], valeurs: List[Any], decroissant: bool = False):
+    """
+    Construit la condition "strictement après (valeurs)" dans l'ordre
+    lexicographique des colonnes, toutes triées dans le même sens
+    (croissant par défaut).
+    La dernière colonne doit être unique pour que le curseur soit stable.
+    """
+    conditions = []
+    for i, colonne in enumerate(colonnes):
+        egalites = [colonnes[j] == valeurs[j] for j in range(i)]
+        apres = colonne < valeurs[i] if decroissant else colonne > valeurs[i]
+        conditions.append(and_(*egalites, apres))
+    return or_(*conditions)
+
+
+def paginer(requete, colonnes: List[Any], limite: Optional[int], apres: Optional[str],
+            decroissant: bool = False) -> Tuple[List[Any], Optional[str]]:
+    """
+    Applique tri, curseur et limite à une requête projetée (les colonnes de tri
+    doivent faire partie des colonnes sélectionnées). Retourne les lignes de la
+    page et le curseur de la page suivante (None si c'est la dernière).
+    Sans limite, toutes les lignes sont renvoyées.
+    """
+    curseur = decoder_curseur(apres, len(colonnes))
+    if curseur is not None:
+        curseur = convertir_curseur(colonnes, curseur)
+        requete = requete.filter(condition_apres(colonnes, curseur, decroissant))
+
+    requete = requete.order_by(*(colonne.desc() if decroissant else colonne for colonne in colonnes))
+    if limite is not None:
+        requete = requete.limit(limite + 1)
+
+    lignes = requete.all()
+    if limite is None or len(lignes) <= limite:
+        return lignes, None
+
+    lignes = lignes[:limite]
+    return lignes, encoder_curseur([getattr(lignes[-1], colonne.key) for colonne in colonnes])
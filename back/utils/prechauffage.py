@@ -0,0 +1,202 @@
+"""
+Préchauffage du cache des dashboards avant les pics de trafic
+
+Le trafic se concentre au début de chaque créneau de cours et dans l'heure
+qui précède une échéance : sans préparation, les premiers utilisateurs de
+chaque pic paient le calcul à froid de leur dashboard. Un thread calcule à
+l'avance, pour les promotions concernées, le dashboard et la liste mes-cours
+de chaque étudiant ainsi que le dashboard des formateurs de leurs espaces,
+et les place dans le cache des dashboards (utils/cache_dashboard.py).
+
+Fenêtres de pic :
+- créneau de cours (CRENEAUX_COURS) : de AVANCE_PRECHAUFFAGE avant son début
+  à DUREE_PIC_COURS après ; promotions dont un espace a un travail à rendre
+  dans les HORIZON_ACTIVITE prochains jours ;
+- échéance : l'heure qui précède la date d'échéance d'un travail (avec la
+  même avance) ; promotion de l'espace du travail.
+
+Pendant une fenêtre, seules les entrées absentes ou expirées sont recalculées
+à chaque passe : le cache reste chaud malgré son TTL et ses invalidations.
+
+Le cache est propre au processus : le worker démarre et préchauffe dans
+chaque processus de l'application, la charge du préchauffage sur la base est
+donc multipliée par le nombre de processus. Une passe est bornée en nombre
+de calculs et en durée, les calculs étant faits un par un ; les entrées
+calculées restent en cache pendant leur durée de vie, les passes suivantes
+complètent avec les autres. Au plus CAPACITE_PRECHAUFFAGE entrées restent
+chaudes en même temps (1 500 : dashboard et mes-cours d'environ 700 étudiants
+avec leurs formateurs) ; au-delà, les réponses restantes sont calculées à la
+demande et la passe les compte dans "non_prechauffes".
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal
+from models import (
+    Utilisateur, Formateur, Etudiant, EspacePedagogique, Travail,
+    RoleEnum, StatutEtudiantEnum
+)
+from utils.cache_dashboard import DUREE_VIE_CACHE, cache_dashboard, cle_dashboard, cle_mes_cours
+
+logger = logging.getLogger(__name__)
+
+CRENEAUX_COURS = [time(8, 0), time(10, 15), time(13, 30), time(15, 45)]  # Début des créneaux (heure locale)
+DUREE_PIC_COURS = timedelta(minutes=15)       # Durée du pic après le début d'un créneau
+DUREE_PIC_ECHEANCE = timedelta(hours=1)       # Pic dans l'heure qui précède une échéance
+AVANCE_PRECHAUFFAGE = timedelta(minutes=5)    # Préchauffage commencé avant le début du pic
+HORIZON_ACTIVITE = timedelta(days=7)          # Espace actif : un travail à rendre dans ce délai
+INTERVALLE_PRECHAUFFAGE = DUREE_VIE_CACHE // 3  # Secondes entre deux passes : 3 passes par TTL du cache
+MAX_CALCULS_PAR_PASSE = 500                   # Borne la charge d'une passe...
+DUREE_MAX_PASSE = INTERVALLE_PRECHAUFFAGE // 2  # ... et sa durée (secondes, inférieure à l'intervalle)
+
+# Entrées maintenues chaudes au plus : chacune est recalculée une fois par durée de vie
+CAPACITE_PRECHAUFFAGE = MAX_CALCULS_PAR_PASSE * DUREE_VIE_CACHE // INTERVALLE_PRECHAUFFAGE
+
+
+def en_pic_de_cours(maintenant: datetime) -> bool:
+    """Vrai si maintenant tombe dans la fenêtre de préchauffage d'un créneau de cours"""
+    for creneau in CRENEAUX_COURS:
+        debut = datetime.combine(maintenant.date(), creneau)
+        if debut - AVANCE_PRECHAUFFAGE <= maintenant <= debut + DUREE_PIC_COURS:
+            return True
+    return False
+
+
+def promotions_en_pic(db: Session, maintenant: datetime) -> Set[str]:
+    """Promotions dont un pic de trafic est en cours ou imminent"""
+    # Échéances : le pic commence DUREE_PIC_ECHEANCE avant, le préchauffage AVANCE_PRECHAUFFAGE plus tôt
+    fin = maintenant + DUREE_PIC_ECHEANCE + AVANCE_PRECHAUFFAGE
+    if en_pic_de_cours(maintenant):
+        fin = max(fin, maintenant + HORIZON_ACTIVITE)
+
+    lignes = db.query(EspacePedagogique.id_promotion).join(
+        Travail, Travail.id_espace == EspacePedagogique.id_espace
+    ).filter(
+        Travail.date_echeance >= maintenant,
+        Travail.date_echeance <= fin
+    ).distinct().all()
+    return {ligne.id_promotion for ligne in lignes}
+
+
+def _requete_interne() -> Request:
+    """Requête HTTP vide pour appeler les routes hors d'un appel client"""
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+
+
+async def _prechauffer_utilisateurs(db: Session, etudiants: List[Utilisateur],
+                                    formateurs: List[Utilisateur]) -> Dict[str, int]:
+    # Import local : les routes importent les utilitaires, pas l'inverse
+    from routes.dashboard import dashboard_etudiant, dashboard_formateur
+    from routes.espaces_pedagogiques import mes_cours_etudiant
+
+    calculs = {"dashboards": 0, "mes_cours": 0, "erreurs": 0, "non_prechauffes": 0}
+    debut = monotonic()
+    taches = []
+    for utilisateur in etudiants:
+        if not cache_dashboard.contient(cle_dashboard(utilisateur.role, utilisateur.identifiant)):
+            taches.append(("dashboards", dashboard_etudiant, utilisateur))
+        if not cache_dashboard.contient(cle_mes_cours(utilisateur.identifiant)):
+            taches.append(("mes_cours", mes_cours_etudiant, utilisateur))
+    for utilisateur in formateurs:
+        if not cache_dashboard.contient(cle_dashboard(utilisateur.role, utilisateur.identifiant)):
+            taches.append(("dashboards", dashboard_formateur, utilisateur))
+
+    for compteur, route, utilisateur in taches[:MAX_CALCULS_PAR_PASSE]:
+        if monotonic() - debut > DUREE_MAX_PASSE:
+            break
+        try:
+            await route(_requete_interne(), Response(), db, utilisateur)
+            calculs[compteur] += 1
+        except Exception:
+            db.rollback()
+            calculs["erreurs"] += 1
+            logger.exception("Erreur de préchauffage pour %s", utilisateur.identifiant)
+    calculs["non_prechauffes"] = len(taches) - calculs["dashboards"] - calculs["mes_cours"] - calculs["erreurs"]
+    return calculs
+
+
+def prechauffer_promotions(db: Session, id_promotions: Set[str]) -> Dict[str, int]:
+    """
+    Calcule et met en cache les dashboards et mes-cours manquants des étudiants
+    actifs des promotions, et les dashboards des formateurs de leurs espaces.
+    Retourne le nombre de réponses calculées.
+    """
+    if not id_promotions:
+        return {"dashboards": 0, "mes_cours": 0, "erreurs": 0, "non_prechauffes": 0}
+
+    etudiants = db.query(Utilisateur).join(
+        Etudiant, Etudiant.identifiant == Utilisateur.identifiant
+    ).filter(
+        Etudiant.id_promotion.in_(id_promotions),
+        Etudiant.statut == StatutEtudiantEnum.ACTIF,
+        Utilisateur.role == RoleEnum.ETUDIANT
+    ).all()
+    formateurs = db.query(Utilisateur).join(
+        Formateur, Formateur.identifiant == Utilisateur.identifiant
+    ).join(
+        EspacePedagogique, EspacePedagogique.id_formateur == Formateur.id_formateur
+    ).filter(
+        EspacePedagogique.id_promotion.in_(id_promotions),
+        Utilisateur.role == RoleEnum.FORMATEUR
+    ).distinct().all()
+    # Détachés de la session : les routes la ferment ou l'annulent sans expirer les utilisateurs
+    db.expunge_all()
+
+    entrees = 2 * len(etudiants) + len(formateurs)
+    if entrees > CAPACITE_PRECHAUFFAGE:
+        logger.warning("Préchauffage partiel : %d réponses en pic pour une capacité de %d", entrees, CAPACITE_PRECHAUFFAGE)
+
+    return asyncio.run(_prechauffer_utilisateurs(db, etudiants, formateurs))
+
+
+class PrechauffageDashboardWorker:
+    """Thread d'arrière-plan : préchauffage du cache pendant les fenêtres de pic"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 horloge: Callable[[], datetime] = datetime.now):
+        self.session_factory = session_factory
+        self.horloge = horloge
+        self._arret = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def demarrer(self):
+        """Démarre le worker s'il ne tourne pas déjà"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._boucle, name="prechauffage-dashboards", daemon=True)
+        self._thread.start()
+
+    def arreter(self, timeout: float = 10):
+        self._arret.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def passe(self) -> Dict[str, int]:
+        """Une passe de préchauffage du cache de ce processus pour les promotions en pic"""
+        db = self.session_factory()
+        try:
+            return prechauffer_promotions(db, promotions_en_pic(db, self.horloge()))
+        except Exception:
+            db.rollback()
+            logger.exception("Erreur de préchauffage des dashboards")
+            return {"dashboards": 0, "mes_cours": 0, "erreurs": 1, "non_prechauffes": 0}
+        finally:
+            db.close()
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            self.passe()
+            self._arret.wait(INTERVALLE_PRECHAUFFAGE)
+
+
+# Instance globale du worker
+prechauffage_dashboard_worker = PrechauffageDashboardWorker()
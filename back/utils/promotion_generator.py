@@ -3,12 +3,74 @@
 Générateur automatique de promotions
 """
 
+import threading
 from datetime import date, datetime
-from typing import Optional, List
+from time import monotonic
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from models import Formation, Promotion
 from utils.generators import generer_identifiant_unique
+from utils.pagination import paginer
+
+NOM_FORMATION_PAR_DEFAUT = "Formation Générale"
+
+# Cache (base, id_formation, année académique) -> id_promotion des promotions déjà résolues.
+# Les promotions ne sont jamais renommées : une entrée est invalidée quand une
+# promotion ou une formation est modifiée ou supprimée par ce processus (événements
+# ci-dessous) ; la durée de vie borne le temps pendant lequel une suppression faite
+# par un autre processus laisse un identifiant périmé en cache.
+DUREE_VIE_CACHE_PROMOTIONS = 300  # secondes
+_cache_promotions: Dict[Tuple[str, str, str], Tuple[str, float]] = {}
+_cache_formation_par_defaut: Dict[str, Tuple[str, float]] = {}
+_verrou_cache = threading.Lock()
+
+
+def _cle_base(db: Session) -> str:
+    """Distingue les bases (tests, benchmarks) partageant le même processus"""
+    return db.get_bind().url.render_as_string(hide_password=True)
+
+
+def _lire_cache(cache: dict, cle) -> Optional[str]:
+    entree = cache.get(cle)
+    if entree is None or entree[1] <= monotonic():
+        return None
+    return entree[0]
+
+
+def _ecrire_cache(cache: dict, cle, valeur: str):
+    with _verrou_cache:
+        cache[cle] = (valeur, monotonic() + DUREE_VIE_CACHE_PROMOTIONS)
+
+
+def invalider_cache_promotions():
+    """Vide le cache des promotions et de la formation par défaut"""
+    with _verrou_cache:
+        _cache_promotions.clear()
+        _cache_formation_par_defaut.clear()
+
+
+@event.listens_for(Promotion, "after_update")
+@event.listens_for(Promotion, "after_delete")
+def _promotion_modifiee(mapper, connection, promotion):
+    invalider_cache_promotions()
+
+
+@event.listens_for(Formation, "after_delete")
+def _formation_supprimee(mapper, connection, formation):
+    invalider_cache_promotions()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _modification_en_masse(etat):
+    """update / delete en masse sur les promotions ou les formations"""
+    if etat.is_update or etat.is_delete:
+        table = getattr(etat.statement, "table", None)
+        if table is not None and table.name in (Promotion.__tablename__, Formation.__tablename__):
+            invalider_cache_promotions()
 
 
 def generer_annee_academique(annee: int) -> str:
@@ -41,21 +103,105 @@ def obtenir_formation_par_defaut(db: Session) -> Formation:
     if formation:
         return formation
     
-    # Créer une formation par défaut
-    formation_id = generer_identifiant_unique("FORMATION")
-    formation = Formation(
-        id_formation=formation_id,
-        nom_formation="Formation Générale",
-        description="Formation générale pour tous les étudiants",
-        date_debut=date(2024, 9, 1),
-        date_fin=None  # Formation permanente
-    )
-    
-    db.add(formation)
+    # Créer une formation par défaut (nom unique : si une requête concurrente
+    # vient de la créer, l'insertion échoue et c'est la sienne qui est relue)
+    try:
+        with db.begin_nested():
+            db.add(Formation(
+                id_formation=generer_identifiant_unique("FORMATION"),
+                nom_formation=NOM_FORMATION_PAR_DEFAUT,
+                description="Formation générale pour tous les étudiants",
+                date_debut=date(2024, 9, 1),
+                date_fin=None  # Formation permanente
+            ))
+    except IntegrityError:
+        pass
     db.commit()
-    db.refresh(formation)
     
-    return formation
+    return db.query(Formation).filter(Formation.nom_formation == NOM_FORMATION_PAR_DEFAUT).one()
+
+
+def _id_formation_par_defaut(db: Session) -> str:
+    cle = _cle_base(db)
+    id_formation = _lire_cache(_cache_formation_par_defaut, cle)
+    if id_formation is None:
+        id_formation = obtenir_formation_par_defaut(db).id_formation
+        _ecrire_cache(_cache_formation_par_defaut, cle, id_formation)
+    return id_formation
+
+
+def _inserer_promotion_si_absente(db: Session, valeurs: dict):
+    """
+    INSERT qui ne fait rien si la promotion (id_formation, annee_academique)
+    existe déjà, y compris si une requête concurrente vient de la créer
+    """
+    dialecte = db.get_bind().dialect.name
+    table = Promotion.__table__
+    
+    if dialecte == "mysql":
+        requete = mysql.insert(table).values(**valeurs)
+        # Mise à jour sans effet : la ligne existante est conservée
+        requete = requete.on_duplicate_key_update(annee_academique=requete.inserted.annee_academique)
+    elif dialecte in ("sqlite", "postgresql"):
+        module = sqlite if dialecte == "sqlite" else postgresql
+        requete = module.insert(table).values(**valeurs).on_conflict_do_nothing(
+            index_elements=["id_formation", "annee_academique"]
+        )
+    else:
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(**valeurs))
+        except IntegrityError:
+            pass
+        return
+    
+    db.execute(requete)
+
+
+def obtenir_id_promotion(db: Session, annee_academique: str) -> str:
+    """
+    Identifiant de la promotion de l'année académique (formation par défaut),
+    créée si besoin. Sans requête quand la promotion a déjà été résolue.
+    """
+    id_formation = _id_formation_par_defaut(db)
+    cle = (_cle_base(db), id_formation, annee_academique)
+    id_promotion = _lire_cache(_cache_promotions, cle)
+    if id_promotion is not None:
+        return id_promotion
+    
+    # 1. Promotion existante pour cette année (quelle que soit la formation, comme auparavant)
+    id_promotion = db.query(Promotion.id_promotion).filter(
+        Promotion.annee_academique == annee_academique
+    ).order_by(
+        (Promotion.id_formation == id_formation).desc()
+    ).limit(1).scalar()
+    
+    if id_promotion is None:
+        # 2. Extraire les années de l'année académique
+        try:
+            annee_debut, annee_fin = annee_academique.split("-")
+            annee_debut = int(annee_debut)
+            annee_fin = int(annee_fin)
+        except ValueError:
+            raise ValueError(f"Format d'année académique invalide: {annee_academique}. Utilisez YYYY-YYYY")
+        
+        # 3. Créer la promotion (1er septembre -> 30 juin) ou récupérer celle créée en parallèle
+        _inserer_promotion_si_absente(db, {
+            "id_promotion": generer_identifiant_unique("PROMOTION"),
+            "id_formation": id_formation,
+            "annee_academique": annee_academique,
+            "libelle": f"Promotion {annee_academique}",
+            "date_debut": date(annee_debut, 9, 1),
+            "date_fin": date(annee_fin, 6, 30)
+        })
+        db.commit()
+        id_promotion = db.query(Promotion.id_promotion).filter(
+            Promotion.id_formation == id_formation,
+            Promotion.annee_academique == annee_academique
+        ).scalar()
+    
+    _ecrire_cache(_cache_promotions, cle, id_promotion)
+    return id_promotion
 
 
 def generer_promotion_automatique(db: Session, annee_academique: str) -> Promotion:
@@ -69,47 +215,7 @@ def generer_promotion_automatique(db: Session, annee_academique: str) -> Promoti
     Returns:
         Promotion: La promotion créée ou existante
     """
-    
-    # 1. Vérifier si la promotion existe déjà
-    promotion_existante = db.query(Promotion).filter(
-        Promotion.annee_academique == annee_academique
-    ).first()
-    
-    if promotion_existante:
-        return promotion_existante
-    
-    # 2. Obtenir la formation par défaut
-    formation = obtenir_formation_par_defaut(db)
-    
-    # 3. Extraire les années de l'année académique
-    try:
-        annee_debut, annee_fin = annee_academique.split("-")
-        annee_debut = int(annee_debut)
-        annee_fin = int(annee_fin)
-    except ValueError:
-        raise ValueError(f"Format d'année académique invalide: {annee_academique}. Utilisez YYYY-YYYY")
-    
-    # 4. Générer les dates
-    date_debut = date(annee_debut, 9, 1)  # 1er septembre
-    date_fin = date(annee_fin, 6, 30)     # 30 juin
-    
-    # 5. Créer la promotion
-    promotion_id = generer_identifiant_unique("PROMOTION")
-    promotion = Promotion(
-        id_promotion=promotion_id,
-        id_formation=formation.id_formation,
-        annee_academique=annee_academique,
-        libelle=f"Promotion {annee_academique}",
-        date_debut=date_debut,
-        date_fin=date_fin
-    )
-    
-    # 6. Sauvegarder
-    db.add(promotion)
-    db.commit()
-    db.refresh(promotion)
-    
-    return promotion
+    return db.get(Promotion, obtenir_id_promotion(db, annee_academique))
 
 
 def valider_annee_academique(annee_academique: str) -> bool:
@@ -132,19 +238,41 @@ def valider_annee_academique(annee_academique: str) -> bool:
         return False
 
 
+def page_promotions(db: Session, limite: Optional[int] = None,
+                    apres: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Page de promotions (plus récentes d'abord) avec le nom de leur formation,
+    en une seule requête sur les colonnes utiles. Retourne aussi le curseur de la page suivante.
+    """
+    requete = db.query(
+        Promotion.id_promotion,
+        Promotion.annee_academique,
+        Promotion.libelle,
+        Promotion.date_debut,
+        Promotion.date_fin,
+        Formation.nom_formation
+    ).outerjoin(
+        Formation, Formation.id_formation == Promotion.id_formation
+    )
+    
+    lignes, page_suivante = paginer(
+        requete, [Promotion.annee_academique, Promotion.id_promotion], limite, apres, decroissant=True
+    )
+    
+    result = [
+        {
+            "id_promotion": ligne.id_promotion,
+            "annee_academique": ligne.annee_academique,
+            "libelle": ligne.libelle,
+            "date_debut": ligne.date_debut.isoformat(),
+            "date_fin": ligne.date_fin.isoformat(),
+            "formation": ligne.nom_formation or "N/A"
+        } for ligne in lignes
+    ]
+    
+    return result, page_suivante
+
+
 def lister_promotions_existantes(db: Session) -> List[dict]:
     """Liste toutes les promotions existantes avec leurs informations"""
-    promotions = db.query(Promotion).order_by(Promotion.annee_academique.desc()).all()
-    
-    result = []
-    for promotion in promotions:
-        result.append({
-            "id_promotion": promotion.id_promotion,
-            "annee_academique": promotion.annee_academique,
-            "libelle": promotion.libelle,
-            "date_debut": promotion.date_debut.isoformat(),
-            "date_fin": promotion.date_fin.isoformat(),
-            "formation": promotion.formation.nom_formation if promotion.formation else "N/A"
-        })
-    
-    return result
\ No newline at end of file
+    return page_promotions(db)[0]
@@ -0,0 +1,115 @@
+"""
+Quotas d'envoi d'emails partagés entre processus
+
+Les seaux à jetons du répartiteur (utils/repartiteur_emails.py) sont propres
+au processus : avec plusieurs workers, chacun consommerait tout le quota du
+fournisseur, et un redémarrage remettrait le quota journalier à zéro. Chaque
+envoi réserve donc aussi une place dans des compteurs en base, un par
+fenêtre (minute et jour UTC), par une mise à jour conditionnelle : deux
+processus ne peuvent pas obtenir la même place.
+
+Si la base est indisponible, l'envoi n'est limité que par les seaux du
+processus (les erreurs sont comptées dans les métriques du répartiteur).
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import QuotaEnvoi
+
+_FORMAT_MINUTE = "minute:%Y-%m-%dT%H:%M"
+_FORMAT_JOUR = "jour:%Y-%m-%d"
+
+
+def _incrementer_si_place(db: Session, fenetre: str, limite: int) -> bool:
+    """Compte un envoi dans la fenêtre si elle n'est pas pleine ; True si la place est obtenue"""
+    requete = (
+        update(QuotaEnvoi)
+        .where(QuotaEnvoi.fenetre == fenetre, QuotaEnvoi.nb_envois < limite)
+        .values(nb_envois=QuotaEnvoi.nb_envois + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(requete).rowcount:
+        return True
+    try:
+        with db.begin_nested():
+            db.execute(insert(QuotaEnvoi.__table__).values(fenetre=fenetre, nb_envois=1))
+    except IntegrityError:
+        # Fenêtre déjà ouverte : pleine, ou créée à l'instant par un autre processus
+        return bool(db.execute(requete).rowcount)
+    _purger(db, fenetre)
+    return True
+
+
+def _purger(db: Session, fenetre: str):
+    """À l'ouverture d'une fenêtre, supprime celles qui ne servent plus"""
+    debut = datetime.strptime(fenetre, _FORMAT_MINUTE if fenetre.startswith("minute:") else _FORMAT_JOUR)
+    db.execute(delete(QuotaEnvoi).where(or_(
+        and_(QuotaEnvoi.fenetre.like("minute:%"),
+             QuotaEnvoi.fenetre < (debut - timedelta(hours=1)).strftime(_FORMAT_MINUTE)),
+        and_(QuotaEnvoi.fenetre.like("jour:%"),
+             QuotaEnvoi.fenetre < (debut - timedelta(days=2)).strftime(_FORMAT_JOUR))
+    )).execution_options(synchronize_session=False))
+
+
+class QuotaEmailsPartage:
+    """Réservation des envois dans les compteurs partagés (par minute et par jour)"""
+
+    def __init__(self, session_factory: Callable[[], Session], limite_par_minute: int = 20,
+                 limite_par_jour: int = 500, horloge: Callable[[], datetime] = datetime.utcnow):
+        self.session_factory = session_factory
+        self.limite_par_minute = limite_par_minute
+        self.limite_par_jour = limite_par_jour
+        self.horloge = horloge
+        self.erreurs = 0
+
+    def _fenetres(self, maintenant: datetime) -> List[Tuple[str, int, datetime]]:
+        minute = maintenant.replace(second=0, microsecond=0)
+        jour = minute.replace(hour=0, minute=0)
+        return [
+            (minute.strftime(_FORMAT_MINUTE), self.limite_par_minute, minute + timedelta(minutes=1)),
+            (jour.strftime(_FORMAT_JOUR), self.limite_par_jour, jour + timedelta(days=1)),
+        ]
+
+    def reserver(self) -> float:
+        """
+        Réserve un envoi dans chaque fenêtre. Retourne 0 si l'envoi est accordé,
+        sinon les secondes restantes avant la fin de la fenêtre pleine.
+        """
+        maintenant = self.horloge()
+        db = self.session_factory()
+        try:
+            for fenetre, limite, fin in self._fenetres(maintenant):
+                if not _incrementer_si_place(db, fenetre, limite):
+                    db.rollback()
+                    return max((fin - maintenant).total_seconds(), 0.1)
+            db.commit()
+            return 0.0
+        except Exception:
+            db.rollback()
+            self.erreurs += 1
+            return 0.0
+        finally:
+            db.close()
+
+    def rendre(self):
+        """Libère la place d'un envoi réservé mais finalement pas tenté"""
+        db = self.session_factory()
+        try:
+            fenetres = [fenetre for fenetre, _, _ in self._fenetres(self.horloge())]
+            db.execute(
+                update(QuotaEnvoi)
+                .where(QuotaEnvoi.fenetre.in_(fenetres), QuotaEnvoi.nb_envois > 0)
+                .values(nb_envois=QuotaEnvoi.nb_envois - 1)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.erreurs += 1
+        finally:
+            db.close()
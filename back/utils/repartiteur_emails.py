@@ -0,0 +1,274 @@
+"""
+Répartiteur des envois d'emails
+
+Tous les messages passent par une file à priorités (identifiants > rappels >
+notifications), sont limités par des seaux à jetons calés sur les quotas du
+fournisseur (par minute et par jour) et sont coupés par un disjoncteur quand
+le serveur SMTP enchaîne les erreurs.
+
+Les seaux et le disjoncteur sont propres au processus ; avec un quota
+partagé (utils/quota_emails.py), chaque envoi réserve en plus sa place dans
+les compteurs en base communs à tous les processus.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from email.message import Message
+from typing import Callable, Dict, List, Optional
+
+from utils.quota_emails import QuotaEmailsPartage
+
+PRIORITE_IDENTIFIANTS = 0
+PRIORITE_RAPPEL = 1
+PRIORITE_NOTIFICATION = 2
+
+NOMS_PRIORITES = {
+    PRIORITE_IDENTIFIANTS: "identifiants",
+    PRIORITE_RAPPEL: "rappels",
+    PRIORITE_NOTIFICATION: "notifications",
+}
+
+_PRIORITE_ARRET = 99  # Placée après tous les messages en attente
+
+
+class CircuitOuvertError(Exception):
+    """Le disjoncteur SMTP est ouvert : l'envoi est refusé sans contacter le serveur"""
+
+
+class SeauJetons:
+    """Seau à jetons : capacite jetons au maximum, rechargé de capacite par periode secondes"""
+
+    def __init__(self, capacite: int, periode: float):
+        self.capacite = capacite
+        self.debit = capacite / periode
+        self.jetons = float(capacite)
+        self.derniere_recharge = time.monotonic()
+
+    def _recharger(self):
+        maintenant = time.monotonic()
+        self.jetons = min(self.capacite, self.jetons + (maintenant - self.derniere_recharge) * self.debit)
+        self.derniere_recharge = maintenant
+
+    def attente(self) -> float:
+        """Secondes à attendre avant qu'un jeton soit disponible"""
+        self._recharger()
+        if self.jetons >= 1:
+            return 0.0
+        return (1 - self.jetons) / self.debit
+
+    def consommer(self):
+        self.jetons -= 1
+
+
+class Disjoncteur:
+    """
+    Disjoncteur : s'ouvre après seuil_echecs échecs consécutifs, refuse les envois
+    pendant delai_reouverture secondes, puis laisse passer un essai (semi-ouvert)
+    """
+
+    FERME = "FERME"
+    OUVERT = "OUVERT"
+    SEMI_OUVERT = "SEMI_OUVERT"
+
+    def __init__(self, seuil_echecs: int = 5, delai_reouverture: float = 60):
+        self.seuil_echecs = seuil_echecs
+        self.delai_reouverture = delai_reouverture
+        self.echecs_consecutifs = 0
+        self.date_ouverture: Optional[float] = None
+        self._essai_en_cours = False
+        self._verrou = threading.Lock()
+
+    @property
+    def etat(self) -> str:
+        if self.date_ouverture is None:
+            return self.FERME
+        if time.monotonic() - self.date_ouverture >= self.delai_reouverture:
+            return self.SEMI_OUVERT
+        return self.OUVERT
+
+    def autoriser(self) -> bool:
+        """Indique si un envoi peut être tenté maintenant"""
+        with self._verrou:
+            etat = self.etat
+            if etat == self.FERME:
+                return True
+            if etat == self.SEMI_OUVERT and not self._essai_en_cours:
+                self._essai_en_cours = True
+                return True
+            return False
+
+    def succes(self):
+        with self._verrou:
+            self.echecs_consecutifs = 0
+            self.date_ouverture = None
+            self._essai_en_cours = False
+
+    def echec(self):
+        with self._verrou:
+            self.echecs_consecutifs += 1
+            if self._essai_en_cours or self.echecs_consecutifs >= self.seuil_echecs:
+                if self.date_ouverture is None or self._essai_en_cours:
+                    print(f"⚠️ Disjoncteur SMTP ouvert après {self.echecs_consecutifs} échec(s)")
+                self.date_ouverture = time.monotonic()
+            self._essai_en_cours = False
+
+
+class TacheEmail:
+    def __init__(self, message: Message, priorite: int):
+        self.message = message
+        self.priorite = priorite
+        self.future: Future = Future()
+        self.date_soumission = time.monotonic()
+
+
+class RepartiteurEmails:
+    """File d'envoi à priorités, débit limité, servie par des threads dédiés"""
+
+    def __init__(self, envoyer: Callable[[Message], None], nb_threads: int = 3,
+                 limite_par_minute: int = 20, limite_par_jour: int = 500,
+                 seuil_echecs: int = 5, delai_reouverture: float = 60,
+                 quota_partage: Optional[QuotaEmailsPartage] = None):
+        self.envoyer = envoyer
+        self.nb_threads = nb_threads
+        self.seaux = [SeauJetons(limite_par_minute, 60), SeauJetons(limite_par_jour, 86400)]
+        self.quota_partage = quota_partage
+        self.disjoncteur = Disjoncteur(seuil_echecs, delai_reouverture)
+        self._file: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._verrou = threading.Lock()
+        self._verrou_debit = threading.Lock()
+        self._arret = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._profondeur = {priorite: 0 for priorite in NOMS_PRIORITES}
+        self._compteurs = {"envoyes": 0, "echecs": 0, "refus_disjoncteur": 0, "annules": 0}
+        self._duree_totale = 0.0
+        self._derniere_duree: Optional[float] = None
+
+    def demarrer(self):
+        with self._verrou:
+            if self._threads:
+                return
+            self._arret.clear()
+            for i in range(self.nb_threads):
+                thread = threading.Thread(target=self._boucle, name=f"email-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def arreter(self, timeout: float = 10):
+        """Envoie les messages déjà en file puis arrête les threads"""
+        with self._verrou:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._file.put((_PRIORITE_ARRET, next(self._sequence), None))
+        for thread in threads:
+            thread.join(timeout)
+        self._arret.set()
+
+    def soumettre(self, message: Message, priorite: int = PRIORITE_NOTIFICATION) -> Future:
+        """Met un message en file ; le Future porte le résultat ou l'exception de l'envoi"""
+        self.demarrer()
+        tache = TacheEmail(message, priorite)
+        with self._verrou:
+            self._profondeur[priorite] += 1
+        self._file.put((priorite, next(self._sequence), tache))
+        return tache.future
+
+    def _attendre_jeton(self):
+        """
+        Bloque jusqu'à disposer d'un jeton dans chacun des seaux (quota minute et jour)
+        puis, s'il y en a un, d'une place dans le quota partagé
+        """
+        while not self._arret.is_set():
+            with self._verrou_debit:
+                attente = max(seau.attente() for seau in self.seaux)
+                if attente == 0:
+                    for seau in self.seaux:
+                        seau.consommer()
+            if attente == 0:
+                attente = self.quota_partage.reserver() if self.quota_partage else 0
+                if attente == 0:
+                    return
+                self._rendre_jetons_locaux()
+            self._arret.wait(min(attente, 1.0))
+
+    def _rendre_jetons_locaux(self):
+        with self._verrou_debit:
+            for seau in self.seaux:
+                seau.jetons = min(seau.capacite, seau.jetons + 1)
+
+    def _rendre_jeton(self):
+        self._rendre_jetons_locaux()
+        if self.quota_partage:
+            self.quota_partage.rendre()
+
+    def _compter(self, compteur: str):
+        with self._verrou:
+            self._compteurs[compteur] += 1
+
+    def _boucle(self):
+        while True:
+            _, _, tache = self._file.get()
+            if tache is None:
+                return
+            with self._verrou:
+                self._profondeur[tache.priorite] -= 1
+
+            # L'appelant a abandonné l'attente : ne pas envoyer le message en double
+            if tache.future.cancelled():
+                self._compter("annules")
+                continue
+
+            self._attendre_jeton()
+            if not tache.future.set_running_or_notify_cancel():
+                self._rendre_jeton()
+                self._compter("annules")
+                continue
+
+            if not self.disjoncteur.autoriser():
+                self._rendre_jeton()
+                self._compter("refus_disjoncteur")
+                tache.future.set_exception(CircuitOuvertError("Serveur SMTP indisponible (disjoncteur ouvert)"))
+                continue
+
+            try:
+                self.envoyer(tache.message)
+            except Exception as e:
+                self.disjoncteur.echec()
+                self._compter("echecs")
+                tache.future.set_exception(e)
+                continue
+
+            self.disjoncteur.succes()
+            duree = time.monotonic() - tache.date_soumission
+            with self._verrou:
+                self._compteurs["envoyes"] += 1
+                self._duree_totale += duree
+                self._derniere_duree = duree
+            tache.future.set_result(True)
+
+    def metriques(self) -> Dict:
+        """Profondeur des files, compteurs, durées d'attente et temps estimé pour vider la file"""
+        with self._verrou:
+            profondeur = {NOMS_PRIORITES[p]: n for p, n in self._profondeur.items()}
+            compteurs = dict(self._compteurs)
+            duree_moyenne = self._duree_totale / compteurs["envoyes"] if compteurs["envoyes"] else None
+            derniere_duree = self._derniere_duree
+        total = sum(profondeur.values())
+        with self._verrou_debit:
+            # Le seau le plus contraignant fixe le temps nécessaire pour vider la file
+            temps_vidage = max(max(total - seau.jetons, 0) / seau.debit for seau in self.seaux)
+        return {
+            "profondeur": profondeur,
+            "profondeur_totale": total,
+            "temps_vidage_estime_s": round(temps_vidage, 1),
+            "duree_moyenne_envoi_s": round(duree_moyenne, 3) if duree_moyenne is not None else None,
+            "derniere_duree_envoi_s": round(derniere_duree, 3) if derniere_duree is not None else None,
+            "jetons_minute": int(self.seaux[0].jetons),
+            "jetons_jour": int(self.seaux[1].jetons),
+            "disjoncteur": self.disjoncteur.etat,
+            "erreurs_quota_partage": self.quota_partage.erreurs if self.quota_partage else None,
+            **compteurs
+        }
@@ -0,0 +1,73 @@
+"""
+Regroupement des calculs concurrents identiques (single-flight)
+
+Quand plusieurs requêtes demandent en même temps la même donnée (par ex.
+les espaces d'une promotion, au début d'un cours), un seul calcul est
+exécuté : les appels suivants attendent son résultat au lieu de relancer
+la même requête SQL. Le calcul s'exécute dans le pool de threads, ce qui
+libère la boucle d'événements pendant l'accès à la base.
+
+Rien n'est conservé après la fin du calcul : ce n'est pas un cache, un
+appel arrivant après coup recalcule.
+"""
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+
+class SingleFlight:
+    """Exécute au plus un calcul à la fois par clé et partage son résultat"""
+
+    def __init__(self):
+        self._en_cours: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._verrou = threading.Lock()
+        self.appels = 0
+        self.executions = 0
+        self.regroupes = 0
+        self.erreurs = 0
+
+    async def executer(self, cle: Hashable, fonction: Callable[..., Any], *args: Any) -> Any:
+        """
+        Retourne fonction(*args), ou le résultat du calcul déjà en cours pour
+        cette clé. Une exception du calcul est transmise à tous les appelants.
+        """
+        # Les futures sont liées à une boucle d'événements
+        cle_interne = (id(asyncio.get_running_loop()), cle)
+        with self._verrou:
+            self.appels += 1
+            calcul = self._en_cours.get(cle_interne)
+            if calcul is not None:
+                self.regroupes += 1
+            else:
+                self.executions += 1
+                calcul = asyncio.ensure_future(run_in_threadpool(fonction, *args))
+                self._en_cours[cle_interne] = calcul
+                calcul.add_done_callback(lambda _: self._terminer(cle_interne, calcul))
+
+        # shield : l'annulation d'un appelant (client déconnecté) n'annule pas le calcul partagé
+        return await asyncio.shield(calcul)
+
+    def _terminer(self, cle_interne, calcul: asyncio.Future):
+        with self._verrou:
+            if self._en_cours.get(cle_interne) is calcul:
+                del self._en_cours[cle_interne]
+            if not calcul.cancelled() and calcul.exception() is not None:
+                self.erreurs += 1
+
+    def metriques(self) -> Dict[str, Any]:
+        with self._verrou:
+            return {
+                "appels": self.appels,
+                "executions": self.executions,
+                "regroupes": self.regroupes,
+                "erreurs": self.erreurs,
+                "en_cours": len(self._en_cours),
+                "taux_regroupement": round(self.regroupes / self.appels, 3) if self.appels else 0.0
+            }
+
+
+# Instance globale partagée par les routes
+single_flight = SingleFlight()
@@ -0,0 +1,163 @@
+"""
+Serveur SMTP local (asyncio) pour les tests de charge de l'envoi d'emails
+
+Remplace Gmail pendant les benchmarks : accepte les sessions EHLO/AUTH/MAIL/
+RCPT/DATA, conserve les messages reçus et peut injecter une latence et des
+pannes (réponse 451 temporaire ou coupure brutale de la connexion).
+
+Usage autonome :
+    python -m utils.smtp_local --port 1025 --latence 0.05 --taux-echec 0.02
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+from typing import List, Optional
+
+
+class ServeurSMTPLocal:
+    """Serveur SMTP minimal tournant dans sa propre boucle asyncio (thread dédié)"""
+
+    def __init__(self, hote: str = "127.0.0.1", port: int = 0,
+                 latence: float = 0.0, latence_connexion: float = 0.0,
+                 taux_echec: float = 0.0, taux_deconnexion: float = 0.0,
+                 graine: Optional[int] = None, conserver_messages: bool = True):
+        self.hote = hote
+        self.port = port
+        self.latence = latence                      # Secondes ajoutées à chaque message (DATA)
+        self.latence_connexion = latence_connexion  # Secondes ajoutées à l'accueil et à AUTH
+        self.taux_echec = taux_echec                # Part des messages refusés en 451
+        self.taux_deconnexion = taux_deconnexion    # Part des messages coupés sans réponse
+        self.conserver_messages = conserver_messages
+        self._aleatoire = random.Random(graine)
+        self.messages: List[bytes] = []
+        self.statistiques = {"connexions": 0, "messages_recus": 0, "echecs_injectes": 0, "deconnexions_injectees": 0}
+        self._boucle: Optional[asyncio.AbstractEventLoop] = None
+        self._serveur: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def _session(self, lecteur: asyncio.StreamReader, ecrivain: asyncio.StreamWriter):
+        self.statistiques["connexions"] += 1
+        try:
+            await asyncio.sleep(self.latence_connexion)
+            ecrivain.write(b"220 smtp-local ESMTP\r\n")
+            await ecrivain.drain()
+            while True:
+                ligne = await lecteur.readline()
+                if not ligne:
+                    return
+                commande = ligne[:4].upper()
+                if commande in (b"EHLO", b"HELO"):
+                    ecrivain.write(b"250-smtp-local\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif commande == b"AUTH":
+                    await asyncio.sleep(self.latence_connexion)
+                    ecrivain.write(b"235 2.7.0 Authentification reussie\r\n")
+                elif commande == b"DATA":
+                    ecrivain.write(b"354 Fin des donnees par <CRLF>.<CRLF>\r\n")
+                    await ecrivain.drain()
+                    if not await self._recevoir_message(lecteur, ecrivain):
+                        return
+                elif commande == b"QUIT":
+                    ecrivain.write(b"221 2.0.0 Au revoir\r\n")
+                    await ecrivain.drain()
+                    return
+                else:
+                    # MAIL, RCPT, RSET, NOOP
+                    ecrivain.write(b"250 2.0.0 OK\r\n")
+                await ecrivain.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            ecrivain.close()
+
+    async def _recevoir_message(self, lecteur: asyncio.StreamReader, ecrivain: asyncio.StreamWriter) -> bool:
+        """Lit le corps du message ; retourne False si la connexion a été coupée"""
+        lignes = []
+        while True:
+            ligne = await lecteur.readline()
+            if not ligne:
+                return False
+            if ligne == b".\r\n":
+                break
+            lignes.append(ligne)
+
+        await asyncio.sleep(self.latence)
+        tirage = self._aleatoire.random()
+        if tirage < self.taux_deconnexion:
+            self.statistiques["deconnexions_injectees"] += 1
+            ecrivain.transport.abort()
+            return False
+        if tirage < self.taux_deconnexion + self.taux_echec:
+            self.statistiques["echecs_injectes"] += 1
+            ecrivain.write(b"451 4.3.0 Erreur temporaire simulee\r\n")
+            return True
+
+        self.statistiques["messages_recus"] += 1
+        if self.conserver_messages:
+            self.messages.append(b"".join(lignes))
+        ecrivain.write(b"250 2.0.0 Message accepte\r\n")
+        return True
+
+    def demarrer(self) -> "ServeurSMTPLocal":
+        """Démarre le serveur dans un thread ; self.port contient le port réellement écouté"""
+        pret = threading.Event()
+        self._boucle = asyncio.new_event_loop()
+
+        async def ecouter():
+            self._serveur = await asyncio.start_server(self._session, self.hote, self.port)
+            self.port = self._serveur.sockets[0].getsockname()[1]
+            pret.set()
+            async with self._serveur:
+                await self._serveur.serve_forever()
+
+        def executer():
+            try:
+                self._boucle.run_until_complete(ecouter())
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=executer, name="smtp-local", daemon=True)
+        self._thread.start()
+        pret.wait(5)
+        return self
+
+    def arreter(self):
+        if self._boucle and self._serveur:
+            self._boucle.call_soon_threadsafe(self._serveur.close)
+        if self._thread:
+            self._thread.join(5)
+
+    def __enter__(self) -> "ServeurSMTPLocal":
+        return self.demarrer()
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur SMTP local pour les tests de charge")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latence", type=float, default=0.0, help="secondes par message")
+    parser.add_argument("--latence-connexion", type=float, default=0.0, help="secondes à l'accueil et à AUTH")
+    parser.add_argument("--taux-echec", type=float, default=0.0, help="part des messages refusés (451)")
+    parser.add_argument("--taux-deconnexion", type=float, default=0.0, help="part des messages coupés")
+    args = parser.parse_args()
+
+    serveur = ServeurSMTPLocal(
+        args.hote, args.port, args.latence, args.latence_connexion,
+        args.taux_echec, args.taux_deconnexion, conserver_messages=False
+    ).demarrer()
+    print(f"📮 Serveur SMTP local sur {serveur.hote}:{serveur.port} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   {serveur.statistiques}")
+    except KeyboardInterrupt:
+        serveur.arreter()
+
+
+if __name__ == "__main__":
+    main()
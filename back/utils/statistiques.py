@@ -0,0 +1,327 @@
+"""
+Statistiques de l'établissement (dashboard DE)
+
+Les compteurs sont stockés dans une ligne unique de la table statistiques,
+lue par clé primaire. Ils sont tenus à jour dans la transaction qui modifie
+les données :
+- les créations / suppressions / changements de statut faits par l'ORM sont
+  relevés avant chaque flush et appliqués en incréments au moment du commit ;
+- les insertions en masse (utils/insertion_masse.py) sont comptées à
+  partir de leurs paramètres ;
+- toute autre requête de modification sur une table suivie (update/delete en
+  masse, upsert) provoque un recalcul complet avant le commit.
+
+Les modifications faites hors session (SQL brut, autre application) ne sont
+pas vues : une réconciliation quotidienne recalcule les compteurs et corrige
+les écarts.
+
+La ligne est créée une fois au démarrage (initialiser_statistiques) : les
+transactions ne font que la mettre à jour. Chaque transaction qui modifie une
+table suivie verrouille cette ligne jusqu'à son commit, ces transactions
+sont donc sérialisées entre elles (les lectures ne sont pas bloquées).
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal
+from models import (
+    Formateur, Etudiant, Promotion, Formation, Assignation, Statistiques,
+    StatutEtudiantEnum, StatutAssignationEnum
+)
+from utils.insertion_masse import lignes_inserees
+from utils.synthese_notes import recalculer_synthese_notes
+
+ID_STATISTIQUES = "ETABLISSEMENT"
+HEURE_RECONCILIATION = 3  # Réconciliation quotidienne à 3h00 (heure locale du serveur)
+
+_CLE_DELTAS = "statistiques_deltas"
+_CLE_RECALCUL = "statistiques_a_recalculer"
+
+# Table suivie -> compteur du nombre total de lignes
+_TOTAUX = {
+    Formateur.__tablename__: "total_formateurs",
+    Etudiant.__tablename__: "total_etudiants",
+    Promotion.__tablename__: "total_promotions",
+    Formation.__tablename__: "total_formations",
+}
+
+# Table suivie -> (statut par défaut, compteur par valeur de statut)
+_PAR_STATUT = {
+    Etudiant.__tablename__: (StatutEtudiantEnum.ACTIF, {
+        StatutEtudiantEnum.ACTIF.value: "etudiants_actifs",
+        StatutEtudiantEnum.SUSPENDU.value: "etudiants_suspendus",
+        StatutEtudiantEnum.EXCLU.value: "etudiants_exclus",
+    }),
+    Assignation.__tablename__: (StatutAssignationEnum.ASSIGNE, {
+        StatutAssignationEnum.ASSIGNE.value: "assignations_assignees",
+        StatutAssignationEnum.EN_COURS.value: "assignations_en_cours",
+        StatutAssignationEnum.RENDU.value: "assignations_rendues",
+        StatutAssignationEnum.NOTE.value: "assignations_notees",
+    }),
+}
+
+TABLES_SUIVIES = set(_TOTAUX) | set(_PAR_STATUT)
+
+
+def _compter(modele, *conditions):
+    return select(func.count()).select_from(modele).where(*conditions).scalar_subquery()
+
+
+def calculer_statistiques_etablissement(db: Session) -> Dict[str, int]:
+    """Recalcule tous les compteurs depuis les tables, en une seule requête"""
+    colonnes = [_compter(Formateur).label("total_formateurs"),
+                _compter(Etudiant).label("total_etudiants"),
+                _compter(Promotion).label("total_promotions"),
+                _compter(Formation).label("total_formations")]
+    for modele in (Etudiant, Assignation):
+        for statut, compteur in _PAR_STATUT[modele.__tablename__][1].items():
+            colonnes.append(_compter(modele, modele.statut == statut).label(compteur))
+
+    return dict(db.execute(select(*colonnes)).one()._mapping)
+
+
+# ==================== MAINTENANCE INCRÉMENTALE ====================
+
+def _colonnes_ligne(nom_table: str, statut: Any):
+    """Compteurs concernés par une ligne de la table (total et statut)"""
+    if nom_table in _TOTAUX:
+        yield _TOTAUX[nom_table]
+    if nom_table in _PAR_STATUT:
+        defaut, colonnes = _PAR_STATUT[nom_table]
+        statut = defaut if statut is None else statut
+        yield colonnes[getattr(statut, "value", statut)]
+
+
+def _statut_enregistre(instance) -> Any:
+    """Statut tel qu'il est en base (avant une éventuelle modification non flushée)"""
+    historique = inspect(instance).attrs.statut.history
+    return historique.deleted[0] if historique.deleted else getattr(instance, "statut")
+
+
+def _deltas(session: Session) -> Counter:
+    return session.info.setdefault(_CLE_DELTAS, Counter())
+
+
+@event.listens_for(Session, "before_flush")
+def _relever_flush(session, contexte_flush, instances):
+    deltas = None
+    for instance, sens in [*((i, 1) for i in session.new), *((i, -1) for i in session.deleted)]:
+        nom_table = getattr(getattr(instance, "__table__", None), "name", None)
+        if nom_table not in TABLES_SUIVIES:
+            continue
+        deltas = deltas if deltas is not None else _deltas(session)
+        statut = None
+        if nom_table in _PAR_STATUT:
+            statut = instance.statut if sens > 0 else _statut_enregistre(instance)
+        for colonne in _colonnes_ligne(nom_table, statut):
+            deltas[colonne] += sens
+
+    for instance in session.dirty:
+        nom_table = getattr(getattr(instance, "__table__", None), "name", None)
+        if nom_table not in _PAR_STATUT:
+            continue
+        historique = inspect(instance).attrs.statut.history
+        if not historique.added:
+            continue
+        if not historique.deleted:
+            # Ancienne valeur non chargée : impossible de savoir quel compteur décrémenter
+            session.info[_CLE_RECALCUL] = True
+            continue
+        deltas = deltas if deltas is not None else _deltas(session)
+        _, colonnes = _PAR_STATUT[nom_table]
+        ancien, nouveau = historique.deleted[0], historique.added[0]
+        deltas[colonnes[getattr(ancien, "value", ancien)]] -= 1
+        deltas[colonnes[getattr(nouveau, "value", nouveau)]] += 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _relever_execution(etat):
+    if not (etat.is_insert or etat.is_update or etat.is_delete):
+        return
+    table = getattr(etat.statement, "table", None)
+    if table is None or table.name not in TABLES_SUIVIES:
+        return
+
+    # Insertion en masse : chaque ligne est comptée ; les autres requêtes ne
+    # disent pas combien de lignes seront réellement modifiées
+    lignes = lignes_inserees(etat)
+    if lignes is None:
+        etat.session.info[_CLE_RECALCUL] = True
+        return
+
+    deltas = _deltas(etat.session)
+    for ligne in lignes:
+        for colonne in _colonnes_ligne(table.name, ligne.get("statut")):
+            deltas[colonne] += 1
+
+
+@event.listens_for(Session, "before_commit")
+def _appliquer_deltas(session):
+    session.flush()
+    deltas = session.info.pop(_CLE_DELTAS, None)
+    if session.info.pop(_CLE_RECALCUL, False):
+        # Ligne verrouillée avant le comptage : deux recalculs concurrents ne
+        # peuvent pas écrire des compteurs comptés l'un sans l'autre
+        ligne = session.get(Statistiques, ID_STATISTIQUES, with_for_update=True)
+        if ligne is not None:
+            _ecrire_statistiques(ligne, calculer_statistiques_etablissement(session))
+        return
+
+    increments = {colonne: delta for colonne, delta in (deltas or {}).items() if delta}
+    if not increments:
+        return
+    # Sans ligne (initialiser_statistiques pas encore appelé) rien n'est mis à jour :
+    # la ligne sera créée à partir des tables, cette transaction comprise
+    session.execute(
+        update(Statistiques)
+        .where(Statistiques.id_statistiques == ID_STATISTIQUES)
+        .values(
+            date_mise_a_jour=datetime.utcnow(),
+            **{colonne: getattr(Statistiques, colonne) + delta for colonne, delta in increments.items()}
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier_deltas(session):
+    session.info.pop(_CLE_DELTAS, None)
+    session.info.pop(_CLE_RECALCUL, None)
+
+
+def _ecrire_statistiques(ligne: Statistiques, valeurs: Dict[str, int], reconciliation: bool = False):
+    maintenant = datetime.utcnow()
+    for colonne, valeur in valeurs.items():
+        setattr(ligne, colonne, valeur)
+    ligne.date_mise_a_jour = maintenant
+    if reconciliation:
+        ligne.date_reconciliation = maintenant
+
+
+def initialiser_statistiques(db: Session):
+    """
+    Crée la ligne des compteurs à partir des tables si elle n'existe pas encore
+    (au démarrage de l'application). Si un autre processus l'a créée entre-temps,
+    sa ligne est conservée.
+    """
+    if db.get(Statistiques, ID_STATISTIQUES) is not None:
+        return
+    valeurs = calculer_statistiques_etablissement(db)
+    try:
+        with db.begin_nested():
+            db.add(Statistiques(id_statistiques=ID_STATISTIQUES, date_mise_a_jour=datetime.utcnow(), **valeurs))
+    except IntegrityError:
+        pass
+    db.commit()
+
+
+# ==================== LECTURE ET RÉCONCILIATION ====================
+
+def _en_dict(ligne: Statistiques) -> Dict[str, Any]:
+    return {
+        "total_formateurs": ligne.total_formateurs,
+        "total_etudiants": ligne.total_etudiants,
+        "total_promotions": ligne.total_promotions,
+        "total_formations": ligne.total_formations,
+        "etudiants_actifs": ligne.etudiants_actifs,
+        "etudiants_suspendus": ligne.etudiants_suspendus,
+        "etudiants_exclus": ligne.etudiants_exclus,
+        "assignations_par_statut": {
+            statut: getattr(ligne, colonne)
+            for statut, colonne in _PAR_STATUT[Assignation.__tablename__][1].items()
+        },
+        "date_mise_a_jour": ligne.date_mise_a_jour.isoformat()
+    }
+
+
+def lire_statistiques(db: Session) -> Dict[str, Any]:
+    """Compteurs de l'établissement (lecture par clé primaire)"""
+    ligne = db.get(Statistiques, ID_STATISTIQUES)
+    if ligne is None:
+        initialiser_statistiques(db)
+        ligne = db.get(Statistiques, ID_STATISTIQUES)
+    return _en_dict(ligne)
+
+
+def reconcilier_statistiques(db: Session) -> Dict[str, int]:
+    """
+    Recalcule les compteurs depuis les tables et corrige la ligne stockée.
+    Retourne les écarts corrigés (valeur recalculée - valeur stockée).
+    """
+    initialiser_statistiques(db)
+    # Ligne verrouillée avant le comptage : aucun incrément ne peut s'intercaler
+    ligne = db.get(Statistiques, ID_STATISTIQUES, with_for_update=True)
+    valeurs = calculer_statistiques_etablissement(db)
+    ecarts = {colonne: valeur - getattr(ligne, colonne) for colonne, valeur in valeurs.items()}
+    _ecrire_statistiques(ligne, valeurs, reconciliation=True)
+    db.commit()
+    return {colonne: ecart for colonne, ecart in ecarts.items() if ecart}
+
+
+def prochaine_reconciliation(maintenant: datetime) -> datetime:
+    """Prochaine échéance de la réconciliation quotidienne"""
+    echeance = maintenant.replace(hour=HEURE_RECONCILIATION, minute=0, second=0, microsecond=0)
+    return echeance if echeance > maintenant else echeance + timedelta(days=1)
+
+
+class ReconciliationStatistiquesWorker:
+    """
+    Thread d'arrière-plan : réconciliation au démarrage puis chaque nuit
+    (compteurs de l'établissement et synthèse des notes)
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self._arret = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def demarrer(self):
+        """Crée la ligne des compteurs avant les premières requêtes, puis démarre le worker s'il ne tourne pas déjà"""
+        if self._thread and self._thread.is_alive():
+            return
+        db = self.session_factory()
+        try:
+            initialiser_statistiques(db)
+        finally:
+            db.close()
+        self._arret.clear()
+        self._thread = threading.Thread(target=self._boucle, name="reconciliation-statistiques", daemon=True)
+        self._thread.start()
+
+    def arreter(self, timeout: float = 10):
+        self._arret.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def reconcilier(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            ecarts = reconcilier_statistiques(db)
+            if ecarts:
+                print(f"Statistiques réconciliées, écarts corrigés: {ecarts}")
+            recalculer_synthese_notes(db)
+            db.commit()
+            return ecarts
+        except Exception as e:
+            db.rollback()
+            print(f"Erreur de réconciliation des statistiques: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            self.reconcilier()
+            maintenant = datetime.now()
+            self._arret.wait((prochaine_reconciliation(maintenant) - maintenant).total_seconds())
+
+
+# Instance globale du worker
+reconciliation_statistiques_worker = ReconciliationStatistiquesWorker()
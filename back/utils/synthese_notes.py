@@ -0,0 +1,321 @@
+"""
+Synthèse des notes par étudiant et par espace pédagogique
+
+La table synthese_notes contient, pour chaque couple (étudiant, espace) :
+le nombre de notes, la somme des notes ramenées sur 20 (note / note_max * 20)
+et la note de la livraison notée la plus récente. Un travail ne compte
+qu'une fois : seule la dernière livraison notée de chaque assignation est
+retenue (une livraison corrigée puis renotée remplace la précédente). Les
+moyennes se lisent sans parcourir les livraisons.
+
+Chaque note attribuée, modifiée ou retirée (Livraison.note_attribuee) est
+relevée avant le flush et appliquée au commit, dans la même transaction,
+par un upsert incrémental (nombre + 1, somme + note...) quand la livraison
+est la seule notée de son assignation. Sinon, ou si l'ancienne valeur d'une
+note n'est pas connue ou si une note est retirée, le couple concerné est
+recalculé ; une modification en masse des livraisons provoque un recalcul
+complet.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import case, delete, desc, event, func, inspect, or_, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Assignation, Livraison, SyntheseNotes, Travail
+from utils.insertion_masse import lignes_inserees
+
+NOTE_REFERENCE = Decimal("20")
+
+_CLE_DELTAS = "synthese_notes_deltas"
+_CLE_A_RECALCULER = "synthese_notes_a_recalculer"
+_CLE_ASSIGNATIONS = "synthese_notes_assignations"
+_TOUT = "*"
+
+
+def normaliser_note(note: Decimal, note_max: Decimal) -> Decimal:
+    """Note ramenée sur 20"""
+    return Decimal(note) * NOTE_REFERENCE / Decimal(note_max)
+
+
+# ==================== RELEVÉ DES NOTES ====================
+
+class _Delta:
+    __slots__ = ("nombre", "somme", "derniere")
+
+    def __init__(self):
+        self.nombre = 0
+        self.somme = Decimal("0")
+        self.derniere: Optional[Tuple[Decimal, Decimal, datetime]] = None
+
+    def ajouter(self, note: Decimal, note_max: Decimal, date_livraison: datetime, sens: int):
+        self.nombre += sens
+        self.somme += sens * normaliser_note(note, note_max)
+        if sens > 0 and (self.derniere is None or date_livraison >= self.derniere[2]):
+            self.derniere = (note, note_max, date_livraison)
+
+
+def _contexte_livraison(session: Session, livraison: Livraison) -> Optional[Tuple[str, str, Decimal]]:
+    """(id_etudiant, id_espace, note_max) de la livraison"""
+    assignation = session.get(Assignation, livraison.id_assignation)
+    travail = session.get(Travail, assignation.id_travail) if assignation is not None else None
+    if travail is None:
+        return None
+    return assignation.id_etudiant, travail.id_espace, travail.note_max
+
+
+def _autre_livraison_notee(session: Session, livraison: Livraison) -> bool:
+    """
+    Vrai si l'assignation a (ou a pu avoir dans la transaction) une autre
+    livraison notée : la note retenue pour l'assignation n'est alors pas
+    forcément celle-ci
+    """
+    assignations = session.info.setdefault(_CLE_ASSIGNATIONS, set())
+    if livraison.id_assignation in assignations:
+        return True
+    assignations.add(livraison.id_assignation)
+    return session.query(Livraison.id_livraison).filter(
+        Livraison.id_assignation == livraison.id_assignation,
+        Livraison.id_livraison != livraison.id_livraison,
+        Livraison.note_attribuee.isnot(None)
+    ).first() is not None
+
+
+@event.listens_for(Session, "before_flush")
+def _relever_notes(session, contexte_flush, instances):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(instance, Livraison):
+            continue
+        historique = inspect(instance).attrs.note_attribuee.history
+        if instance in session.new:
+            ancienne, nouvelle = None, instance.note_attribuee
+        elif instance in session.deleted:
+            ancienne, nouvelle = (historique.deleted[0] if historique.deleted else instance.note_attribuee), None
+        elif historique.added:
+            # Ancienne note non chargée : inconnue
+            ancienne = historique.deleted[0] if historique.deleted else _TOUT
+            nouvelle = historique.added[0]
+        else:
+            continue
+        if ancienne is None and nouvelle is None:
+            continue
+
+        contexte = _contexte_livraison(session, instance)
+        if contexte is None:
+            session.info.setdefault(_CLE_A_RECALCULER, set()).add(_TOUT)
+            continue
+        id_etudiant, id_espace, note_max = contexte
+        if ancienne is _TOUT or nouvelle is None or _autre_livraison_notee(session, instance):
+            # Ancienne note inconnue, note retirée (la dernière note peut changer) ou
+            # autre livraison notée pour l'assignation : le couple est recalculé au commit
+            session.info.setdefault(_CLE_A_RECALCULER, set()).add((id_etudiant, id_espace))
+            continue
+        delta = session.info.setdefault(_CLE_DELTAS, {}).setdefault((id_etudiant, id_espace), _Delta())
+        date_livraison = instance.date_livraison or datetime.utcnow()
+        if ancienne is not None:
+            delta.ajouter(ancienne, note_max, date_livraison, -1)
+        delta.ajouter(nouvelle, note_max, date_livraison, 1)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _relever_execution(etat):
+    if not (etat.is_insert or etat.is_update or etat.is_delete):
+        return
+    table = getattr(etat.statement, "table", None)
+    if table is None or table.name != Livraison.__tablename__:
+        return
+    # Livraisons insérées en masse sans note : la synthèse ne change pas
+    lignes = lignes_inserees(etat)
+    if lignes is not None and all(ligne.get("note_attribuee") is None for ligne in lignes):
+        return
+    etat.session.info.setdefault(_CLE_A_RECALCULER, set()).add(_TOUT)
+
+
+@event.listens_for(Session, "before_commit")
+def _appliquer_notes(session):
+    session.flush()
+    deltas = session.info.pop(_CLE_DELTAS, None) or {}
+    a_recalculer = session.info.pop(_CLE_A_RECALCULER, None) or set()
+    session.info.pop(_CLE_ASSIGNATIONS, None)
+
+    if _TOUT in a_recalculer:
+        recalculer_synthese_notes(session)
+        return
+    for (id_etudiant, id_espace), delta in deltas.items():
+        if (id_etudiant, id_espace) not in a_recalculer:
+            _appliquer_delta(session, id_etudiant, id_espace, delta)
+    for id_etudiant, id_espace in a_recalculer:
+        recalculer_synthese_notes(session, id_etudiant=id_etudiant, id_espace=id_espace)
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier_notes(session):
+    session.info.pop(_CLE_DELTAS, None)
+    session.info.pop(_CLE_A_RECALCULER, None)
+    session.info.pop(_CLE_ASSIGNATIONS, None)
+
+
+# ==================== ÉCRITURE ====================
+
+def _si_plus_recente(colonne, nouvelle_valeur, nouvelle_date):
+    """Garde la valeur de la livraison notée la plus récente"""
+    return case(
+        (or_(SyntheseNotes.date_derniere_note.is_(None), nouvelle_date >= SyntheseNotes.date_derniere_note),
+         nouvelle_valeur),
+        else_=colonne
+    )
+
+
+def _appliquer_delta(db: Session, id_etudiant: str, id_espace: str, delta: _Delta):
+    """Upsert incrémental d'un couple (étudiant, espace)"""
+    if delta.nombre == 0 and delta.somme == 0 and delta.derniere is None:
+        return
+    table = SyntheseNotes.__table__
+    valeurs = {
+        "id_etudiant": id_etudiant,
+        "id_espace": id_espace,
+        "nombre_notes": delta.nombre,
+        "somme_notes": delta.somme,
+        "date_mise_a_jour": datetime.utcnow()
+    }
+    if delta.derniere is not None:
+        valeurs.update(derniere_note=delta.derniere[0], derniere_note_max=delta.derniere[1],
+                       date_derniere_note=delta.derniere[2])
+
+    def mises_a_jour(nouvelles):
+        colonnes = {
+            "nombre_notes": table.c.nombre_notes + nouvelles.nombre_notes,
+            "somme_notes": table.c.somme_notes + nouvelles.somme_notes,
+            "date_mise_a_jour": nouvelles.date_mise_a_jour
+        }
+        if delta.derniere is not None:
+            for nom in ("derniere_note", "derniere_note_max", "date_derniere_note"):
+                colonnes[nom] = _si_plus_recente(table.c[nom], nouvelles[nom], nouvelles.date_derniere_note)
+        return colonnes
+
+    dialecte = db.get_bind().dialect.name
+    if dialecte == "mysql":
+        requete = mysql.insert(table).values(**valeurs)
+        db.execute(requete.on_duplicate_key_update(**mises_a_jour(requete.inserted)))
+    elif dialecte in ("sqlite", "postgresql"):
+        module = sqlite if dialecte == "sqlite" else postgresql
+        requete = module.insert(table).values(**valeurs)
+        db.execute(requete.on_conflict_do_update(
+            index_elements=["id_etudiant", "id_espace"], set_=mises_a_jour(requete.excluded)
+        ))
+    else:
+        colonnes = {nom: valeur for nom, valeur in valeurs.items() if nom not in ("id_etudiant", "id_espace")}
+        resultat = db.execute(
+            update(SyntheseNotes)
+            .where(SyntheseNotes.id_etudiant == id_etudiant, SyntheseNotes.id_espace == id_espace)
+            .values(**mises_a_jour(_Valeurs(colonnes)))
+            .execution_options(synchronize_session=False)
+        )
+        if resultat.rowcount == 0:
+            db.execute(table.insert().values(**valeurs))
+
+
+class _Valeurs(dict):
+    """Accès par attribut aux valeurs d'une mise à jour (dialectes sans upsert)"""
+    __getattr__ = dict.__getitem__
+
+
+def recalculer_synthese_notes(db: Session, id_etudiant: Optional[str] = None,
+                              id_espace: Optional[str] = None) -> int:
+    """
+    Recalcule la synthèse depuis les livraisons (tout, ou un étudiant / un
+    couple étudiant-espace). La transaction n'est pas validée ici.
+    Retourne le nombre de lignes écrites.
+    """
+    filtres = [Livraison.note_attribuee.isnot(None)]
+    if id_etudiant is not None:
+        filtres.append(Assignation.id_etudiant == id_etudiant)
+    if id_espace is not None:
+        filtres.append(Travail.id_espace == id_espace)
+
+    # Dernière livraison notée de chaque assignation
+    livraisons = select(
+        Assignation.id_etudiant,
+        Travail.id_espace,
+        Livraison.id_livraison,
+        Livraison.note_attribuee,
+        Travail.note_max,
+        Livraison.date_livraison,
+        func.row_number().over(
+            partition_by=Livraison.id_assignation,
+            order_by=(desc(Livraison.date_livraison), desc(Livraison.id_livraison))
+        ).label("rang_assignation")
+    ).join(
+        Assignation, Assignation.id_assignation == Livraison.id_assignation
+    ).join(
+        Travail, Travail.id_travail == Assignation.id_travail
+    ).where(*filtres).subquery()
+
+    couple = (livraisons.c.id_etudiant, livraisons.c.id_espace)
+    notes = select(
+        livraisons.c.id_etudiant,
+        livraisons.c.id_espace,
+        livraisons.c.note_attribuee,
+        livraisons.c.note_max,
+        livraisons.c.date_livraison,
+        func.count().over(partition_by=couple).label("nombre"),
+        func.sum(livraisons.c.note_attribuee * NOTE_REFERENCE / livraisons.c.note_max).over(
+            partition_by=couple
+        ).label("somme"),
+        func.row_number().over(
+            partition_by=couple,
+            order_by=(desc(livraisons.c.date_livraison), desc(livraisons.c.id_livraison))
+        ).label("rang")
+    ).where(livraisons.c.rang_assignation == 1).subquery()
+
+    lignes = db.execute(select(notes).where(notes.c.rang == 1)).all()
+
+    suppression = delete(SyntheseNotes)
+    if id_etudiant is not None:
+        suppression = suppression.where(SyntheseNotes.id_etudiant == id_etudiant)
+    if id_espace is not None:
+        suppression = suppression.where(SyntheseNotes.id_espace == id_espace)
+    db.execute(suppression.execution_options(synchronize_session=False))
+
+    maintenant = datetime.utcnow()
+    if lignes:
+        db.execute(SyntheseNotes.__table__.insert(), [
+            {
+                "id_etudiant": ligne.id_etudiant,
+                "id_espace": ligne.id_espace,
+                "nombre_notes": ligne.nombre,
+                "somme_notes": ligne.somme,
+                "derniere_note": ligne.note_attribuee,
+                "derniere_note_max": ligne.note_max,
+                "date_derniere_note": ligne.date_livraison,
+                "date_mise_a_jour": maintenant
+            } for ligne in lignes
+        ])
+    return len(lignes)
+
+
+# ==================== LECTURE ====================
+
+def lire_synthese_etudiant(db: Session, id_etudiant: str) -> Dict[str, Dict[str, Any]]:
+    """Synthèse des notes de l'étudiant par espace (lecture par clé primaire)"""
+    lignes = db.query(SyntheseNotes).filter(SyntheseNotes.id_etudiant == id_etudiant).all()
+    return {
+        ligne.id_espace: {
+            "nombre_notes": ligne.nombre_notes,
+            "somme_notes": float(ligne.somme_notes),
+            "moyenne": round(float(ligne.somme_notes) / ligne.nombre_notes, 2) if ligne.nombre_notes else None,
+            "derniere_note": float(ligne.derniere_note) if ligne.derniere_note is not None else None,
+            "derniere_note_max": float(ligne.derniere_note_max) if ligne.derniere_note_max is not None else None
+        } for ligne in lignes
+    }
+
+
+def moyenne_generale(synthese: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    """Moyenne sur 20 de toutes les notes de l'étudiant, tous espaces confondus"""
+    nombre = sum(espace["nombre_notes"] for espace in synthese.values())
+    if not nombre:
+        return None
+    return round(sum(espace["somme_notes"] for espace in synthese.values()) / nombre, 2)